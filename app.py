@@ -36,7 +36,15 @@ def initialize_app():
         
         # Create user manager instance
         user_manager = UserManager()
-        
+
+        # Start sending notifications left pending by a previous deploy or
+        # restart now, rather than when the first webhook reaches this worker
+        try:
+            from services.outbox_service import get_outbox_drainer
+            get_outbox_drainer()
+        except Exception as e:
+            logging.error(f"Failed to start the outbox drainer: {e}")
+
         logging.info("Application initialized successfully")
         return True
         
@@ -74,6 +82,12 @@ try:
 except ImportError as e:
     logging.error(f"Failed to import admin_routes: {e}")
 
+try:
+    from routes.metrics_routes import metrics_bp
+    app.register_blueprint(metrics_bp)
+except ImportError as e:
+    logging.error(f"Failed to import metrics_routes: {e}")
+
 try:
     from routes.auth_routes import auth_bp
     app.register_blueprint(auth_bp)
@@ -123,7 +137,8 @@ def health_check():
         return {
             'status': 'healthy',
             'database': 'connected',
-            'users': user_count
+            'users': user_count,
+            'db_pool': user_manager.db_config.pool_stats()
         }, 200
     except Exception as e:
         return {
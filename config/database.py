@@ -1,30 +1,303 @@
 import os
+import time
+import threading
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
 import logging
+from collections import deque
 from urllib.parse import urlparse
+from utils.metrics import DB_POOL_CHECKOUT_FAILURES, DB_POOL_CONNECTIONS, DB_POOL_WAIT_SECONDS
+
+try:
+    # Size the pool from the same settings gunicorn uses for its gthread workers
+    from gunicorn_config import threads as GUNICORN_THREADS, workers as GUNICORN_WORKERS
+except ImportError:
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 1))
+    GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', 1))
+
+# Connections the background threads inside each worker can hold at once:
+# one per pipeline match/deliver thread (services/lead_pipeline.py), plus the
+# dedup stage, outbox drainer, ingest log writer, OpenAI usage writer and one
+# shared by the periodic jobs (message_cache cleanup, ingest log partitions)
+DB_POOL_BACKGROUND_SLOTS = int(os.environ.get(
+    'DB_POOL_BACKGROUND_SLOTS',
+    int(os.environ.get('PIPELINE_MATCH_WORKERS', 2)) + int(os.environ.get('PIPELINE_DELIVER_WORKERS', 2)) + 5
+))
+# Each gunicorn worker gets its own pool: one connection per request thread plus
+# the background slots, so background work never starves requests. With the
+# defaults that is 1 + 9 = 10 per worker, i.e. GUNICORN_WORKERS x 10 = 40
+# connections per instance; keep that total under Postgres max_connections
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', GUNICORN_THREADS + DB_POOL_BACKGROUND_SLOTS))
+# Seconds a thread waits for a free connection before the checkout fails
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Connections older than this are closed and replaced (seconds)
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', 1800))
+# Idle connections are pinged with SELECT 1 on checkout after this many seconds
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 30))
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class PooledConnection:
+    """
+    A connection checked out of the pool.
+
+    Used as a context manager it behaves like a psycopg2 connection block
+    (commit on success, rollback on error) and then hands the connection
+    back to the pool instead of leaving it open.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if not self._conn.closed:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        except psycopg2.Error as e:
+            logging.warning(f"Error finishing pooled transaction: {e}")
+        finally:
+            self.close()
+        return False
+
+    def close(self):
+        """Return the connection to the pool"""
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+class ConnectionPool:
+    """Thread-safe PostgreSQL connection pool with health checks and recycling"""
+
+    def __init__(self, dsn, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, max_age=DB_POOL_MAX_AGE, ping_after=DB_POOL_PING_AFTER):
+        self.dsn = dsn
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.max_age = max_age
+        self.ping_after = ping_after
+
+        self._lock = threading.Condition(threading.Lock())
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._created_at = {}  # id(conn) -> creation time for checked-out connections
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+
+        # Gauges/counters reported by stats()
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._recycled = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._last_wait = 0.0
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn)
+
+    def _is_usable(self, conn, created_at, last_used):
+        """Check a connection before handing it out"""
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if now - created_at > self.max_age:
+            self._recycled += 1
+            return False
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if now - last_used > self.ping_after:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _publish(self):
+        """Update the Prometheus pool gauges (call with the lock held)"""
+        DB_POOL_CONNECTIONS.labels(state='in_use').set(self._in_use)
+        DB_POOL_CONNECTIONS.labels(state='idle').set(len(self._idle))
+        DB_POOL_CONNECTIONS.labels(state='waiting').set(self._waiting)
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Check a connection out of the pool, blocking up to `timeout` seconds"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        with self._lock:
+            while True:
+                if self._idle:
+                    conn, created_at, last_used = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._in_use += 1
+                    conn = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._checkout_failures += 1
+                    DB_POOL_CHECKOUT_FAILURES.inc()
+                    raise PoolTimeout(
+                        f"Timed out after {self.timeout}s waiting for a database connection "
+                        f"(pool size {self._size}, in use {self._in_use})"
+                    )
+                self._waiting += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        # Health check / connect outside the lock so other threads are not blocked
+        try:
+            if conn is not None and not self._is_usable(conn, created_at, last_used):
+                self._close_quietly(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+                created_at = time.monotonic()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._in_use -= 1
+                self._checkout_failures += 1
+                DB_POOL_CHECKOUT_FAILURES.inc()
+                self._publish()
+                self._lock.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._created_at[id(conn)] = created_at
+            self._checkouts += 1
+            self._wait_total += waited
+            self._last_wait = waited
+            self._wait_max = max(self._wait_max, waited)
+            self._publish()
+        DB_POOL_WAIT_SECONDS.observe(waited)
+
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding it if it is broken"""
+        with self._lock:
+            created_at = self._created_at.pop(id(conn), time.monotonic())
+
+        keep = not conn.closed
+        if keep and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                keep = False
+
+        with self._lock:
+            self._in_use -= 1
+            if keep:
+                self._idle.append((conn, created_at, time.monotonic()))
+            else:
+                self._size -= 1
+                self._discarded += 1
+            self._publish()
+            self._lock.notify()
+
+        if not keep:
+            self._close_quietly(conn)
+
+    def close_all(self):
+        """Close every idle connection (checked-out connections close on release)"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """Snapshot of pool gauges and counters"""
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'checkout_failures': self._checkout_failures,
+                'recycled': self._recycled,
+                'discarded': self._discarded,
+                'wait_seconds_total': round(self._wait_total, 6),
+                'wait_seconds_max': round(self._wait_max, 6),
+                'wait_seconds_last': round(self._last_wait, 6)
+            }
+
 
 class DatabaseConfig:
     """Database configuration and connection management"""
-    
+
     def __init__(self):
         self.database_url = os.getenv('DATABASE_URL')
         if not self.database_url:
             raise ValueError("DATABASE_URL environment variable is required")
-        
+
         # Parse the database URL
         self.parsed_url = urlparse(self.database_url)
-        
+
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        """Connection pool for the current process (recreated after fork)"""
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != pid:
+                    # Connections inherited from a parent process must not be reused
+                    self._pool = ConnectionPool(self.database_url)
+                    self._pool_pid = pid
+                    logging.info(
+                        f"Created database connection pool (max {self._pool.max_size}) for pid {pid}; "
+                        f"up to {self._pool.max_size * GUNICORN_WORKERS} connections across {GUNICORN_WORKERS} workers"
+                    )
+        return self._pool
+
     def get_connection(self):
-        """Get a database connection"""
+        """Get a pooled database connection"""
         try:
-            # Use the full DATABASE_URL for connection
-            conn = psycopg2.connect(self.database_url)
-            return conn
+            return self.pool.acquire()
         except psycopg2.Error as e:
             logging.error(f"Database connection failed: {e}")
             raise
-    
+
+    def pool_stats(self):
+        """Return connection pool gauges for this worker"""
+        return self.pool.stats()
+
     def test_connection(self):
         """Test database connectivity"""
         try:
@@ -80,7 +80,10 @@ def create_tables():
                     ("idx_users_number", "CREATE INDEX IF NOT EXISTS idx_users_number ON users(number);"),
                     ("idx_users_stripe_customer", "CREATE INDEX IF NOT EXISTS idx_users_stripe_customer ON users(stripe_customer_id);"),
                     ("idx_users_active", "CREATE INDEX IF NOT EXISTS idx_users_active ON users(active);"),
-                    ("idx_users_created_at", "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at);")
+                    ("idx_users_created_at", "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at);"),
+                    # Keyset pagination on (created_at, user_id), newest first
+                    ("idx_users_created_at_user_id", "CREATE INDEX IF NOT EXISTS idx_users_created_at_user_id ON users(created_at DESC, user_id DESC);"),
+                    ("idx_users_active_created_at_user_id", "CREATE INDEX IF NOT EXISTS idx_users_active_created_at_user_id ON users(created_at DESC, user_id DESC) WHERE active = TRUE;")
                 ]
                 
                 for index_name, index_sql in indexes_to_create:
@@ -101,9 +104,86 @@ def create_tables():
                 );
                 """
                 cursor.execute(create_message_cache_table)
+                # Memoized OpenAI verdicts/extractions shared by every worker
+                cursor.execute("""
+                    ALTER TABLE message_cache
+                        ADD COLUMN IF NOT EXISTS kind VARCHAR(16),
+                        ADD COLUMN IF NOT EXISTS payload JSONB,
+                        ADD COLUMN IF NOT EXISTS hits INTEGER NOT NULL DEFAULT 0,
+                        ADD COLUMN IF NOT EXISTS last_hit_at TIMESTAMP WITH TIME ZONE;
+                """)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_cache_created_at ON message_cache(created_at);")
                 conn.commit()
                 logging.info("Message cache table created/verified")
                 
+                # Durable outbox of WhatsApp notifications, drained by every worker
+                create_outbox_table = """
+                CREATE TABLE IF NOT EXISTS notification_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    idempotency_key VARCHAR(64) UNIQUE NOT NULL,
+                    to_number VARCHAR(20) NOT NULL,
+                    body TEXT NOT NULL,
+                    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    locked_until TIMESTAMP WITH TIME ZONE,
+                    last_error TEXT,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    sent_at TIMESTAMP WITH TIME ZONE
+                );
+                """
+                cursor.execute(create_outbox_table)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+                    ON notification_outbox(next_attempt_at)
+                    WHERE status IN ('pending', 'sending');
+                """)
+                conn.commit()
+                logging.info("Notification outbox table created/verified")
+                
+                # Inbound message log, one partition per UTC day (created by IngestLogManager)
+                create_ingest_log_table = """
+                CREATE TABLE IF NOT EXISTS message_ingest_log (
+                    id BIGSERIAL,
+                    received_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                    message_id VARCHAR(128),
+                    group_id VARCHAR(64),
+                    sender VARCHAR(64),
+                    message_type VARCHAR(32),
+                    content_hash VARCHAR(64),
+                    content TEXT,
+                    outcome VARCHAR(32) NOT NULL,
+                    matched_count INTEGER,
+                    detail JSONB,
+                    PRIMARY KEY (id, received_at)
+                ) PARTITION BY RANGE (received_at);
+                """
+                cursor.execute(create_ingest_log_table)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_ingest_log_group ON message_ingest_log(group_id, received_at);")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_ingest_log_hash ON message_ingest_log(content_hash);")
+                conn.commit()
+                logging.info("Message ingest log table created/verified")
+                
+                # OpenAI token usage and spend, aggregated per day/model/user/group
+                create_usage_table = """
+                CREATE TABLE IF NOT EXISTS openai_usage_daily (
+                    day DATE NOT NULL,
+                    model VARCHAR(64) NOT NULL,
+                    operation VARCHAR(32) NOT NULL,
+                    user_id VARCHAR(36) NOT NULL DEFAULT '',
+                    group_id VARCHAR(64) NOT NULL DEFAULT '',
+                    requests INTEGER NOT NULL DEFAULT 0,
+                    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+                    completion_tokens BIGINT NOT NULL DEFAULT 0,
+                    cost_usd NUMERIC(12, 6) NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (day, model, operation, user_id, group_id)
+                );
+                """
+                cursor.execute(create_usage_table)
+                conn.commit()
+                logging.info("OpenAI usage table created/verified")
+                
                 # Auto-cleanup old cache entries function
                 create_cleanup_function = """
                 CREATE OR REPLACE FUNCTION cleanup_old_messages()
@@ -5,8 +5,47 @@ workers = int(os.environ.get('GUNICORN_WORKERS', 4))
 threads = int(os.environ.get('GUNICORN_THREADS', 1))
 timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
 bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
-worker_class = "gthread"
+# "gthread" (default) or "gevent" for I/O-bound fan-out: each gevent worker
+# serves up to worker_connections requests/outbound calls concurrently.
+# gevent is opt-in; see scripts/bench_worker_modes.py for what has been measured
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
 worker_tmp_dir = "/dev/shm"  # Use memory for temporary files
 accesslog = "-"  # Log to stdout
 errorlog = "-"   # Log errors to stdout
 loglevel = "info"
+# Workers write Prometheus metrics here so /metrics can aggregate them (utils/metrics.py)
+prometheus_multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR', '/dev/shm/prometheus')
+
+if worker_class == 'gevent':
+    # Greenlets make concurrency cheap, so let the outbound clients use it.
+    # Postgres connections stay scarce: greenlets queue on the pool instead.
+    # 20 per worker (80 per instance with 4 workers) rather than one per
+    # pipeline greenlet, with a longer wait before a checkout gives up.
+    os.environ.setdefault('DB_POOL_MAX_SIZE', '20')
+    os.environ.setdefault('DB_POOL_TIMEOUT', '30')
+    os.environ.setdefault('OPENAI_MAX_CONCURRENCY', '32')
+    os.environ.setdefault('WHAPI_POOL_SIZE', '100')
+    os.environ.setdefault('WHAPI_BULK_CONCURRENCY', '100')
+    os.environ.setdefault('PIPELINE_MATCH_WORKERS', '16')
+    os.environ.setdefault('PIPELINE_DELIVER_WORKERS', '4')
+
+def on_starting(server):
+    """Point workers at the shared metrics directory, clearing files from a previous run"""
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = prometheus_multiproc_dir
+    os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+    for name in os.listdir(prometheus_multiproc_dir):
+        if name.endswith('.db'):
+            os.remove(os.path.join(prometheus_multiproc_dir, name))
+
+def child_exit(server, worker):
+    """Stop reporting a dead worker's live gauges"""
+    from utils.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
+
+def post_fork(server, worker):
+    """Make psycopg2 yield to other greenlets while it waits on Postgres"""
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+        worker.log.info("Patched psycopg2 for gevent")
@@ -0,0 +1,157 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from psycopg2 import sql
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from config.database import db_config
+
+PARENT_TABLE = 'message_ingest_log'
+PARTITION_PREFIX = f'{PARENT_TABLE}_'
+# Serializes partition DDL between workers
+PARTITION_LOCK_KEY = 0x696e676c6f67  # "inglog"
+
+INGEST_COLUMNS = (
+    'received_at', 'message_id', 'group_id', 'sender', 'message_type',
+    'content_hash', 'content', 'outcome', 'matched_count', 'detail'
+)
+
+def partition_name(day):
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+class IngestLogManager:
+    """
+    Day-partitioned log of every inbound group message and what the
+    pipeline did with it
+
+    Each UTC day is its own partition, so retention is a DROP TABLE rather
+    than a DELETE, and queries bounded by received_at only touch the days
+    they cover.
+    """
+
+    def __init__(self, db_config=db_config):
+        self.db_config = db_config
+        self._known_days = set()
+
+    def ensure_partitions(self, days):
+        """Create the partitions for the given dates if they do not exist"""
+        missing = sorted(set(days) - self._known_days)
+        if not missing:
+            return
+
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_KEY,))
+                for day in missing:
+                    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+                    cursor.execute(
+                        sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)").format(
+                            sql.Identifier(partition_name(day)), sql.Identifier(PARENT_TABLE)
+                        ),
+                        (start, start + timedelta(days=1))
+                    )
+        self._known_days.update(missing)
+
+    def drop_partitions_before(self, cutoff_day):
+        """
+        Drop whole days older than cutoff_day
+
+        Returns:
+            list: Names of the dropped partitions
+        """
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_KEY,))
+                cursor.execute("""
+                    SELECT c.relname
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    JOIN pg_class p ON p.oid = i.inhparent
+                    WHERE p.relname = %s
+                """, (PARENT_TABLE,))
+                cutoff = partition_name(cutoff_day)
+                old = sorted(
+                    name for (name,) in cursor.fetchall()
+                    if name.startswith(PARTITION_PREFIX) and name < cutoff
+                )
+                for name in old:
+                    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(name)))
+
+        if old:
+            self._known_days = {day for day in self._known_days if partition_name(day) >= cutoff}
+            logging.info(f"Dropped ingest log partitions: {old}")
+        return old
+
+    def insert_batch(self, rows):
+        """
+        Write a batch of ingest records
+
+        Args:
+            rows (list): dicts keyed by INGEST_COLUMNS (received_at as an aware datetime)
+        """
+        if not rows:
+            return
+        self.ensure_partitions({row['received_at'].astimezone(timezone.utc).date() for row in rows})
+
+        values = [
+            tuple(Json(row.get(column)) if column == 'detail' else row.get(column) for column in INGEST_COLUMNS)
+            for row in rows
+        ]
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    f"INSERT INTO {PARENT_TABLE} ({', '.join(INGEST_COLUMNS)}) VALUES %s",
+                    values,
+                    page_size=len(values)
+                )
+
+    def query(self, since, until, group_id=None, outcome=None, content_hash=None,
+              limit=100, oldest_first=False, with_content=False):
+        """
+        Ingest records in a time range
+
+        Args:
+            since (datetime): Inclusive lower bound on received_at
+            until (datetime): Exclusive upper bound on received_at
+            group_id (str): Only this group
+            outcome (str): Only this pipeline outcome
+            content_hash (str): Only copies of this message
+            limit (int): Maximum rows
+            oldest_first (bool): Ascending order (for replays)
+            with_content (bool): Include the message text
+
+        Returns:
+            list: Row dicts
+        """
+        conditions = ["received_at >= %s", "received_at < %s"]
+        params = [since, until]
+        for column, value in (('group_id', group_id), ('outcome', outcome), ('content_hash', content_hash)):
+            if value:
+                conditions.append(f"{column} = %s")
+                params.append(value)
+
+        columns = [column for column in INGEST_COLUMNS if with_content or column != 'content']
+        direction = 'ASC' if oldest_first else 'DESC'
+        params.append(limit)
+
+        with self.db_config.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(f"""
+                    SELECT id, {', '.join(columns)}
+                    FROM {PARENT_TABLE}
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY received_at {direction}, id {direction}
+                    LIMIT %s
+                """, params)
+                return [dict(row) for row in cursor.fetchall()]
+
+    def count_outcomes(self, since, until):
+        """Messages per outcome in a time range"""
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT outcome, COUNT(*)
+                    FROM {PARENT_TABLE}
+                    WHERE received_at >= %s AND received_at < %s
+                    GROUP BY outcome
+                """, (since, until))
+                return dict(cursor.fetchall())
@@ -0,0 +1,58 @@
+import logging
+from config.database import db_config
+
+# Key for the advisory lock that stops workers running the purge concurrently
+CLEANUP_LOCK_KEY = 0x6d7367636c6e  # "msgcln"
+
+class MessageCacheManager:
+    """Cross-worker duplicate detection backed by the message_cache table"""
+
+    def __init__(self, db_config=db_config):
+        self.db_config = db_config
+
+    def claim(self, message_hash, window_seconds):
+        """
+        Atomically record a message unless it was already seen within the window
+
+        A fresh hash is inserted; an existing row is only taken over (its
+        created_at reset) once it is older than the window. Exactly one
+        caller across all workers gets a row back for each sighting.
+
+        Args:
+            message_hash (str): 64-character content hash
+            window_seconds (float): Deduplication window
+
+        Returns:
+            bool: True if this caller claimed the message (not a duplicate)
+        """
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO message_cache (message_hash, kind)
+                    VALUES (%s, 'dedup')
+                    ON CONFLICT (message_hash) DO UPDATE
+                    SET created_at = NOW()
+                    WHERE message_cache.created_at < NOW() - make_interval(secs => %s)
+                    RETURNING id
+                """, (message_hash, window_seconds))
+                return cursor.fetchone() is not None
+
+    def cleanup(self):
+        """
+        Run the cleanup_old_messages() SQL function if no other worker is
+
+        Returns:
+            bool: True if this call ran the purge
+        """
+        try:
+            with self.db_config.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (CLEANUP_LOCK_KEY,))
+                    if not cursor.fetchone()[0]:
+                        return False
+                    cursor.execute("SELECT cleanup_old_messages()")
+                    logging.info("Purged expired message_cache rows")
+                    return True
+        except Exception as e:
+            logging.error(f"Error cleaning up message cache: {e}")
+            return False
@@ -0,0 +1,104 @@
+from psycopg2.extras import RealDictCursor, execute_values
+from config.database import db_config
+
+USAGE_KEY = ('day', 'model', 'operation', 'user_id', 'group_id')
+USAGE_TOTALS = ('requests', 'prompt_tokens', 'completion_tokens', 'cost_usd')
+# Dimensions the admin summary can break spend down by
+SUMMARY_DIMENSIONS = ('day', 'model', 'operation', 'user_id', 'group_id')
+
+class OpenAIUsageManager:
+    """
+    Daily OpenAI token usage and spend per model, operation, user and group
+
+    One row per (day, model, operation, user_id, group_id); calls are
+    summed into it with batched upserts, so the table grows with distinct
+    users and groups rather than with requests. Calls not made for a
+    particular user or group use '' for that column.
+    """
+
+    def __init__(self, db_config=db_config):
+        self.db_config = db_config
+
+    def upsert_batch(self, records):
+        """
+        Add a batch of usage records to the daily totals
+
+        Records with the same key are summed first, since one INSERT ... ON
+        CONFLICT cannot touch the same row twice, and keys are written in
+        sorted order so concurrent workers lock rows in the same order.
+
+        Args:
+            records (list): dicts keyed by USAGE_KEY and USAGE_TOTALS
+        """
+        totals = {}
+        for record in records:
+            key = tuple(record.get(column) or '' for column in USAGE_KEY)
+            sums = totals.setdefault(key, [0, 0, 0, 0.0])
+            for i, column in enumerate(USAGE_TOTALS):
+                sums[i] += record.get(column) or 0
+        if not totals:
+            return
+
+        values = [key + tuple(sums) for key, sums in sorted(totals.items())]
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                execute_values(cursor, f"""
+                    INSERT INTO openai_usage_daily AS u ({', '.join(USAGE_KEY + USAGE_TOTALS)})
+                    VALUES %s
+                    ON CONFLICT ({', '.join(USAGE_KEY)}) DO UPDATE SET
+                        requests = u.requests + EXCLUDED.requests,
+                        prompt_tokens = u.prompt_tokens + EXCLUDED.prompt_tokens,
+                        completion_tokens = u.completion_tokens + EXCLUDED.completion_tokens,
+                        cost_usd = u.cost_usd + EXCLUDED.cost_usd,
+                        updated_at = CURRENT_TIMESTAMP
+                """, values, page_size=len(values))
+
+    def spent_on(self, day):
+        """Total recorded spend (USD) for one day"""
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT COALESCE(SUM(cost_usd), 0) FROM openai_usage_daily WHERE day = %s", (day,))
+                return float(cursor.fetchone()[0])
+
+    def summary(self, since_day, until_day, group_by, limit=50):
+        """
+        Usage totals between two days (inclusive), grouped by one dimension
+
+        Args:
+            since_day (date): First day
+            until_day (date): Last day
+            group_by (str): One of SUMMARY_DIMENSIONS
+            limit (int): Maximum rows, highest spend first
+
+        Returns:
+            list: Row dicts with the dimension and USAGE_TOTALS
+        """
+        if group_by not in SUMMARY_DIMENSIONS:
+            raise ValueError(f"group_by must be one of {', '.join(SUMMARY_DIMENSIONS)}")
+
+        # Subscribers are listed with their names
+        name_column, name_join = '', ''
+        if group_by == 'user_id':
+            name_column = ', MAX(users.name) AS user_name'
+            name_join = 'LEFT JOIN users ON users.user_id = u.user_id'
+
+        with self.db_config.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(f"""
+                    SELECT u.{group_by}{name_column},
+                           SUM(u.requests) AS requests,
+                           SUM(u.prompt_tokens) AS prompt_tokens,
+                           SUM(u.completion_tokens) AS completion_tokens,
+                           SUM(u.cost_usd) AS cost_usd
+                    FROM openai_usage_daily u
+                    {name_join}
+                    WHERE u.day BETWEEN %s AND %s
+                    GROUP BY u.{group_by}
+                    ORDER BY {'day DESC' if group_by == 'day' else 'cost_usd DESC'}
+                    LIMIT %s
+                """, (since_day, until_day, limit))
+                return [
+                    dict(row, requests=int(row['requests']), prompt_tokens=int(row['prompt_tokens']),
+                         completion_tokens=int(row['completion_tokens']), cost_usd=float(row['cost_usd']))
+                    for row in cursor.fetchall()
+                ]
@@ -0,0 +1,164 @@
+import os
+import hashlib
+import logging
+from psycopg2.extras import execute_values
+from config.database import db_config
+
+# Seconds a claimed row stays reserved for the worker sending it; the drainer
+# renews the lease while it sends, so only a crashed worker's rows are picked up again
+OUTBOX_LEASE_SECONDS = float(os.getenv('OUTBOX_LEASE_SECONDS', 120))
+# Send attempts before a notification is marked failed
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 6))
+
+def notification_key(lead_key, user_id):
+    """Idempotency key for one lead reaching one user"""
+    return hashlib.sha256(f"notify:{lead_key}:{user_id}".encode('utf-8')).hexdigest()
+
+class OutboxManager:
+    """
+    Postgres-backed outbox of WhatsApp notifications
+
+    Rows are inserted once per idempotency key, claimed in batches with
+    FOR UPDATE SKIP LOCKED so any number of workers can drain the table
+    without sending a row twice, and leased so rows from a worker that
+    died mid-send become due again. A live worker extends its leases
+    until the sends finish, so slow sends are never claimed twice.
+    """
+
+    def __init__(self, db_config=db_config):
+        self.db_config = db_config
+
+    def enqueue(self, notifications):
+        """
+        Record intended deliveries; keys already in the outbox are ignored
+
+        Args:
+            notifications (list): (idempotency_key, to_number, body) tuples
+
+        Returns:
+            int: Number of new rows
+        """
+        if not notifications:
+            return 0
+
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                rows = execute_values(cursor, """
+                    INSERT INTO notification_outbox (idempotency_key, to_number, body)
+                    VALUES %s
+                    ON CONFLICT (idempotency_key) DO NOTHING
+                    RETURNING id
+                """, notifications, fetch=True)
+                return len(rows)
+
+    def claim_batch(self, limit):
+        """
+        Lease up to `limit` due notifications to this worker
+
+        Returns:
+            list: (id, to_number, body, attempts) tuples, oldest due first
+        """
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    WITH due AS (
+                        SELECT id FROM notification_outbox
+                        WHERE status IN ('pending', 'sending')
+                          AND next_attempt_at <= NOW()
+                          AND (locked_until IS NULL OR locked_until < NOW())
+                        ORDER BY next_attempt_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    UPDATE notification_outbox o
+                    SET status = 'sending',
+                        attempts = o.attempts + 1,
+                        locked_until = NOW() + make_interval(secs => %s)
+                    FROM due
+                    WHERE o.id = due.id
+                    RETURNING o.id, o.to_number, o.body, o.attempts
+                """, (limit, OUTBOX_LEASE_SECONDS))
+                return cursor.fetchall()
+
+    def extend_lease(self, ids):
+        """
+        Push back the lease on rows this worker is still sending
+
+        Returns:
+            int: Number of rows whose lease was extended
+        """
+        if not ids:
+            return 0
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE notification_outbox
+                    SET locked_until = NOW() + make_interval(secs => %s)
+                    WHERE id = ANY(%s) AND status = 'sending'
+                """, (OUTBOX_LEASE_SECONDS, list(ids)))
+                return cursor.rowcount
+
+    def mark_sent(self, ids):
+        if not ids:
+            return
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE notification_outbox
+                    SET status = 'sent', sent_at = NOW(), locked_until = NULL, last_error = NULL
+                    WHERE id = ANY(%s)
+                """, (list(ids),))
+
+    def mark_failed(self, failures):
+        """
+        Schedule retries, or give up on rows out of attempts
+
+        Args:
+            failures (list): (id, retry_delay_seconds, error) tuples
+        """
+        if not failures:
+            return
+        ids, delays, errors = zip(*failures)
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE notification_outbox o
+                    SET status = CASE WHEN o.attempts >= %s THEN 'failed' ELSE 'pending' END,
+                        next_attempt_at = NOW() + make_interval(secs => f.delay),
+                        locked_until = NULL,
+                        last_error = f.error
+                    FROM unnest(%s::bigint[], %s::float8[], %s::text[]) AS f(id, delay, error)
+                    WHERE o.id = f.id
+                    RETURNING o.id, o.status
+                """, (OUTBOX_MAX_ATTEMPTS, list(ids), list(delays), list(errors)))
+                given_up = [row[0] for row in cursor.fetchall() if row[1] == 'failed']
+        if given_up:
+            logging.error(f"Giving up on {len(given_up)} notifications after {OUTBOX_MAX_ATTEMPTS} attempts: {given_up}")
+
+    def get_counts(self):
+        """Rows per status, plus how many are due now"""
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT
+                        COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+                        COUNT(*) FILTER (WHERE status = 'sending') AS sending,
+                        COUNT(*) FILTER (WHERE status = 'sent') AS sent,
+                        COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+                        COUNT(*) FILTER (WHERE status IN ('pending', 'sending')
+                                         AND next_attempt_at <= NOW()) AS due
+                    FROM notification_outbox
+                """)
+                columns = [column[0] for column in cursor.description]
+                return dict(zip(columns, cursor.fetchone()))
+
+    def purge(self, older_than_days):
+        """Delete sent/failed rows older than the retention period"""
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM notification_outbox
+                    WHERE status IN ('sent', 'failed')
+                      AND created_at < NOW() - make_interval(days => %s)
+                """, (int(older_than_days),))
+                return cursor.rowcount
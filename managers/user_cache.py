@@ -0,0 +1,144 @@
+import os
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+# Maximum number of cache keys held per worker (each user takes up to three)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 3000))
+# Seconds a cached user is served before it is read again; this also bounds
+# how long another worker's write can go unnoticed here
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 30))
+
+class UserCache:
+    """
+    Process-local LRU + TTL cache of users keyed by number, email and
+    Stripe customer ID.
+    
+    All keys for a user are tracked together so a write can invalidate
+    every way of looking that user up at once. Callers get a copy of the
+    cached user, so mutating it never changes what other requests see.
+    """
+    
+    def __init__(self, max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (kind, value) -> (expires_at, user)
+        self._keys_by_user = {}  # user_id -> set of (kind, value)
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+    
+    def _user_keys(self, user):
+        keys = [('number', user.number)]
+        if getattr(user, 'email', None):
+            keys.append(('email', user.email))
+        if getattr(user, 'stripe_customer_id', None):
+            keys.append(('stripe_customer_id', user.stripe_customer_id))
+        return keys
+    
+    def _drop_key(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[1].user_id
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+    
+    def get(self, kind, value):
+        """Return a copy of the cached user, or None on a miss"""
+        if not self.enabled:
+            return None
+        
+        key = (kind, value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                self._drop_key(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+        
+        return copy.copy(user)
+    
+    def put(self, user):
+        """Cache a user under every key it can be looked up by"""
+        if not self.enabled or user is None:
+            return
+        
+        user = copy.copy(user)
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            # Drop keys left over from the user's previous number/email
+            self._invalidate_user_locked(user.user_id, count=False)
+            
+            keys = self._user_keys(user)
+            for key in keys:
+                self._drop_key(key)
+                self._entries[key] = (expires_at, user)
+            self._keys_by_user[user.user_id] = set(keys)
+            
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._drop_key(oldest_key)
+                self.evictions += 1
+    
+    def _invalidate_user_locked(self, user_id, count=True):
+        keys = self._keys_by_user.pop(user_id, ())
+        for key in keys:
+            self._entries.pop(key, None)
+        if keys and count:
+            self.invalidations += 1
+    
+    def invalidate_user(self, user_id):
+        """Drop every cached key for a user"""
+        with self._lock:
+            self._invalidate_user_locked(user_id)
+    
+    def invalidate(self, kind, value):
+        """Drop the user cached under one key, along with its other keys"""
+        with self._lock:
+            entry = self._entries.get((kind, value))
+            if entry is not None:
+                self._invalidate_user_locked(entry[1].user_id)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+    
+    def stats(self):
+        """Hit/miss/eviction counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'users': len(self._keys_by_user),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -1,9 +1,17 @@
+import os
+import base64
+import json
 import logging
 import uuid
 from datetime import datetime
 from psycopg2.extras import RealDictCursor
 from models.user import User
 from config.database import db_config
+from managers.user_cache import UserCache
+from utils.metrics import DB_QUERY_SECONDS, DB_QUERY_ERRORS, timed
+
+# Below this many (estimated) rows an exact COUNT(*) is cheap enough to run per page
+USERS_EXACT_COUNT_BELOW = int(os.getenv('USERS_EXACT_COUNT_BELOW', 10000))
 
 class UserManager:
     """PostgreSQL-backed user manager for production"""
@@ -11,6 +19,8 @@ class UserManager:
     def __init__(self):
         """Initialize user manager"""
         self.db_config = db_config
+        self.cache = UserCache()
+        self._column_indexes = {}
         self._check_table_structure()
     
     def _check_table_structure(self):
@@ -35,169 +45,168 @@ class UserManager:
             self.has_email = False
             self.has_password_hash = False
     
-    def _format_timestamp(self, timestamp):
-        """Format timestamp to ISO format string, handling both datetime objects and strings"""
-        if timestamp is None:
-            return None
-        if isinstance(timestamp, str):
-            return timestamp
-        try:
-            return timestamp.isoformat()
-        except AttributeError:
-            return str(timestamp)
+    def _column_index(self, cursor):
+        """User attribute positions for the cursor's result columns, cached per column layout"""
+        column_names = tuple(column[0] for column in cursor.description)
+        column_index = self._column_indexes.get(column_names)
+        if column_index is None:
+            column_index = User.column_index(column_names)
+            self._column_indexes[column_names] = column_index
+        return column_index
+    
+    def _row_to_user(self, row, column_index):
+        """Build a User from a tuple row, mapping columns by name via column_index"""
+        user = User.from_row(row, column_index)
+        
+        # Add default email if column doesn't exist
+        if not self.has_email:
+            user.email = f"user_{user.user_id}@temp.local"
+        
+        return user
     
+    def _refresh_cached_user(self, user):
+        """Replace whatever is cached for a user with the row just written"""
+        self.cache.invalidate_user(user.user_id)
+        self.cache.put(user)
+    
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='add_user')
     def add_user(self, name, email, number, location, range_miles, 
                  password=None, stripe_customer_id=None, subscription_id=None):
         """
-        Add a new user to the database
+        Add a new user to the database, or update the existing one
+        
+        Runs as one INSERT ... ON CONFLICT (number) DO UPDATE ... RETURNING
+        statement, so concurrent signups for the same number cannot race into
+        a unique violation. If the number is new but the email already belongs
+        to a user, that user is updated instead, in the same statement.
         """
         try:
-            # Check if user already exists by number (always available)
-            existing_user = self.get_user_by_number(number)
+            user_id = str(uuid.uuid4())
+            now = datetime.utcnow()
             
-            # Also check by email if email column exists and email is provided
-            if not existing_user and self.has_email and email:
-                existing_user = self.get_user_by_email(email)
+            password_hash = None
+            if password and self.has_password_hash:
+                user = User(
+                    user_id=user_id,
+                    name=name,
+                    email=email,
+                    number=number,
+                    location=location,
+                    range_miles=range_miles
+                )
+                user.set_password(password)
+                password_hash = user.password_hash
             
-            if existing_user:
-                # Update existing user
-                update_data = {
-                    'name': name,
-                    'location': location,
-                    'range_miles': range_miles,
-                    'active': True
-                }
-                
-                # Update email if column exists and email provided
-                if self.has_email and email and email != getattr(existing_user, 'email', None):
-                    update_data['email'] = email
-                
-                if stripe_customer_id:
-                    update_data['stripe_customer_id'] = stripe_customer_id
-                if subscription_id:
-                    update_data['subscription_id'] = subscription_id
-                if password and self.has_password_hash:
-                    # Update password
-                    existing_user.set_password(password)
-                    update_data['password_hash'] = existing_user.password_hash
-                
-                return self.update_user(existing_user.number, **update_data)
+            params = {
+                'user_id': user_id,
+                'name': name,
+                'number': number,
+                'location': location,
+                'range_miles': range_miles,
+                'now': now,
+                'email': email or f"user_{user_id}@temp.local",
+                'update_email': email or None,
+                'password_hash': password_hash,
+                'stripe_customer_id': stripe_customer_id,
+                'subscription_id': subscription_id
+            }
             
-            # Create new user
-            user_id = str(uuid.uuid4())
-            now = datetime.utcnow().isoformat()
+            # Columns written for a new user
+            columns = ['user_id', 'name', 'number', 'location', 'range_miles', 'active',
+                       'created_at', 'updated_at', 'stripe_customer_id', 'subscription_id']
+            values = ['%(user_id)s', '%(name)s', '%(number)s', '%(location)s', '%(range_miles)s', 'TRUE',
+                      '%(now)s', '%(now)s', '%(stripe_customer_id)s', '%(subscription_id)s']
             
-            # Build insert query based on available columns
-            columns = ['user_id', 'name', 'number', 'location', 'range_miles', 'active', 'created_at', 'updated_at']
-            values = [user_id, name, number, location, range_miles, True, now, now]
-            placeholders = ['%s'] * len(values)
+            # Columns written for an existing user; optional values keep what is stored
+            set_clauses = [
+                'name = %(name)s',
+                'location = %(location)s',
+                'range_miles = %(range_miles)s',
+                'active = TRUE',
+                'updated_at = %(now)s',
+                'stripe_customer_id = COALESCE(%(stripe_customer_id)s, u.stripe_customer_id)',
+                'subscription_id = COALESCE(%(subscription_id)s, u.subscription_id)'
+            ]
             
-            # Add email if column exists
             if self.has_email:
                 columns.append('email')
-                values.append(email or f"user_{user_id}@temp.local")
-                placeholders.append('%s')
+                values.append('%(email)s')
+                set_clauses.append('email = COALESCE(%(update_email)s, u.email)')
             
-            # Add password if column exists and password provided
             if self.has_password_hash:
-                user = User(
-                    user_id=user_id,
-                    name=name,
-                    email=email or f"user_{user_id}@temp.local",
-                    number=number,
-                    location=location,
-                    range_miles=range_miles,
-                    active=True,
-                    created_at=now,
-                    updated_at=now
-                )
-                
-                if password:
-                    user.set_password(password)
-                
                 columns.append('password_hash')
-                values.append(user.password_hash)
-                placeholders.append('%s')
+                values.append('%(password_hash)s')
+                set_clauses.append('password_hash = COALESCE(%(password_hash)s, u.password_hash)')
             
-            # Add Stripe fields if provided
-            if stripe_customer_id:
-                columns.append('stripe_customer_id')
-                values.append(stripe_customer_id)
-                placeholders.append('%s')
+            set_sql = ', '.join(set_clauses)
             
-            if subscription_id:
-                columns.append('subscription_id')
-                values.append(subscription_id)
-                placeholders.append('%s')
+            if self.has_email and email:
+                # Fall back to the user owning this email when the number is unknown
+                query = f"""
+                    WITH by_email AS (
+                        UPDATE users AS u SET {set_sql}
+                        WHERE u.user_id = (
+                            SELECT user_id FROM users WHERE email = %(update_email)s
+                            ORDER BY created_at LIMIT 1
+                        )
+                        AND NOT EXISTS (SELECT 1 FROM users WHERE number = %(number)s)
+                        RETURNING u.*
+                    ), upserted AS (
+                        INSERT INTO users AS u ({', '.join(columns)})
+                        SELECT {', '.join(values)}
+                        WHERE NOT EXISTS (SELECT 1 FROM by_email)
+                        ON CONFLICT (number) DO UPDATE SET {set_sql}
+                        RETURNING u.*
+                    )
+                    SELECT * FROM by_email
+                    UNION ALL
+                    SELECT * FROM upserted;
+                """
+            else:
+                query = f"""
+                    INSERT INTO users AS u ({', '.join(columns)})
+                    VALUES ({', '.join(values)})
+                    ON CONFLICT (number) DO UPDATE SET {set_sql}
+                    RETURNING u.*;
+                """
             
             with self.db_config.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    query = f"""
-                        INSERT INTO users ({', '.join(columns)})
-                        VALUES ({', '.join(placeholders)})
-                        RETURNING *;
-                    """
-                    cursor.execute(query, values)
-                    
+                    cursor.execute(query, params)
                     row = cursor.fetchone()
+                    column_index = self._column_index(cursor)
                     conn.commit()
-                    
-                    # Convert to User object
-                    user_data = {
-                        'user_id': row[0],
-                        'name': row[1],
-                        'number': row[2] if not self.has_email else row[4],  # Adjust for email column
-                        'location': row[3] if not self.has_email else row[5],
-                        'range_miles': row[4] if not self.has_email else row[6],
-                        'active': row[7] if not self.has_email else row[9],
-                        'created_at': self._format_timestamp(row[8] if not self.has_email else row[10]) or now,
-                        'updated_at': self._format_timestamp(row[9] if not self.has_email else row[11]) or now
-                    }
-                    
-                    # Add email and password_hash if columns exist
-                    if self.has_email:
-                        user_data['email'] = row[2]
-                    else:
-                        user_data['email'] = email or f"user_{user_id}@temp.local"
-                    
-                    if self.has_password_hash:
-                        user_data['password_hash'] = row[3] if not self.has_email else row[7]
-                    
-                    # Add Stripe fields
-                    stripe_customer_idx = len(row) - 2 if subscription_id else len(row) - 1 if stripe_customer_id else None
-                    subscription_idx = len(row) - 1 if subscription_id else None
-                    
-                    user_data['stripe_customer_id'] = row[stripe_customer_idx] if stripe_customer_idx else stripe_customer_id
-                    user_data['subscription_id'] = row[subscription_idx] if subscription_idx else subscription_id
-                    
-                    created_user = User.from_dict(user_data)
-                    logging.info(f"Added user: {created_user.name} ({getattr(created_user, 'email', 'no-email')})")
-                    return created_user
+            
+            saved_user = self._row_to_user(row, column_index)
+            self._refresh_cached_user(saved_user)
+            logging.info(f"Added/updated user: {saved_user.name} ({getattr(saved_user, 'email', 'no-email')})")
+            return saved_user
                     
         except Exception as e:
             logging.error(f"Error adding user: {e}")
             raise
     
-    def get_user_by_email(self, email):
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='get_user_by_email')
+    def get_user_by_email(self, email, use_cache=True):
         """Get user by email address (only if email column exists)"""
         if not self.has_email or not email:
             return None
+        
+        if use_cache:
+            cached = self.cache.get('email', email)
+            if cached is not None:
+                return cached
             
         try:
             with self.db_config.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                with conn.cursor() as cursor:
                     cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
                     row = cursor.fetchone()
                     
                     if row:
-                        user_data = dict(row)
-                        # Convert timestamps to ISO format
-                        if user_data.get('created_at'):
-                            user_data['created_at'] = self._format_timestamp(user_data['created_at'])
-                        if user_data.get('updated_at'):
-                            user_data['updated_at'] = self._format_timestamp(user_data['updated_at'])
-                        
-                        return User.from_dict(user_data)
+                        user = self._row_to_user(row, self._column_index(cursor))
+                        self.cache.put(user)
+                        return user
                     
                     return None
                     
@@ -212,7 +221,8 @@ class UserManager:
             return None
             
         try:
-            user = self.get_user_by_email(email)
+            # Always check against the stored hash, never a cached copy
+            user = self.get_user_by_email(email, use_cache=False)
             if user and user.check_password(password):
                 return user
             return None
@@ -220,114 +230,167 @@ class UserManager:
             logging.error(f"Error authenticating user: {e}")
             return None
     
-    def update_user_by_email(self, email, **kwargs):
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='update_user_by_email')
+    def update_user_by_email(self, email, only_if_changed=False, **kwargs):
         """Update user by email address (only if email column exists)"""
         if not self.has_email or not email:
             return None
             
         try:
-            # Build dynamic update query
-            set_clauses = []
-            values = []
-            
-            # Valid fields that can be updated (check if columns exist)
-            valid_fields = ['name', 'location', 'range_miles', 'stripe_customer_id', 'subscription_id', 'active']
-            
-            if self.has_email:
-                valid_fields.append('email')
-            if self.has_password_hash:
-                valid_fields.append('password_hash')
-            
-            for key, value in kwargs.items():
-                if key in valid_fields:
-                    set_clauses.append(f"{key} = %s")
-                    values.append(value)
-            
-            if not set_clauses:
-                return self.get_user_by_email(email)
-            
-            # Add updated_at
-            set_clauses.append("updated_at = %s")
-            values.append(datetime.utcnow())
-            values.append(email)  # For WHERE clause
-            
-            with self.db_config.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    query = f"UPDATE users SET {', '.join(set_clauses)} WHERE email = %s"
-                    cursor.execute(query, values)
-                    conn.commit()
-                    
-                    if cursor.rowcount > 0:
-                        return self.get_user_by_email(email)
-            
-            return None
-            
+            return self._update_user_where('email', email, only_if_changed, kwargs)
         except Exception as e:
             logging.error(f"Error updating user by email: {e}")
             return None
     
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='get_users')
     def get_users(self, active_only=True):
         """Get all users from database"""
         try:
             with self.db_config.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                with conn.cursor() as cursor:
                     if active_only:
                         cursor.execute("SELECT * FROM users WHERE active = TRUE ORDER BY created_at DESC")
                     else:
                         cursor.execute("SELECT * FROM users ORDER BY created_at DESC")
                     
                     rows = cursor.fetchall()
-                    users = []
-                    
-                    for row in rows:
-                        user_data = dict(row)
-                        # Convert timestamps to ISO format
-                        if user_data.get('created_at'):
-                            user_data['created_at'] = self._format_timestamp(user_data['created_at'])
-                        if user_data.get('updated_at'):
-                            user_data['updated_at'] = self._format_timestamp(user_data['updated_at'])
-                        
-                        # Add default email if column doesn't exist
-                        if not self.has_email:
-                            user_data['email'] = f"user_{user_data.get('user_id', 'unknown')}@temp.local"
-                        
-                        # Add default password_hash if column doesn't exist
-                        if not self.has_password_hash:
-                            user_data['password_hash'] = None
-                        
-                        users.append(User.from_dict(user_data))
-                    
-                    return users
+                    column_index = self._column_index(cursor)
+                    return [self._row_to_user(row, column_index) for row in rows]
                     
         except Exception as e:
             logging.error(f"Error getting users: {e}")
             return []
     
+    def iter_users(self, active_only=False, batch_size=1000):
+        """
+        Stream users from a server-side cursor, newest first
+        
+        Rows are fetched batch_size at a time, so memory stays flat no matter
+        how many users there are. The pooled connection is held until the
+        generator is exhausted or closed.
+        
+        Yields:
+            User: One user per row
+        """
+        cursor_name = f"iter_users_{uuid.uuid4().hex}"
+        where = "WHERE active = TRUE" if active_only else ""
+        
+        with self.db_config.get_connection() as conn:
+            with conn.cursor(name=cursor_name) as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(f"SELECT * FROM users {where} ORDER BY created_at DESC, user_id DESC")
+                column_index = None
+                for row in cursor:
+                    # A named cursor only describes its columns after the first fetch
+                    if column_index is None:
+                        column_index = self._column_index(cursor)
+                    yield self._row_to_user(row, column_index)
+    
+    def _encode_cursor(self, user):
+        """Encode the (created_at, user_id) keyset position of a user"""
+        position = [user.created_at, user.user_id]
+        return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+    
+    def _decode_cursor(self, cursor_token):
+        """Decode a cursor produced by _encode_cursor"""
+        try:
+            created_at, user_id = json.loads(base64.urlsafe_b64decode(cursor_token.encode('ascii')))
+            return created_at, user_id
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor_token}") from e
+    
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='get_users_page')
+    def get_users_page(self, active_only=True, limit=50, cursor=None, offset=0, count='estimate'):
+        """
+        Get one page of users, newest first
+        
+        Uses keyset pagination on (created_at, user_id): pass the returned
+        next_cursor back in to get the following page. offset is still
+        honoured when no cursor is given, but is pushed down into SQL.
+        
+        count controls total_count: 'estimate' (the default) asks the
+        planner how many rows match the filter, so a page costs the same
+        however many users there are, and only runs COUNT(*) when the
+        estimate is below USERS_EXACT_COUNT_BELOW, where it is cheap anyway.
+        'exact' always runs COUNT(*) and 'none' skips the count.
+        
+        Returns:
+            dict: users, next_cursor, total_count and total_is_estimate
+        """
+        conditions = []
+        params = []
+        
+        if active_only:
+            conditions.append("active = TRUE")
+        
+        if cursor:
+            created_at, user_id = self._decode_cursor(cursor)
+            conditions.append("(created_at, user_id) < (%s::timestamptz, %s)")
+            params.extend([created_at, user_id])
+            offset = 0
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # Fetch one extra row to know whether another page exists
+        params.extend([limit + 1, offset])
+        
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as db_cursor:
+                db_cursor.execute(f"""
+                    SELECT * FROM users
+                    {where}
+                    ORDER BY created_at DESC, user_id DESC
+                    LIMIT %s OFFSET %s
+                """, params)
+                rows = db_cursor.fetchall()
+                column_index = self._column_index(db_cursor)
+                
+                total_count = None
+                total_is_estimate = False
+                
+                count_where = "WHERE active = TRUE" if active_only else ""
+                
+                if count == 'estimate':
+                    # The planner's row estimate honours the active filter
+                    db_cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM users {count_where}")
+                    plan = db_cursor.fetchone()[0]
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    estimate = int(plan[0]['Plan']['Plan Rows'])
+                    if estimate >= USERS_EXACT_COUNT_BELOW:
+                        total_count = estimate
+                        total_is_estimate = True
+                
+                if count in ('exact', 'estimate') and total_count is None:
+                    db_cursor.execute(f"SELECT COUNT(*) AS total FROM users {count_where}")
+                    total_count = db_cursor.fetchone()[0]
+        
+        has_more = len(rows) > limit
+        users = [self._row_to_user(row, column_index) for row in rows[:limit]]
+        
+        return {
+            'users': users,
+            'next_cursor': self._encode_cursor(users[-1]) if has_more and users else None,
+            'total_count': total_count,
+            'total_is_estimate': total_is_estimate
+        }
+    
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='get_user_by_number')
     def get_user_by_number(self, number):
         """Get user by phone number"""
+        cached = self.cache.get('number', number)
+        if cached is not None:
+            return cached
+        
         try:
             with self.db_config.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                with conn.cursor() as cursor:
                     cursor.execute("SELECT * FROM users WHERE number = %s", (number,))
                     row = cursor.fetchone()
                     
                     if row:
-                        user_data = dict(row)
-                        # Convert timestamps to ISO format
-                        if user_data.get('created_at'):
-                            user_data['created_at'] = self._format_timestamp(user_data['created_at'])
-                        if user_data.get('updated_at'):
-                            user_data['updated_at'] = self._format_timestamp(user_data['updated_at'])
-                        
-                        # Add default email if column doesn't exist
-                        if not self.has_email:
-                            user_data['email'] = f"user_{user_data.get('user_id', 'unknown')}@temp.local"
-                        
-                        # Add default password_hash if column doesn't exist
-                        if not self.has_password_hash:
-                            user_data['password_hash'] = None
-                        
-                        return User.from_dict(user_data)
+                        user = self._row_to_user(row, self._column_index(cursor))
+                        self.cache.put(user)
+                        return user
                     
                     return None
                     
@@ -335,32 +398,31 @@ class UserManager:
             logging.error(f"Error getting user by number: {e}")
             return None
     
-    def get_user_by_stripe_customer_id(self, stripe_customer_id):
-        """Get user by Stripe customer ID"""
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='get_user_by_stripe_customer_id')
+    def get_user_by_stripe_customer_id(self, stripe_customer_id, use_cache=True):
+        """
+        Get user by Stripe customer ID
+        
+        Pass use_cache=False where the answer drives a write (billing
+        webhooks): the process-local cache can miss another worker's change
+        for up to USER_CACHE_TTL seconds. The row read is still cached.
+        """
+        if use_cache:
+            cached = self.cache.get('stripe_customer_id', stripe_customer_id)
+            if cached is not None:
+                return cached
+        
         try:
             with self.db_config.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                with conn.cursor() as cursor:
                     cursor.execute("SELECT * FROM users WHERE stripe_customer_id = %s", 
                                  (stripe_customer_id,))
                     row = cursor.fetchone()
                     
                     if row:
-                        user_data = dict(row)
-                        # Convert timestamps to ISO format
-                        if user_data.get('created_at'):
-                            user_data['created_at'] = self._format_timestamp(user_data['created_at'])
-                        if user_data.get('updated_at'):
-                            user_data['updated_at'] = self._format_timestamp(user_data['updated_at'])
-                        
-                        # Add default email if column doesn't exist
-                        if not self.has_email:
-                            user_data['email'] = f"user_{user_data.get('user_id', 'unknown')}@temp.local"
-                        
-                        # Add default password_hash if column doesn't exist
-                        if not self.has_password_hash:
-                            user_data['password_hash'] = None
-                        
-                        return User.from_dict(user_data)
+                        user = self._row_to_user(row, self._column_index(cursor))
+                        self.cache.put(user)
+                        return user
                     
                     return None
                     
@@ -368,47 +430,99 @@ class UserManager:
             logging.error(f"Error getting user by Stripe ID: {e}")
             return None
     
-    def update_user(self, number, **kwargs):
-        """Update user in database by phone number"""
+    def updatable_fields(self):
+        """Columns that callers are allowed to update"""
+        valid_fields = ['name', 'location', 'range_miles', 'stripe_customer_id', 'subscription_id', 'active']
+        
+        if self.has_email:
+            valid_fields.append('email')
+        if self.has_password_hash:
+            valid_fields.append('password_hash')
+        
+        return valid_fields
+    
+    def _update_user_where(self, key_column, key_value, only_if_changed, fields):
+        """
+        Update the user matching key_column and return the new row
+        
+        The row comes back from the UPDATE itself via RETURNING, so no second
+        SELECT is needed. With only_if_changed the UPDATE only touches the row
+        when at least one value differs, and the stored row is returned as-is
+        otherwise, still in a single statement.
+        """
+        valid_fields = self.updatable_fields()
+        updates = [(key, value) for key, value in fields.items() if key in valid_fields]
+        
+        if not updates:
+            if key_column == 'email':
+                return self.get_user_by_email(key_value)
+            return self.get_user_by_number(key_value)
+        
+        set_clauses = [f"{key} = %s" for key, _ in updates]
+        set_clauses.append("updated_at = %s")
+        values = [value for _, value in updates]
+        values.append(datetime.utcnow())
+        values.append(key_value)  # For WHERE clause
+        
+        if only_if_changed:
+            changed = ' OR '.join(f"{key} IS DISTINCT FROM %s" for key, _ in updates)
+            values.extend(value for _, value in updates)
+            values.append(key_value)  # For the unchanged-row fallback
+            query = f"""
+                WITH updated AS (
+                    UPDATE users SET {', '.join(set_clauses)}
+                    WHERE {key_column} = %s AND ({changed})
+                    RETURNING *
+                )
+                SELECT * FROM updated
+                UNION ALL
+                SELECT * FROM users
+                WHERE {key_column} = %s AND NOT EXISTS (SELECT 1 FROM updated)
+                LIMIT 1
+            """
+        else:
+            query = f"""
+                UPDATE users SET {', '.join(set_clauses)}
+                WHERE {key_column} = %s
+                RETURNING *
+            """
+        
         try:
-            # Build dynamic update query
-            set_clauses = []
-            values = []
-            
-            # Valid fields that can be updated (check if columns exist)
-            valid_fields = ['name', 'location', 'range_miles', 'stripe_customer_id', 'subscription_id', 'active']
-            
-            if self.has_email:
-                valid_fields.append('email')
-            if self.has_password_hash:
-                valid_fields.append('password_hash')
-            
-            for key, value in kwargs.items():
-                if key in valid_fields:
-                    set_clauses.append(f"{key} = %s")
-                    values.append(value)
-            
-            if not set_clauses:
-                return self.get_user_by_number(number)
-            
-            # Add updated_at
-            set_clauses.append("updated_at = %s")
-            values.append(datetime.utcnow())
-            values.append(number)  # For WHERE clause
-            
             with self.db_config.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    query = f"UPDATE users SET {', '.join(set_clauses)} WHERE number = %s"
                     cursor.execute(query, values)
+                    row = cursor.fetchone()
+                    column_index = self._column_index(cursor)
                     conn.commit()
-                    
-                    if cursor.rowcount > 0:
-                        return self.get_user_by_number(number)
-            
+        except Exception:
+            # The write may or may not have happened; stop serving the old row
+            self.cache.invalidate(key_column, key_value)
+            raise
+        
+        if not row:
+            self.cache.invalidate(key_column, key_value)
             return None
-            
+        
+        user = self._row_to_user(row, column_index)
+        self._refresh_cached_user(user)
+        return user
+    
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='update_user')
+    def update_user(self, number, only_if_changed=False, raise_errors=False, **kwargs):
+        """
+        Update user in database by phone number
+        
+        Pass only_if_changed=True to skip the write when every value already
+        matches what is stored. Returns None when no user has this number;
+        database errors also return None unless raise_errors=True, so callers
+        that need to tell the two apart can.
+        """
+        try:
+            return self._update_user_where('number', number, only_if_changed, kwargs)
         except Exception as e:
             logging.error(f"Error updating user: {e}")
+            if raise_errors:
+                raise
             return None
     
     def deactivate_user(self, number):
@@ -416,19 +530,176 @@ class UserManager:
         result = self.update_user(number, active=False)
         return result is not None
     
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='delete_user')
     def delete_user(self, number):
         """Hard delete user from database"""
         try:
             with self.db_config.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    cursor.execute("DELETE FROM users WHERE number = %s", (number,))
+                    cursor.execute("DELETE FROM users WHERE number = %s RETURNING user_id", (number,))
+                    rows = cursor.fetchall()
                     conn.commit()
-                    return cursor.rowcount > 0
+            
+            self.cache.invalidate('number', number)
+            for (user_id,) in rows:
+                self.cache.invalidate_user(user_id)
+            return len(rows) > 0
                     
         except Exception as e:
             logging.error(f"Error deleting user: {e}")
+            self.cache.invalidate('number', number)
             return False
     
+    def _bulk_where(self, numbers=None, filters=None):
+        """
+        Build the WHERE clause selecting users for a bulk operation
+        
+        Either an explicit list of numbers or a server-side filter is
+        required. Supported filters: location (case-insensitive match),
+        created_after / created_before (ISO timestamps) and active.
+        """
+        if numbers:
+            return "number = ANY(%s)", [list(numbers)]
+        
+        filters = filters or {}
+        conditions = []
+        params = []
+        
+        if filters.get('location'):
+            conditions.append("LOWER(location) = LOWER(%s)")
+            params.append(filters['location'])
+        if filters.get('created_after'):
+            conditions.append("created_at >= %s::timestamptz")
+            params.append(filters['created_after'])
+        if filters.get('created_before'):
+            conditions.append("created_at < %s::timestamptz")
+            params.append(filters['created_before'])
+        if filters.get('active') is not None:
+            conditions.append("active = %s")
+            params.append(bool(filters['active']))
+        
+        if not conditions:
+            # Never let an empty filter turn into "every user"
+            raise ValueError("Bulk operations need user numbers or at least one filter")
+        
+        return ' AND '.join(conditions), params
+    
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='bulk_set_active')
+    def bulk_set_active(self, active, numbers=None, filters=None):
+        """
+        Activate or deactivate many users in one statement
+        
+        Rows already in the requested state are not rewritten.
+        
+        Returns:
+            dict: number -> 'updated', 'unchanged' or 'not_found'
+        """
+        where, params = self._bulk_where(numbers, filters)
+        query = f"""
+            WITH target AS (
+                SELECT number FROM users WHERE {where}
+            ), updated AS (
+                UPDATE users SET active = %s, updated_at = NOW()
+                WHERE number IN (SELECT number FROM target)
+                AND active IS DISTINCT FROM %s
+                RETURNING number, user_id
+            )
+            SELECT t.number, u.user_id
+            FROM target t
+            LEFT JOIN updated u ON u.number = t.number
+        """
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params + [active, active])
+                rows = cursor.fetchall()
+                conn.commit()
+        
+        outcomes = {}
+        for number, updated_user_id in rows:
+            if updated_user_id is not None:
+                self.cache.invalidate_user(updated_user_id)
+                outcomes[number] = 'updated'
+            else:
+                outcomes[number] = 'unchanged'
+        for number in numbers or []:
+            outcomes.setdefault(number, 'not_found')
+        
+        logging.info(f"Bulk set active={active}: {len(rows)} matched")
+        return outcomes
+    
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='bulk_delete')
+    def bulk_delete(self, numbers=None, filters=None):
+        """
+        Hard delete many users in one statement
+        
+        Returns:
+            dict: number -> 'deleted' or 'not_found'
+        """
+        where, params = self._bulk_where(numbers, filters)
+        with self.db_config.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DELETE FROM users WHERE {where} RETURNING number, user_id", params)
+                rows = cursor.fetchall()
+                conn.commit()
+        
+        outcomes = {}
+        for number, user_id in rows:
+            self.cache.invalidate_user(user_id)
+            outcomes[number] = 'deleted'
+        for number in numbers or []:
+            outcomes.setdefault(number, 'not_found')
+        
+        logging.info(f"Bulk delete: {len(rows)} deleted")
+        return outcomes
+    
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='get_user_stats')
+    def get_user_stats(self, recent_days=7, latest_limit=5):
+        """
+        Get user totals and the newest signups in one round trip
+        
+        Counts come from a single scan using COUNT(*) FILTER; the newest
+        users come from an index-backed ORDER BY created_at DESC LIMIT.
+        
+        Returns:
+            dict: total, active, inactive, recent counts and latest users
+        """
+        query = """
+            WITH counts AS (
+                SELECT
+                    COUNT(*) AS total_users,
+                    COUNT(*) FILTER (WHERE active) AS active_users,
+                    COUNT(*) FILTER (WHERE created_at >= NOW() - make_interval(days => %s)) AS recent_signups
+                FROM users
+            ), latest AS (
+                SELECT name, number, location, range_miles, created_at, active
+                FROM users
+                ORDER BY created_at DESC
+                LIMIT %s
+            )
+            SELECT
+                c.total_users,
+                c.active_users,
+                c.recent_signups,
+                COALESCE(
+                    (SELECT json_agg(l ORDER BY l.created_at DESC) FROM latest l),
+                    '[]'::json
+                ) AS latest_users
+            FROM counts c
+        """
+        with self.db_config.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(query, (recent_days, latest_limit))
+                row = cursor.fetchone()
+        
+        return {
+            'total_users': row['total_users'],
+            'active_users': row['active_users'],
+            'inactive_users': row['total_users'] - row['active_users'],
+            'recent_signups': row['recent_signups'],
+            'latest_users': row['latest_users']
+        }
+    
+    @timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query='get_user_count')
     def get_user_count(self):
         """Get total number of users"""
         try:
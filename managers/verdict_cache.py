@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from psycopg2.extras import Json
+from config.database import db_config
+
+# Maximum fingerprints held in each worker's local LRU in front of Postgres
+VERDICT_CACHE_SIZE = int(os.getenv('VERDICT_CACHE_SIZE', 2000))
+# Seconds a verdict/extraction is reused; cross-posts arrive within minutes,
+# and message_cache rows are purged after 24 hours regardless
+VERDICT_CACHE_TTL = float(os.getenv('VERDICT_CACHE_TTL', 6 * 3600))
+
+def normalize_message(message):
+    """Fold case, Unicode forms and whitespace so cross-posted copies hash alike"""
+    text = unicodedata.normalize('NFKC', message or '').casefold()
+    return ' '.join(text.split())
+
+def message_fingerprint(kind, message, params=()):
+    """
+    SHA-256 of the normalized message plus everything that changes the answer
+
+    Args:
+        kind (str): What is cached, e.g. 'verdict' or 'extract'
+        message (str): Message content
+        params (tuple): Matching parameters (model, user location, range...)
+
+    Returns:
+        str: 64-character hex digest, the message_cache key
+    """
+    key = json.dumps([kind, list(params), normalize_message(message)], ensure_ascii=False, default=str)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+class VerdictCache:
+    """
+    Memoized OpenAI results keyed by message fingerprint
+
+    A small process-local LRU + TTL sits in front of the shared
+    message_cache table, so every worker and instance reuses a verdict
+    once any of them has paid for it. Database errors are logged and
+    treated as misses; the cache never stops a lead from being matched.
+    """
+
+    def __init__(self, db_config=db_config, max_entries=VERDICT_CACHE_SIZE, ttl=VERDICT_CACHE_TTL):
+        self.db_config = db_config
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # fingerprint -> (expires_at, payload)
+        self._lock = threading.Lock()
+
+        self.local_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _get_local(self, fingerprint):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at <= time.monotonic():
+                del self._entries[fingerprint]
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.local_hits += 1
+            return payload
+
+    def _put_local(self, fingerprint, payload, ttl):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[fingerprint] = (time.monotonic() + ttl, payload)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, kind, message, params=()):
+        """
+        Look up a cached result
+
+        Returns:
+            The stored JSON payload, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        fingerprint = message_fingerprint(kind, message, params)
+        payload = self._get_local(fingerprint)
+        if payload is not None:
+            return payload
+
+        try:
+            with self.db_config.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE message_cache
+                        SET hits = hits + 1, last_hit_at = NOW()
+                        WHERE message_hash = %s
+                          AND payload IS NOT NULL
+                          AND created_at > NOW() - make_interval(secs => %s)
+                        RETURNING payload,
+                                  EXTRACT(EPOCH FROM created_at + make_interval(secs => %s) - NOW())
+                    """, (fingerprint, self.ttl, self.ttl))
+                    row = cursor.fetchone()
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                self.misses += 1
+            logging.error(f"Error reading verdict cache: {e}")
+            return None
+
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        payload, remaining = row
+        with self._lock:
+            self.db_hits += 1
+        # Expire locally when the shared row does, not a full TTL from now
+        self._put_local(fingerprint, payload, float(remaining))
+        return payload
+
+    def put(self, kind, message, params, payload):
+        """Store a result for this worker and every other one"""
+        if not self.enabled or payload is None:
+            return
+
+        fingerprint = message_fingerprint(kind, message, params)
+        self._put_local(fingerprint, payload, self.ttl)
+
+        try:
+            with self.db_config.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        INSERT INTO message_cache (message_hash, kind, payload)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (message_hash) DO UPDATE
+                        SET kind = EXCLUDED.kind,
+                            payload = EXCLUDED.payload,
+                            hits = 0,
+                            last_hit_at = NULL,
+                            created_at = NOW()
+                    """, (fingerprint, kind, Json(payload)))
+            with self._lock:
+                self.writes += 1
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logging.error(f"Error writing verdict cache: {e}")
+
+    def clear_local(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit rates split by where the hit was served from"""
+        with self._lock:
+            hits = self.local_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'local_hits': self.local_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'errors': self.errors
+            }
+
+_verdict_cache = None
+_verdict_cache_lock = threading.Lock()
+
+def get_verdict_cache():
+    """Get this process's verdict cache"""
+    global _verdict_cache
+
+    if _verdict_cache is None:
+        with _verdict_cache_lock:
+            if _verdict_cache is None:
+                _verdict_cache = VerdictCache()
+    return _verdict_cache
@@ -9,9 +9,32 @@ except ImportError:
     BCRYPT_AVAILABLE = False
     print("Warning: bcrypt not available. Password hashing will be disabled.")
 
+def _isoformat(timestamp):
+    """Format a timestamp as an ISO string, passing strings and None through"""
+    if timestamp is None or isinstance(timestamp, str):
+        return timestamp
+    try:
+        return timestamp.isoformat()
+    except AttributeError:
+        return str(timestamp)
+
 class User:
     """User model for the Recovery Manager application"""
     
+    # Slots keep per-user memory small when whole tables are loaded
+    __slots__ = (
+        'user_id', 'name', 'email', 'password_hash', 'number', 'location',
+        'range_miles', 'stripe_customer_id', 'subscription_id', 'active',
+        '_created_at', '_updated_at'
+    )
+    
+    # Database columns copied straight onto the matching attribute by from_row
+    ROW_FIELDS = (
+        'user_id', 'name', 'email', 'password_hash', 'number', 'location',
+        'range_miles', 'stripe_customer_id', 'subscription_id', 'active',
+        'created_at', 'updated_at'
+    )
+    
     def __init__(self, name, email, number, location, range_miles, 
                  password_hash=None, stripe_customer_id=None, subscription_id=None, 
                  user_id=None, active=True, created_at=None, updated_at=None):
@@ -25,8 +48,65 @@ class User:
         self.stripe_customer_id = stripe_customer_id
         self.subscription_id = subscription_id
         self.active = active
-        self.created_at = created_at or datetime.utcnow().isoformat()
-        self.updated_at = updated_at or datetime.utcnow().isoformat()
+        self._created_at = created_at or datetime.utcnow()
+        self._updated_at = updated_at or datetime.utcnow()
+    
+    # Timestamps may be stored as datetimes straight from the database and
+    # are only turned into ISO strings when read
+    @property
+    def created_at(self):
+        return _isoformat(self._created_at)
+    
+    @created_at.setter
+    def created_at(self, value):
+        self._created_at = value
+    
+    @property
+    def updated_at(self):
+        return _isoformat(self._updated_at)
+    
+    @updated_at.setter
+    def updated_at(self, value):
+        self._updated_at = value
+    
+    @classmethod
+    def column_index(cls, column_names):
+        """
+        Map result columns to user attributes for from_row
+        
+        Args:
+            column_names (tuple): Column names in result order
+            
+        Returns:
+            tuple: (attribute, position) pairs for the columns present
+        """
+        positions = {name: i for i, name in enumerate(column_names)}
+        return tuple(
+            ('_' + field if field in ('created_at', 'updated_at') else field, positions[field])
+            for field in cls.ROW_FIELDS if field in positions
+        )
+    
+    @classmethod
+    def from_row(cls, row, column_index):
+        """
+        Create user object straight from a tuple row
+        
+        Args:
+            row (tuple): Database row
+            column_index (tuple): Result of column_index() for the row's columns
+        """
+        user = cls.__new__(cls)
+        # Defaults for columns the query did not return
+        user.email = None
+        user.password_hash = None
+        user.stripe_customer_id = None
+        user.subscription_id = None
+        user.active = True
+        user._created_at = None
+        user._updated_at = None
+        for attribute, position in column_index:
+            setattr(user, attribute, row[position])
+        return user
     
     def set_password(self, password):
         """Hash and set password"""
@@ -86,6 +166,12 @@ class User:
             updated_at=data.get('updated_at')
         )
     
+    def __copy__(self):
+        clone = User.__new__(User)
+        for attribute in User.__slots__:
+            setattr(clone, attribute, getattr(self, attribute))
+        return clone
+    
     def __str__(self):
         return f"User({self.name}, {self.email}, {self.location})"
     
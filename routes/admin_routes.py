@@ -1,6 +1,6 @@
 from flask import Blueprint, jsonify, request
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from routes.auth_routes import require_auth
 
 # Create a Blueprint for admin routes
@@ -16,51 +16,59 @@ def database_stats():
         if user_manager is None:
             return jsonify({'status': 'error', 'message': 'Service not ready'}), 503
         
-        # Get basic stats
-        all_users = user_manager.get_users(active_only=False)
-        active_users = user_manager.get_users(active_only=True)
-        
-        # Calculate stats
-        total_users = len(all_users)
-        active_count = len(active_users)
-        inactive_count = total_users - active_count
-        
-        # Get recent signups (last 7 days)
-        recent_signups = []
-        for user in all_users:
-            try:
-                created_date = datetime.fromisoformat(user.created_at.replace('Z', '+00:00'))
-                days_ago = (datetime.now(created_date.tzinfo) - created_date).days
-                if days_ago <= 7:
-                    recent_signups.append(user)
-            except Exception as e:
-                logging.debug(f"Error parsing date: {e}")
-                continue
+        from services.stats_service import get_database_stats
+        
+        # One aggregate query, cached briefly for dashboard polling
+        force_refresh = request.args.get('refresh', 'false').lower() == 'true'
+        stats = get_database_stats(user_manager, force_refresh=force_refresh)
         
         return jsonify({
             'status': 'success',
             'stats': {
-                'total_users': total_users,
-                'active_users': active_count,
-                'inactive_users': inactive_count,
-                'recent_signups_7_days': len(recent_signups)
+                'total_users': stats['total_users'],
+                'active_users': stats['active_users'],
+                'inactive_users': stats['inactive_users'],
+                'recent_signups_7_days': stats['recent_signups']
             },
             'recent_users': [
                 {
-                    'name': user.name,
-                    'number': user.number,
-                    'location': user.location,
-                    'range_miles': user.range_miles,
-                    'created_at': user.created_at,
-                    'active': getattr(user, 'active', True)
-                } for user in sorted(all_users, key=lambda x: x.created_at, reverse=True)[:5]
-            ]
+                    'name': user['name'],
+                    'number': user['number'],
+                    'location': user['location'],
+                    'range_miles': user['range_miles'],
+                    'created_at': user['created_at'],
+                    'active': user['active'] if user['active'] is not None else True
+                } for user in stats['latest_users']
+            ],
+            'cached_at': datetime.utcfromtimestamp(stats['cached_at']).isoformat()
         }), 200
         
     except Exception as e:
         logging.error(f"Error getting database stats: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@admin_bp.route('/admin/database/cache-stats', methods=['GET'])
+@require_auth
+def cache_stats():
+    """Get user cache, verdict cache and connection pool counters for this worker"""
+    try:
+        from app import user_manager
+        from managers.verdict_cache import get_verdict_cache
+        
+        if user_manager is None:
+            return jsonify({'status': 'error', 'message': 'Service not ready'}), 503
+        
+        return jsonify({
+            'status': 'success',
+            'user_cache': user_manager.cache.stats(),
+            'verdict_cache': get_verdict_cache().stats(),
+            'db_pool': user_manager.db_config.pool_stats()
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error getting cache stats: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @admin_bp.route('/admin/database/users', methods=['GET'])
 @require_auth
 def list_users():
@@ -75,22 +83,33 @@ def list_users():
         active_only = request.args.get('active_only', 'true').lower() == 'true'
         limit = min(int(request.args.get('limit', 50)), 100)  # Max 100 users
         offset = int(request.args.get('offset', 0))
-        
-        users = user_manager.get_users(active_only=active_only)
-        
-        # Sort by created_at (newest first)
-        users = sorted(users, key=lambda x: x.created_at, reverse=True)
-        
-        # Apply pagination
-        paginated_users = users[offset:offset + limit]
+        cursor = request.args.get('cursor')
+        count = request.args.get('count', 'estimate')
+        
+        if count not in ('exact', 'estimate', 'none'):
+            return jsonify({'status': 'error', 'message': 'count must be exact, estimate or none'}), 400
+        
+        # Sorting, paging and counting all happen in SQL
+        try:
+            page = user_manager.get_users_page(
+                active_only=active_only,
+                limit=limit,
+                cursor=cursor,
+                offset=offset,
+                count=count
+            )
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         
         return jsonify({
             'status': 'success',
-            'total_count': len(users),
-            'returned_count': len(paginated_users),
-            'offset': offset,
+            'total_count': page['total_count'],
+            'total_is_estimate': page['total_is_estimate'],
+            'returned_count': len(page['users']),
+            'offset': 0 if cursor else offset,
             'limit': limit,
-            'users': [user.to_dict() for user in paginated_users]
+            'next_cursor': page['next_cursor'],
+            'users': [user.to_dict() for user in page['users']]
         }), 200
         
     except Exception as e:
@@ -134,26 +153,31 @@ def admin_update_user(number):
             return jsonify({'status': 'error', 'message': 'Service not ready'}), 503
         
         data = request.json
-        if not data:
+        if not data or not isinstance(data, dict):
             return jsonify({'status': 'error', 'message': 'No data provided'}), 400
         
-        # Get current user first
-        current_user = user_manager.get_user_by_number(number)
-        if not current_user:
-            return jsonify({'status': 'error', 'message': 'User not found'}), 404
+        # Only user columns reach update_user, so body keys can never collide with its options
+        updatable = user_manager.updatable_fields()
+        fields = {key: value for key, value in data.items() if key in updatable}
+        if not fields:
+            return jsonify({
+                'status': 'error',
+                'message': f"No updatable fields provided (allowed: {', '.join(updatable)})"
+            }), 400
         
-        # Update user with provided data
-        updated_user = user_manager.update_user(number, **data)
+        # Update user with provided data; saving identical data skips the write.
+        # Database errors propagate to the 500 handler below
+        updated_user = user_manager.update_user(number, only_if_changed=True, raise_errors=True, **fields)
         if updated_user:
-            logging.info(f"Admin updated user {number}: {list(data.keys())}")
+            logging.info(f"Admin updated user {number}: {list(fields.keys())}")
             return jsonify({
                 'status': 'success',
                 'message': 'User updated successfully',
                 'user': updated_user.to_dict(),
-                'changes': list(data.keys())
+                'changes': list(fields.keys())
             }), 200
         else:
-            return jsonify({'status': 'error', 'message': 'Update failed'}), 400
+            return jsonify({'status': 'error', 'message': 'User not found'}), 404
             
     except Exception as e:
         logging.error(f"Admin update user error: {e}")
@@ -211,22 +235,17 @@ def admin_reactivate_user(number):
         if user_manager is None:
             return jsonify({'status': 'error', 'message': 'Service not ready'}), 503
         
-        # Check if user exists
-        user = user_manager.get_user_by_number(number)
-        if not user:
-            return jsonify({'status': 'error', 'message': 'User not found'}), 404
-        
-        # Reactivate user
-        updated_user = user_manager.update_user(number, active=True)
+        # Reactivate user (no write if already active)
+        updated_user = user_manager.update_user(number, only_if_changed=True, raise_errors=True, active=True)
         if updated_user:
-            logging.info(f"Admin reactivated user: {user.name} ({number})")
+            logging.info(f"Admin reactivated user: {updated_user.name} ({number})")
             return jsonify({
                 'status': 'success',
                 'message': 'User reactivated successfully',
                 'user': updated_user.to_dict()
             }), 200
         else:
-            return jsonify({'status': 'error', 'message': 'Failed to reactivate user'}), 400
+            return jsonify({'status': 'error', 'message': 'User not found'}), 404
             
     except Exception as e:
         logging.error(f"Admin reactivate user error: {e}")
@@ -248,28 +267,34 @@ def admin_bulk_action():
         
         action = data.get('action')
         user_numbers = data.get('user_numbers', [])
+        user_filter = data.get('filter')
+        
+        if not action or not (user_numbers or user_filter):
+            return jsonify({'status': 'error', 'message': 'Missing action or user_numbers/filter'}), 400
         
-        if not action or not user_numbers:
-            return jsonify({'status': 'error', 'message': 'Missing action or user_numbers'}), 400
+        if action not in ('deactivate', 'reactivate', 'delete'):
+            return jsonify({'status': 'error', 'message': 'Invalid action'}), 400
+        
+        # One statement in one transaction for the whole set
+        try:
+            if action == 'delete':
+                outcomes = user_manager.bulk_delete(numbers=user_numbers, filters=user_filter)
+            else:
+                outcomes = user_manager.bulk_set_active(
+                    action == 'reactivate', numbers=user_numbers, filters=user_filter
+                )
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         
         results = []
+        for number, outcome in outcomes.items():
+            if outcome == 'not_found':
+                results.append({'number': number, 'success': False, 'outcome': outcome, 'error': 'User not found'})
+            else:
+                results.append({'number': number, 'success': True, 'outcome': outcome})
         
-        for number in user_numbers:
-            try:
-                if action == 'deactivate':
-                    success = user_manager.deactivate_user(number)
-                elif action == 'reactivate':
-                    success = user_manager.update_user(number, active=True) is not None
-                elif action == 'delete':
-                    success = user_manager.delete_user(number)
-                else:
-                    results.append({'number': number, 'success': False, 'error': 'Invalid action'})
-                    continue
-                
-                results.append({'number': number, 'success': success})
-                
-            except Exception as e:
-                results.append({'number': number, 'success': False, 'error': str(e)})
+        from services.stats_service import invalidate_stats_cache
+        invalidate_stats_cache()
         
         successful = len([r for r in results if r['success']])
         failed = len(results) - successful
@@ -290,3 +315,168 @@ def admin_bulk_action():
     except Exception as e:
         logging.error(f"Admin bulk action error: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# Most ingest log rows one query or replay returns
+INGEST_LOG_MAX_ROWS = 1000
+
+def _parse_time(value, default):
+    """ISO 8601 or epoch seconds query parameter -> aware UTC datetime"""
+    if not value:
+        return default
+    try:
+        return datetime.fromtimestamp(float(value), tz=timezone.utc)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _ingest_log_range(args):
+    """since/until from a request, defaulting to the last 24 hours"""
+    until = _parse_time(args.get('until'), datetime.now(timezone.utc))
+    since = _parse_time(args.get('since'), until - timedelta(days=1))
+    if since >= until:
+        raise ValueError('since must be before until')
+    return since, until
+
+@admin_bp.route('/admin/ingest-log', methods=['GET'])
+@require_auth
+def ingest_log():
+    """Query inbound group messages and what the pipeline did with each"""
+    try:
+        from managers.ingest_log_manager import IngestLogManager
+        
+        try:
+            since, until = _ingest_log_range(request.args)
+            limit = min(int(request.args.get('limit', 100)), INGEST_LOG_MAX_ROWS)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        manager = IngestLogManager()
+        rows = manager.query(
+            since, until,
+            group_id=request.args.get('group_id'),
+            outcome=request.args.get('outcome'),
+            content_hash=request.args.get('content_hash'),
+            limit=limit,
+            with_content=request.args.get('with_content', 'false').lower() == 'true'
+        )
+        for row in rows:
+            row['received_at'] = row['received_at'].isoformat()
+        
+        return jsonify({
+            'status': 'success',
+            'since': since.isoformat(),
+            'until': until.isoformat(),
+            'outcomes': manager.count_outcomes(since, until),
+            'returned_count': len(rows),
+            'messages': rows
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error querying ingest log: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@admin_bp.route('/admin/ingest-log/replay', methods=['POST'])
+@require_auth
+def replay_ingest_log():
+    """
+    Feed logged messages back through the lead pipeline, oldest first
+    
+    Takes the same filters as GET /admin/ingest-log in the JSON body.
+    Notifications are keyed by lead content and user in the outbox, so
+    users already notified of a replayed lead are not messaged again.
+    """
+    try:
+        from app import user_manager
+        from managers.ingest_log_manager import IngestLogManager
+        from services.lead_pipeline import get_pipeline
+        
+        if user_manager is None:
+            return jsonify({'status': 'error', 'message': 'Service not ready'}), 503
+        
+        data = request.json or {}
+        try:
+            since, until = _ingest_log_range(data)
+            limit = min(int(data.get('limit', 100)), INGEST_LOG_MAX_ROWS)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        rows = IngestLogManager().query(
+            since, until,
+            group_id=data.get('group_id'),
+            outcome=data.get('outcome'),
+            content_hash=data.get('content_hash'),
+            limit=limit,
+            oldest_first=True,
+            with_content=True
+        )
+        messages = [
+            {
+                'id': row['message_id'],
+                'chat_id': row['group_id'],
+                'from': row['sender'],
+                'type': 'text',
+                'text': {'body': row['content']},
+                'timestamp': row['received_at'].timestamp()
+            }
+            for row in rows if row['content']
+        ]
+        
+        if messages and not get_pipeline(user_manager).submit({'messages': messages}):
+            return jsonify({'status': 'error', 'message': 'Pipeline busy'}), 503
+        
+        logging.info(f"Admin replayed {len(messages)} ingest log messages from {since.isoformat()} to {until.isoformat()}")
+        
+        return jsonify({
+            'status': 'success',
+            'message': f'{len(messages)} messages queued for processing',
+            'replayed_count': len(messages),
+            'skipped_count': len(rows) - len(messages)
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error replaying ingest log: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@admin_bp.route('/admin/openai/usage', methods=['GET'])
+@require_auth
+def openai_usage():
+    """OpenAI tokens and spend by day, model, group and subscriber, with today's budget status"""
+    try:
+        from managers.openai_usage_manager import OpenAIUsageManager
+        from services.openai_usage import get_usage_tracker, OPENAI_BUDGET_FALLBACK, OPENAI_FALLBACK_MODEL
+        
+        try:
+            days = min(max(int(request.args.get('days', 7)), 1), 90)
+            limit = min(int(request.args.get('limit', 20)), 100)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        until_day = datetime.now(timezone.utc).date()
+        since_day = until_day - timedelta(days=days - 1)
+        manager = OpenAIUsageManager()
+        
+        by_day = manager.summary(since_day, until_day, 'day', limit=days)
+        for row in by_day:
+            row['day'] = row['day'].isoformat()
+        
+        tracker = get_usage_tracker()
+        return jsonify({
+            'status': 'success',
+            'since': since_day.isoformat(),
+            'until': until_day.isoformat(),
+            'budget': {
+                'daily_budget_usd': tracker.budget_usd or None,
+                'spent_today_usd': round(tracker.spent_today(), 4),
+                'mode': tracker.budget_mode(),
+                'fallback': OPENAI_BUDGET_FALLBACK,
+                'fallback_model': OPENAI_FALLBACK_MODEL
+            },
+            'by_day': by_day,
+            'by_model': manager.summary(since_day, until_day, 'model', limit=limit),
+            'by_group': manager.summary(since_day, until_day, 'group_id', limit=limit),
+            'by_user': manager.summary(since_day, until_day, 'user_id', limit=limit)
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error getting OpenAI usage: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
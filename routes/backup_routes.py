@@ -1,10 +1,19 @@
-from flask import Blueprint, Response, current_app
+from flask import Blueprint, Response, current_app, request
 import os
+import csv
+import zlib
 import subprocess
+import tempfile
 import logging
+from io import StringIO
 from datetime import datetime
 from routes.auth_routes import require_auth
 
+# Rows fetched per round trip from the server-side cursor during CSV export
+CSV_EXPORT_BATCH_SIZE = int(os.getenv('CSV_EXPORT_BATCH_SIZE', 1000))
+# Bytes read from pg_dump per chunk sent to the client
+PG_DUMP_CHUNK_SIZE = 64 * 1024
+
 # Create a Blueprint for backup routes
 backup_bp = Blueprint('backup', __name__)
 
@@ -12,13 +21,17 @@ backup_bp = Blueprint('backup', __name__)
 @require_auth
 def backup_database():
     """
-    Creates a complete database backup and downloads it as a .sql file
+    Creates a complete database backup and downloads it
     
     What it does:
     - Uses PostgreSQL's pg_dump tool to create a full database backup
     - Includes all tables, data, indexes, and schema
-    - Returns the backup as a downloadable .sql file
+    - Streams the dump to the browser as pg_dump produces it
     - Filename includes timestamp for organization
+    
+    Options:
+    - ?format=custom downloads a compressed pg_dump custom archive (.dump, restore with pg_restore)
+    - ?compress=gzip gzips the plain .sql dump on the fly (.sql.gz)
     """
     try:
         # Get database URL from environment
@@ -28,30 +41,9 @@ def backup_database():
         
         # Create a timestamp for the filename
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"recovery_manager_backup_{timestamp}.sql"
         
-        # Use pg_dump to create a complete backup
-        process = subprocess.Popen(
-            ['pg_dump', database_url, '--verbose', '--clean', '--no-owner', '--no-privileges'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        
-        stdout, stderr = process.communicate()
-        
-        if process.returncode != 0:
-            logging.error(f"Backup failed: {stderr.decode()}")
-            return f"Backup failed: {stderr.decode()}", 500
-        
-        # Return the SQL dump as a downloadable file
-        return Response(
-            stdout,
-            mimetype='application/sql',
-            headers={
-                'Content-Disposition': f'attachment; filename={filename}',
-                'Content-Type': 'application/octet-stream'
-            }
-        )
+        command = ['pg_dump', database_url, '--clean', '--no-owner', '--no-privileges']
+        return _pg_dump_response(command, f"recovery_manager_backup_{timestamp}", 'Backup')
         
     except Exception as e:
         logging.error(f"Backup error: {e}")
@@ -68,6 +60,10 @@ def backup_users_table():
     - Smaller file size, faster download
     - Good for regular user data backups
     - Includes all user data: names, numbers, locations, Stripe IDs, etc.
+    
+    Options:
+    - ?inserts=false writes COPY blocks instead of one INSERT per row (smaller, faster to restore)
+    - ?format=custom and ?compress=gzip work as for the full backup
     """
     try:
         # Get database URL from environment
@@ -77,35 +73,90 @@ def backup_users_table():
         
         # Create a timestamp for the filename
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"users_backup_{timestamp}.sql"
-        
-        # Use pg_dump to create a backup of just the users table
-        process = subprocess.Popen(
-            ['pg_dump', database_url, '-t', 'users', '--data-only', '--column-inserts'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        
-        stdout, stderr = process.communicate()
         
-        if process.returncode != 0:
-            logging.error(f"Users backup failed: {stderr.decode()}")
-            return f"Users backup failed: {stderr.decode()}", 500
-        
-        # Return the SQL dump as a downloadable file
-        return Response(
-            stdout,
-            mimetype='application/sql',
-            headers={
-                'Content-Disposition': f'attachment; filename={filename}',
-                'Content-Type': 'application/octet-stream'
-            }
-        )
+        command = ['pg_dump', database_url, '-t', 'users', '--data-only']
+        if request.args.get('inserts', 'true').lower() != 'false':
+            command.append('--column-inserts')
+        return _pg_dump_response(command, f"users_backup_{timestamp}", 'Users backup')
         
     except Exception as e:
         logging.error(f"Users backup error: {e}")
         return f"Error creating users backup: {str(e)}", 500
 
+def _pg_dump_response(command, basename, label):
+    """
+    Run pg_dump and stream its output to the client in chunks
+    
+    stderr goes to a temporary file rather than a pipe so a chatty pg_dump
+    can never block, and is logged if the dump fails. The first chunk is
+    read before responding, so failures that happen straight away (bad
+    credentials, missing table) still return a proper 500.
+    """
+    dump_format = request.args.get('format', 'plain').lower()
+    compress = request.args.get('compress', '').lower() == 'gzip'
+    
+    if dump_format == 'custom':
+        # Custom format is already compressed by pg_dump
+        command = command + ['-Fc']
+        filename = f"{basename}.dump"
+        compress = False
+    elif dump_format == 'plain':
+        filename = f"{basename}.sql.gz" if compress else f"{basename}.sql"
+    else:
+        return "format must be plain or custom", 400
+    
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+    
+    first_chunk = process.stdout.read(PG_DUMP_CHUNK_SIZE)
+    if not first_chunk:
+        process.wait()
+        if process.returncode != 0:
+            error = _read_stderr(stderr_file)
+            stderr_file.close()
+            logging.error(f"{label} failed: {error}")
+            return f"{label} failed: {error}", 500
+    
+    def generate():
+        try:
+            if first_chunk:
+                yield first_chunk
+            while True:
+                chunk = process.stdout.read(PG_DUMP_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+            
+            process.wait()
+            if process.returncode != 0:
+                # Headers are gone already; the error trailer can only be logged
+                logging.error(f"{label} failed mid-stream: {_read_stderr(stderr_file)}")
+        finally:
+            if process.poll() is None:
+                # Client went away before the dump finished
+                process.kill()
+                process.wait()
+                logging.warning(f"{label} aborted before completion")
+            process.stdout.close()
+            stderr_file.close()
+    
+    body = _gzip_stream(generate()) if compress else generate()
+    
+    # Return the dump as a downloadable file
+    return Response(
+        body,
+        mimetype='application/octet-stream',
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            'Content-Type': 'application/octet-stream'
+        }
+    )
+
+def _read_stderr(stderr_file):
+    """Read the tail of pg_dump's stderr for logging"""
+    stderr_file.seek(0)
+    return stderr_file.read()[-4096:].decode(errors='replace')
+
 @backup_bp.route('/admin/backup/export-csv', methods=['GET'])
 @require_auth
 def export_users_csv():
@@ -116,31 +167,60 @@ def export_users_csv():
     - Exports user data in CSV format
     - Easy to open in spreadsheet applications
     - Good for sharing user lists or analysis
+    - Streams rows from a server-side cursor, so memory stays flat
+    - Add ?compress=gzip to download a gzipped .csv.gz instead
     """
     try:
         from app import user_manager
-        import csv
-        from io import StringIO
         
         if user_manager is None:
             return "Service not ready", 503
         
-        # Get all users
-        users = user_manager.get_users(active_only=False)
+        compress = request.args.get('compress', '').lower() == 'gzip'
         
-        # Create CSV in memory
-        output = StringIO()
-        writer = csv.writer(output)
+        # Create filename with timestamp
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"users_export_{timestamp}.csv"
+        
+        if compress:
+            body = _gzip_stream(_generate_users_csv(user_manager))
+            filename += '.gz'
+            mimetype = 'application/gzip'
+        else:
+            body = _generate_users_csv(user_manager)
+            mimetype = 'text/csv'
         
-        # Write header
-        writer.writerow([
-            'Name', 'Phone Number', 'Location', 'Range (Miles)', 
-            'Status', 'Stripe Customer ID', 'Subscription ID', 
-            'Created Date', 'Updated Date'
-        ])
+        # Return CSV file as it is produced
+        return Response(
+            body,
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}'
+            }
+        )
         
-        # Write user data
-        for user in users:
+    except Exception as e:
+        logging.error(f"CSV export error: {e}")
+        return f"Error exporting CSV: {str(e)}", 500
+
+def _generate_users_csv(user_manager, rows_per_chunk=500):
+    """Yield the users CSV in encoded chunks of rows_per_chunk rows"""
+    output = StringIO()
+    writer = csv.writer(output)
+    
+    # Write header first so the first byte goes out immediately
+    writer.writerow([
+        'Name', 'Phone Number', 'Location', 'Range (Miles)', 
+        'Status', 'Stripe Customer ID', 'Subscription ID', 
+        'Created Date', 'Updated Date'
+    ])
+    yield output.getvalue().encode('utf-8')
+    output.seek(0)
+    output.truncate()
+    
+    rows = 0
+    try:
+        for user in user_manager.iter_users(active_only=False, batch_size=CSV_EXPORT_BATCH_SIZE):
             writer.writerow([
                 user.name,
                 user.number,
@@ -152,20 +232,27 @@ def export_users_csv():
                 user.created_at,
                 user.updated_at
             ])
-        
-        # Create filename with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"users_export_{timestamp}.csv"
-        
-        # Return CSV file
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': f'attachment; filename={filename}'
-            }
-        )
-        
+            rows += 1
+            
+            if rows % rows_per_chunk == 0:
+                yield output.getvalue().encode('utf-8')
+                output.seek(0)
+                output.truncate()
     except Exception as e:
-        logging.error(f"CSV export error: {e}")
-        return f"Error exporting CSV: {str(e)}", 500
+        # Headers are already sent; log and end the download early
+        logging.error(f"CSV export failed after {rows} rows: {e}")
+        raise
+    
+    if output.tell():
+        yield output.getvalue().encode('utf-8')
+    
+    logging.info(f"CSV export streamed {rows} users")
+
+def _gzip_stream(chunks):
+    """Gzip-compress an iterable of byte chunks on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
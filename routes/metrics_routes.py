@@ -0,0 +1,42 @@
+from flask import Blueprint, Response, jsonify, request, session
+import os
+import hmac
+import logging
+
+# Create a Blueprint for the Prometheus endpoint
+metrics_bp = Blueprint('metrics', __name__)
+
+# Bearer token Prometheus sends; without one only a logged-in admin can read /metrics
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+def _authorized():
+    """A valid METRICS_TOKEN bearer token, or an admin session"""
+    if METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '')
+        if hmac.compare_digest(supplied, f"Bearer {METRICS_TOKEN}"):
+            return True
+    return 'admin_user' in session
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus text-format metrics, aggregated across gunicorn workers
+
+    Requires the METRICS_TOKEN bearer token or an admin session; with no
+    token configured, scrapers get 401 rather than open metrics.
+    """
+    try:
+        from utils.metrics import render_metrics
+        
+        if not _authorized():
+            return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+        
+        body, content_type = render_metrics()
+        if body is None:
+            return jsonify({'status': 'error', 'message': 'prometheus_client not installed'}), 503
+        
+        return Response(body, status=200, content_type=content_type)
+    
+    except Exception as e:
+        logging.error(f"Error rendering metrics: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
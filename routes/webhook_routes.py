@@ -1,7 +1,11 @@
 from flask import Blueprint, request, jsonify
 import os
+import time
 import logging
 import stripe
+from functools import wraps
+from routes.auth_routes import require_auth
+from utils.metrics import WEBHOOK_MESSAGES, WEBHOOK_REQUEST_SECONDS
 
 # Create a Blueprint for webhook routes
 webhook_bp = Blueprint('webhook', __name__)
@@ -37,7 +41,8 @@ def stripe_webhook():
             logging.error(f"Invalid webhook signature: {e}")
             return jsonify({'status': 'error', 'message': 'Invalid signature'}), 400
         
-        # Handle specific events
+        # Handle specific events. Billing decisions read Postgres directly: this
+        # worker's user cache may not have seen another worker's change yet
         event_type = event['type']
         logging.info(f"Processing Stripe webhook: {event_type}")
         
@@ -51,7 +56,7 @@ def stripe_webhook():
             customer_id = subscription['customer']
             
             # Find and deactivate user
-            user = user_manager.get_user_by_stripe_customer_id(customer_id)
+            user = user_manager.get_user_by_stripe_customer_id(customer_id, use_cache=False)
             if user:
                 user_manager.deactivate_user(user.number)
                 logging.info(f"Deactivated user {user.name} due to subscription cancellation")
@@ -63,7 +68,7 @@ def stripe_webhook():
             customer_id = invoice['customer']
             
             # Ensure user is active
-            user = user_manager.get_user_by_stripe_customer_id(customer_id)
+            user = user_manager.get_user_by_stripe_customer_id(customer_id, use_cache=False)
             if user and not getattr(user, 'active', True):
                 user_manager.update_user(user.number, active=True)
                 logging.info(f"Reactivated user {user.name} due to successful payment")
@@ -73,7 +78,7 @@ def stripe_webhook():
             customer_id = invoice['customer']
             
             # Optionally deactivate user after failed payment
-            user = user_manager.get_user_by_stripe_customer_id(customer_id)
+            user = user_manager.get_user_by_stripe_customer_id(customer_id, use_cache=False)
             if user:
                 logging.warning(f"Payment failed for user {user.name}")
                 # You might want to send a notification or deactivate after multiple failures
@@ -84,12 +89,38 @@ def stripe_webhook():
         logging.error(f"Webhook processing error: {e}", exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def _timed_webhook(view):
+    """Record the handler's latency by response status"""
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = view(*args, **kwargs)
+            status = response[1] if isinstance(response, tuple) else 200
+            return response
+        finally:
+            WEBHOOK_REQUEST_SECONDS.labels(status=str(status)).observe(time.perf_counter() - start)
+    
+    return decorated_function
+
 @webhook_bp.route('/hook/messages', methods=['POST'])
+@_timed_webhook
 def receive_messages():
     """
     Handle incoming group messages
+    
+    The payload is queued for the lead pipeline and the request returns
+    straight away; filtering, matching and WhatsApp delivery happen on the
+    pipeline's background threads.
     """
     try:
+        from app import user_manager
+        from services.lead_pipeline import get_pipeline
+        
+        if user_manager is None:
+            return jsonify({'status': 'error', 'message': 'Service not ready'}), 503
+        
         # Get the JSON data from the request
         data = request.get_json()
         
@@ -97,38 +128,44 @@ def receive_messages():
             logging.warning("Received empty message data")
             return jsonify({'status': 'error', 'message': 'No data provided'}), 400
         
-        # Log the incoming message for debugging
-        logging.info(f"Received group message: {data}")
-        
-        # Extract message information
-        message_type = data.get('type', 'unknown')
-        message_content = data.get('content', '')
-        sender = data.get('sender', 'unknown')
-        timestamp = data.get('timestamp')
-        
-        # Process the message based on type
-        if message_type == 'text':
-            logging.info(f"Text message from {sender}: {message_content}")
-        elif message_type == 'image':
-            logging.info(f"Image message from {sender}")
-        elif message_type == 'location':
-            logging.info(f"Location message from {sender}")
-        else:
-            logging.info(f"Unknown message type '{message_type}' from {sender}")
+        # Message bodies go to the ingest log (see services/ingest_log.py), not the app log
+        received_count = len(data.get('messages') or [])
+        WEBHOOK_MESSAGES.inc(received_count)
+        logging.debug(f"Received {received_count} group messages")
         
-        # Here you can add your specific message processing logic
-        # For example:
-        # - Store the message in database
-        # - Forward to specific users
-        # - Trigger notifications
-        # - Process commands
+        if not get_pipeline(user_manager).submit(data):
+            # Ask Whapi to retry later rather than tying up this worker
+            return jsonify({'status': 'error', 'message': 'Pipeline busy'}), 503
         
         return jsonify({
             'status': 'success', 
-            'message': 'Message received and processed',
-            'received_type': message_type
+            'message': 'Message queued for processing',
+            'received_count': received_count
         }), 200
     
     except Exception as e:
         logging.error(f"Error processing group message: {e}", exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@webhook_bp.route('/hook/pipeline-stats', methods=['GET'])
+@require_auth
+def pipeline_stats():
+    """Queue depth and counters for this worker's lead pipeline, OpenAI and Whapi calls"""
+    from app import user_manager
+    from services.lead_pipeline import get_pipeline
+    from services.openai_service import openai_stats
+    from services.whatsapp_service import whapi_stats
+    from services.outbox_service import get_outbox_drainer
+    from services.openai_usage import get_usage_tracker
+    
+    if user_manager is None:
+        return jsonify({'status': 'error', 'message': 'Service not ready'}), 503
+    
+    return jsonify({
+        'status': 'success',
+        'stages': get_pipeline(user_manager).stats(),
+        'openai': openai_stats(),
+        'whapi': whapi_stats.stats(),
+        'outbox': get_outbox_drainer().stats(),
+        'openai_usage': get_usage_tracker().stats()
+    }), 200
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the in-process message dedup cache
+Compares the old full-text dict + full-scan cleanup with DigestWindow
+for insert, lookup and expiry throughput and retained memory
+
+Usage: python scripts/bench_dedup_cache.py [messages]
+"""
+
+import os
+import sys
+import gc
+import time
+import random
+import string
+import tracemalloc
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.digest_window import DigestWindow
+
+WINDOW = 120
+
+class LegacyDedup:
+    """The previous RECENT_MESSAGES dict keyed by full message text"""
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self.entries = {}
+
+    def seen(self, content, now):
+        timestamp = self.entries.get(content)
+        if timestamp is not None and now - timestamp <= self.window_seconds:
+            return True
+        self.entries[content] = now
+        return False
+
+    def expire(self, now):
+        expired_keys = [key for key, timestamp in self.entries.items()
+                        if now - timestamp > self.window_seconds]
+        for key in expired_keys:
+            del self.entries[key]
+        return len(expired_keys)
+
+def make_bodies(count=200, length=600):
+    """Job-lead sized message bodies (captions, addresses, phone numbers)"""
+    rng = random.Random(42)
+    alphabet = string.ascii_letters + string.digits + ' ' * 10
+    return [''.join(rng.choices(alphabet, k=length)) for _ in range(count)]
+
+def message(bodies, i):
+    # A new string object per call, as each webhook delivers, so nothing reuses a cached hash
+    return f"{i} {bodies[i % len(bodies)]}"
+
+def run(label, make_cache, bodies, count, step=0.01):
+    """
+    Replay `count` unique messages one every `step` seconds, then measure
+    lookups of the live ones and steady-state expiry (one call per message,
+    as the hot path would run it)
+    """
+    base = 1_000_000.0
+    live = int(WINDOW / step)
+
+    def replay(cache):
+        for i in range(count):
+            cache.seen(message(bodies, i), base + i * step)
+
+    # Memory on its own pass; tracemalloc slows everything it traces
+    gc.collect()
+    tracemalloc.start()
+    traced = make_cache()
+    replay(traced)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    cache = make_cache()
+    gc.collect()
+    start = time.perf_counter()
+    replay(cache)
+    insert_time = time.perf_counter() - start
+
+    now = base + (count - 1) * step
+    recent = range(max(count - live, 0), count)
+    gc.collect()
+    start = time.perf_counter()
+    hits = sum(cache.seen(message(bodies, i), now) for i in recent)
+    lookup_time = time.perf_counter() - start
+
+    # Bring both caches to the same steady state (one window of live entries)
+    cache.expire(now)
+    rounds = 1000
+    gc.collect()
+    start = time.perf_counter()
+    expired = sum(cache.expire(now + i * step) for i in range(1, rounds + 1))
+    expire_time = time.perf_counter() - start
+
+    print(f"{label:<13} insert {insert_time / count * 1e6:6.2f} us  "
+          f"lookup {lookup_time / len(recent) * 1e6:6.2f} us  "
+          f"expire {expire_time / rounds * 1e6:8.2f} us/call  "
+          f"{retained / 1024 / 1024:7.1f} MiB retained  "
+          f"({hits} hits, {expired} expired)")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    bodies = make_bodies()
+    print(f"{count} messages of ~600 chars, {WINDOW}s window, one message every 10ms")
+    # The legacy cache was never pruned on the hot path, so it holds every message
+    run('legacy dict', lambda: LegacyDedup(WINDOW), bodies, count)
+    run('DigestWindow', lambda: DigestWindow(WINDOW, max_entries=20000), bodies, count)
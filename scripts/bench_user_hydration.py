@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for building User objects from database rows
+Compares the old RealDictCursor -> dict -> isoformat -> User.from_dict path
+with the slotted User.from_row path, per row and in retained memory
+
+Usage: python scripts/bench_user_hydration.py [rows]
+"""
+
+import os
+import sys
+import gc
+import time
+import uuid
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.user import User
+
+COLUMNS = (
+    'user_id', 'name', 'email', 'password_hash', 'number', 'location', 'range_miles',
+    'stripe_customer_id', 'subscription_id', 'active', 'created_at', 'updated_at'
+)
+
+class DictUser:
+    """The previous User layout: a plain object with a per-instance __dict__"""
+
+    def __init__(self, name, email, number, location, range_miles,
+                 password_hash=None, stripe_customer_id=None, subscription_id=None,
+                 user_id=None, active=True, created_at=None, updated_at=None):
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.password_hash = password_hash
+        self.number = number
+        self.location = location
+        self.range_miles = range_miles
+        self.stripe_customer_id = stripe_customer_id
+        self.subscription_id = subscription_id
+        self.active = active
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            user_id=data.get('user_id'),
+            name=data.get('name'),
+            email=data.get('email'),
+            password_hash=data.get('password_hash'),
+            number=data.get('number'),
+            location=data.get('location'),
+            range_miles=data.get('range_miles'),
+            stripe_customer_id=data.get('stripe_customer_id'),
+            subscription_id=data.get('subscription_id'),
+            active=data.get('active', True),
+            created_at=data.get('created_at'),
+            updated_at=data.get('updated_at')
+        )
+
+def make_rows(count):
+    """Fake rows shaped like SELECT * FROM users"""
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        created = base + timedelta(minutes=i)
+        rows.append((
+            str(uuid.uuid4()), f"User {i}", f"user{i}@example.com", None,
+            f"4477{i:08d}", "Birmingham", 25, f"cus_{i:014d}", f"sub_{i:014d}",
+            True, created, created
+        ))
+    return rows
+
+def legacy_hydrate(rows):
+    """RealDictCursor row -> dict -> isoformat timestamps -> from_dict"""
+    users = []
+    for row in rows:
+        user_data = dict(zip(COLUMNS, row))  # what RealDictCursor builds per row
+        user_data = dict(user_data)  # the copy UserManager made with dict(row)
+        if user_data.get('created_at'):
+            user_data['created_at'] = user_data['created_at'].isoformat()
+        if user_data.get('updated_at'):
+            user_data['updated_at'] = user_data['updated_at'].isoformat()
+        users.append(DictUser.from_dict(user_data))
+    return users
+
+def slotted_hydrate(rows):
+    """Tuple row -> User.from_row with a column index built once"""
+    column_index = User.column_index(COLUMNS)
+    return [User.from_row(row, column_index) for row in rows]
+
+def measure(label, hydrate, rows, repeats=3):
+    best = None
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        users = hydrate(rows)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        del users
+
+    gc.collect()
+    tracemalloc.start()
+    users = hydrate(rows)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del users
+
+    per_row_us = best / len(rows) * 1e6
+    print(f"{label:<10} {per_row_us:8.2f} us/row  {best * 1000:8.1f} ms total  "
+          f"{retained / len(rows):7.0f} B/row retained  {peak / 1024 / 1024:7.1f} MiB peak")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rows = make_rows(count)
+    print(f"Hydrating {count} users (best of 3)")
+    measure('legacy', legacy_hydrate, rows)
+    measure('slotted', slotted_hydrate, rows)
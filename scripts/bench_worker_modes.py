@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark gunicorn worker modes for I/O-bound requests
+Runs the same tiny app, which makes one slow outbound HTTP call per request
+(standing in for OpenAI/Whapi/Stripe), under the current gthread setup and
+under gevent, and reports throughput and latency at a given concurrency
+
+Usage: python scripts/bench_worker_modes.py [concurrent_requests] [upstream_delay_ms]
+Requires gunicorn, gevent and requests (see requirements.txt)
+
+Sample run (1 vCPU, Python 3.11, gunicorn 20.1.0, gevent 26.9.0), 200 ms upstream:
+    200 concurrent  gthread 4x1      7.1-7.3 req/s  p50 6.9-7.6 s  p99 26.8-27.6 s
+                    gevent 4x1000  154-171 req/s    p50 0.61 s     p99 0.88-0.91 s
+     50 concurrent  gthread 4x1      7.0 req/s      p50 2.3 s      p99 7.1 s
+                    gevent 4x1000   74.9 req/s      p50 0.54 s     p99 0.62 s
+This only measures waiting on outbound HTTP; it does not exercise
+Postgres (psycogreen) or the lead pipeline, so gevent stays opt-in.
+"""
+
+import os
+import sys
+import time
+import socket
+import signal
+import subprocess
+import http.client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODES = {
+    # What gunicorn_config.py runs today: 4 workers x 1 thread
+    'gthread 4x1': ['-k', 'gthread', '--workers', '4', '--threads', '1'],
+    'gevent 4x1000': ['-k', 'gevent', '--workers', '4', '--worker-connections', '1000'],
+}
+
+def app(environ, start_response):
+    """WSGI app: one outbound call to the slow upstream per request"""
+    session = _session()
+    response = session.get(os.environ['BENCH_UPSTREAM_URL'], timeout=30)
+    body = response.content
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))])
+    return [body]
+
+_thread_local = threading.local()
+
+def _session():
+    import requests
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = _thread_local.session = requests.Session()
+    return session
+
+class SlowUpstream(BaseHTTPRequestHandler):
+    delay = 0.2
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def fire(port):
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        conn.request('GET', '/')
+        ok = conn.getresponse().status == 200
+    except OSError:
+        ok = False
+    finally:
+        conn.close()
+    return ok, time.perf_counter() - start
+
+def run_mode(label, args, upstream_url, concurrency):
+    port = free_port()
+    env = dict(os.environ, BENCH_UPSTREAM_URL=upstream_url, PYTHONPATH=SCRIPTS_DIR)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', *args, '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'bench_worker_modes:app'],
+        env=env
+    )
+    try:
+        if not wait_for_port(port):
+            print(f"{label}: gunicorn did not start")
+            return
+        fire(port)  # warm up
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _: fire(port), range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for _, latency in results)
+        ok = sum(1 for success, _ in results if success)
+        p = lambda fraction: latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] * 1000
+        print(f"{label:<14} {ok}/{concurrency} ok  {concurrency / elapsed:8.1f} req/s  "
+              f"p50 {p(0.50):8.0f} ms  p99 {p(0.99):8.0f} ms  wall {elapsed:6.2f} s")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+if __name__ == "__main__":
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    SlowUpstream.delay = delay_ms / 1000
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), SlowUpstream)
+    upstream.daemon_threads = True
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    upstream_url = f"http://127.0.0.1:{upstream.server_port}/"
+
+    print(f"{concurrency} concurrent requests, each making one {delay_ms:.0f} ms outbound call")
+    for label, args in MODES.items():
+        run_mode(label, args, upstream_url, concurrency)
+    upstream.shutdown()
@@ -1,11 +1,16 @@
 # This file makes the services directory a Python package
-from services.whatsapp_service import send_whapi_request, set_hook, send_message
-from services.openai_service import generate_response_for_user, get_openai_client
+from services.whatsapp_service import send_whapi_request, set_hook, send_message, send_bulk_messages
+from services.openai_service import generate_response_for_user, extract_job_locations, get_openai_client
+from services.stats_service import get_database_stats, invalidate_stats_cache
 
 __all__ = [
     'send_whapi_request', 
     'set_hook', 
     'send_message',
+    'send_bulk_messages',
     'generate_response_for_user',
-    'get_openai_client'
+    'extract_job_locations',
+    'get_openai_client',
+    'get_database_stats',
+    'invalidate_stats_cache'
 ]
@@ -0,0 +1,287 @@
+import os
+import re
+import csv
+import math
+import logging
+from functools import lru_cache
+
+# Handle numpy import gracefully
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    logging.warning("numpy not available. Geo matching will use the pure Python fallback.")
+
+# Bundled UK postcode-area and town centroids (no districts)
+DEFAULT_PLACES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'uk_places.csv')
+# Optional extra gazetteer (same kind,name,lat,lon columns), e.g. postcode district centroids;
+# without one every postcode resolves to its area's centroid and is only trusted in user settings
+GEO_PLACES_FILE = os.getenv('GEO_PLACES_FILE')
+
+EARTH_RADIUS_MILES = 3958.8
+# Longest place name, in words, looked up in message text
+MAX_PLACE_WORDS = 4
+
+# Full postcode (B12 0AB) or outward code on its own (B12, SW1A)
+FULL_POSTCODE_RE = re.compile(r'\b([A-Z]{1,2})(\d[A-Z\d]?)\s*\d[A-Z]{2}\b')
+OUTWARD_CODE_RE = re.compile(r'\b([A-Z]{1,2})(\d[A-Z\d]?)\b')
+# An outward code on its own only counts after one of these words ("in LS1", "postcode B12")
+OUTWARD_CONTEXT_RE = re.compile(r'\b(?:IN|NEAR|AT|AROUND|FROM|TO|POSTCODE|PC|AREA)[\s:]*$')
+# Current-style number plate (BD51 SMR): the "outward code" is the plate's first half
+PLATE_SUFFIX_RE = re.compile(r'\s?[A-Z]{3}\b')
+# A bare outward code in these single-letter areas is far more likely a road (M6, M25)
+AMBIGUOUS_OUTWARD_AREAS = {'M'}
+# Model and chassis codes that are also real outward codes; only trusted inside a full postcode
+MODEL_CODES = {
+    'S1', 'S2', 'S3', 'S4', 'S5', 'S6', 'S7', 'S8', 'E30', 'E36', 'E39', 'E46', 'E60', 'E90', 'E92',
+    'ST1', 'ST2', 'ST3', 'N1', 'B5', 'B6', 'B7', 'B8', 'W8', 'L1', 'L2', 'L3', 'L4', 'W1', 'W2'
+}
+# Place names that are also everyday words; only trusted when capitalized ("Reading", not "reading")
+COMMON_WORD_PLACES = {'reading', 'bath', 'hull', 'rugby'}
+# A place name followed by one of these is a street ("London Road, Leicester"), not the place
+STREET_SUFFIXES = {
+    'road', 'rd', 'street', 'st', 'lane', 'ln', 'avenue', 'ave', 'way', 'close', 'drive', 'dr',
+    'crescent', 'cres', 'place', 'terrace', 'grove', 'gardens', 'court', 'square', 'row',
+    'walk', 'mews', 'parade', 'boulevard'
+}
+WORD_RE = re.compile(r"[a-z]+")
+ORIGINAL_WORD_RE = re.compile(r"[A-Za-z]+")
+
+@lru_cache(maxsize=1)
+def load_places():
+    """
+    Load the gazetteer
+
+    Returns:
+        tuple: (places, postcodes) dicts of lowercase name / uppercase code -> (lat, lon)
+    """
+    places = {}
+    postcodes = {}
+    for path in (DEFAULT_PLACES_FILE, GEO_PLACES_FILE):
+        if not path:
+            continue
+        try:
+            with open(path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    point = (float(row['lat']), float(row['lon']))
+                    if row['kind'] in ('area', 'district'):
+                        postcodes[row['name'].upper().replace(' ', '')] = point
+                    else:
+                        places[_normalize_place(row['name'])] = point
+        except OSError as e:
+            logging.error(f"Could not load gazetteer {path}: {e}")
+
+    logging.info(f"Loaded {len(places)} places and {len(postcodes)} postcode areas/districts")
+    return places, postcodes
+
+def _normalize_place(name):
+    return ' '.join(WORD_RE.findall(name.lower().replace("'", '')))
+
+def _lookup_postcode(area, district):
+    """
+    Most precise centroid known for a postcode: the district's if
+    GEO_PLACES_FILE supplies district centroids, else the area's
+
+    Returns:
+        tuple: ((lat, lon) or None, True if the point is only the area's)
+    """
+    _, postcodes = load_places()
+    point = postcodes.get(f"{area}{district}")
+    if point:
+        return point, False
+    return postcodes.get(area), True
+
+def scan_locations(text, strict=True):
+    """
+    Find UK postcodes and known place names in free text, separating the
+    ones that can be trusted from the ones that might be something else
+
+    Postcodes are only trusted where GEO_PLACES_FILE supplies their
+    district's centroid. One that resolves to just its area centroid (with
+    the bundled gazetteer, every one) is ambiguous, as in areas like EX,
+    TR or IV that point can be tens of miles out. A district-level outward
+    code on its own (LS1) is trusted when it follows a word like "in",
+    "near" or "postcode"; otherwise, and whenever it looks like half of a
+    number plate (BD51 SMR) or a model code (S3, E46), it is ambiguous. A
+    code that is the whole text (a user's location) is always trusted.
+    Place names that are also everyday words count only when capitalized,
+    and names followed by a street suffix (London Road) are skipped.
+
+    Args:
+        text (str): Message or user location
+        strict (bool): False accepts ambiguous hits too, for text that is
+                       known to be a location (a subscriber's own setting)
+
+    Returns:
+        tuple: (locations, ambiguous) where locations is a list of
+               (label, lat, lon) tuples and ambiguous lists the labels of
+               hits that were left out because they may not be places
+    """
+    if not text:
+        return [], []
+
+    found = {}
+    ambiguous = []
+    upper = text.upper()
+    standalone = upper.strip()
+
+    for match in FULL_POSTCODE_RE.finditer(upper):
+        point, coarse = _lookup_postcode(match.group(1), match.group(2))
+        if not point:
+            continue
+        if coarse and strict:
+            ambiguous.append(match.group(0))
+        else:
+            found[match.group(0)] = point
+
+    outward_text = FULL_POSTCODE_RE.sub(lambda m: ' ' * len(m.group(0)), upper)
+    for match in OUTWARD_CODE_RE.finditer(outward_text):
+        area, district = match.group(1), match.group(2)
+        point, coarse = _lookup_postcode(area, district)
+        if not point:
+            continue
+        code = match.group(0)
+        if standalone == code or not strict:
+            found[code] = point
+        elif (coarse or area in AMBIGUOUS_OUTWARD_AREAS or code in MODEL_CODES
+              or PLATE_SUFFIX_RE.match(outward_text, match.end())
+              or not OUTWARD_CONTEXT_RE.search(outward_text, 0, match.start())):
+            ambiguous.append(code)
+        else:
+            found[code] = point
+
+    places, _ = load_places()
+    cleaned = text.replace("'", '')
+    spans = [match.span() for match in ORIGINAL_WORD_RE.finditer(cleaned)]
+    originals = [cleaned[start:end] for start, end in spans]
+    words = [word.lower() for word in originals]
+    i = 0
+    while i < len(words):
+        # Prefer the longest name starting at this word ("stoke on trent" over "stoke")
+        for size in range(min(MAX_PLACE_WORDS, len(words) - i), 0, -1):
+            name = ' '.join(words[i:i + size])
+            point = places.get(name)
+            if point:
+                end = i + size
+                if (end < len(words) and words[end] in STREET_SUFFIXES
+                        and cleaned[spans[end - 1][1]:spans[end][0]].isspace()):
+                    # A street named after the place, not the place itself
+                    pass
+                elif strict and name in COMMON_WORD_PLACES and not originals[i][0].isupper():
+                    ambiguous.append(name)
+                else:
+                    found[name] = point
+                i += size
+                break
+        else:
+            i += 1
+
+    return [(label, lat, lon) for label, (lat, lon) in found.items()], ambiguous
+
+def location_key(locations, ambiguous):
+    """
+    Order-independent key for every place a scan_locations result names,
+    trusted or ambiguous, ignoring postcode spacing
+    """
+    labels = [label for label, _, _ in locations] + list(ambiguous)
+    return frozenset(label.replace(' ', '') for label in labels)
+
+def find_locations(text):
+    """
+    Find every UK postcode and known place name in free text that can be
+    trusted (see scan_locations)
+
+    Args:
+        text (str): Message or user location
+
+    Returns:
+        list: (label, lat, lon) tuples, in no particular order
+    """
+    return scan_locations(text)[0]
+
+@lru_cache(maxsize=4096)
+def geocode(location):
+    """
+    Resolve a single location string (postcode or place) to a point
+
+    Returns:
+        tuple: (lat, lon), or None if nothing in the string is known
+    """
+    locations, _ = scan_locations(location, strict=False)
+    if not locations:
+        return None
+    _, lat, lon = locations[0]
+    return lat, lon
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in miles"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+class GeoIndex:
+    """
+    Subscribers' home points and ranges, ready for one vectorized match
+
+    Users whose location cannot be geocoded are kept aside in `unresolved`
+    so the caller can fall back to another matcher for them.
+    """
+
+    def __init__(self, users):
+        self.users = []
+        self.unresolved = []
+        points = []
+        ranges = []
+
+        for user in users:
+            point = geocode(user.location)
+            if point is None:
+                self.unresolved.append(user)
+                continue
+            self.users.append(user)
+            points.append(point)
+            ranges.append(float(user.range_miles or 0))
+
+        if self.unresolved:
+            logging.info(f"{len(self.unresolved)} users have locations the gazetteer cannot resolve")
+
+        if NUMPY_AVAILABLE:
+            coords = np.radians(np.array(points, dtype=np.float64).reshape(-1, 2))
+            self._lat = coords[:, 0]
+            self._lon = coords[:, 1]
+            self._cos_lat = np.cos(self._lat)
+            self._range = np.array(ranges, dtype=np.float64)
+        else:
+            self._points = points
+            self._ranges = ranges
+
+    def match(self, locations):
+        """
+        Users within range of any of the given locations
+
+        Args:
+            locations (list): (label, lat, lon) tuples from find_locations
+
+        Returns:
+            list: Matching users
+        """
+        if not locations or not self.users:
+            return []
+
+        if not NUMPY_AVAILABLE:
+            return [
+                user for user, (lat, lon), range_miles in zip(self.users, self._points, self._ranges)
+                if any(haversine_miles(lat, lon, job_lat, job_lon) <= range_miles
+                       for _, job_lat, job_lon in locations)
+            ]
+
+        # One haversine pass: job locations x users
+        job = np.radians(np.array([(lat, lon) for _, lat, lon in locations], dtype=np.float64))
+        job_lat = job[:, 0:1]
+        job_lon = job[:, 1:2]
+        a = (np.sin((self._lat - job_lat) / 2) ** 2
+             + np.cos(job_lat) * self._cos_lat * np.sin((self._lon - job_lon) / 2) ** 2)
+        distances = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        within = (distances.min(axis=0) <= self._range).nonzero()[0]
+        return [self.users[i] for i in within]
@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from managers.ingest_log_manager import IngestLogManager
+from utils.batch_writer import BatchWriter
+
+# Records written per INSERT, and the longest a record waits to be written (seconds)
+INGEST_LOG_BATCH_SIZE = int(os.getenv('INGEST_LOG_BATCH_SIZE', 500))
+INGEST_LOG_FLUSH_INTERVAL = float(os.getenv('INGEST_LOG_FLUSH_INTERVAL', 2))
+# Records buffered per worker before new ones are dropped
+INGEST_LOG_QUEUE_SIZE = int(os.getenv('INGEST_LOG_QUEUE_SIZE', 20000))
+# Days of history kept; older day partitions are dropped
+INGEST_LOG_RETENTION_DAYS = int(os.getenv('INGEST_LOG_RETENTION_DAYS', 14))
+# Day partitions created ahead of time, and how often maintenance runs (seconds)
+INGEST_LOG_PARTITIONS_AHEAD = int(os.getenv('INGEST_LOG_PARTITIONS_AHEAD', 2))
+INGEST_LOG_MAINTENANCE_INTERVAL = float(os.getenv('INGEST_LOG_MAINTENANCE_INTERVAL', 3600))
+
+def _as_datetime(timestamp):
+    """Whapi epoch seconds (or None) -> aware UTC datetime"""
+    try:
+        return datetime.fromtimestamp(float(timestamp), tz=timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return datetime.now(timezone.utc)
+
+class IngestLog:
+    """Per-worker asynchronous writer for the message ingest log"""
+
+    def __init__(self, manager=None):
+        self.manager = manager or IngestLogManager()
+        self.writer = BatchWriter(
+            'ingest-log',
+            self.manager.insert_batch,
+            max_batch=INGEST_LOG_BATCH_SIZE,
+            flush_interval=INGEST_LOG_FLUSH_INTERVAL,
+            max_queue=INGEST_LOG_QUEUE_SIZE
+        )
+
+    def start(self):
+        self.writer.start()
+        threading.Thread(target=self._maintain, name='ingest-log-maintenance', daemon=True).start()
+
+    def _maintain(self):
+        """Create upcoming day partitions and drop expired ones, then repeat"""
+        while True:
+            try:
+                today = datetime.now(timezone.utc).date()
+                self.manager.ensure_partitions(today + timedelta(days=i) for i in range(INGEST_LOG_PARTITIONS_AHEAD + 1))
+                self.manager.drop_partitions_before(today - timedelta(days=INGEST_LOG_RETENTION_DAYS))
+            except Exception as e:
+                logging.error(f"Ingest log maintenance failed: {e}")
+            time.sleep(INGEST_LOG_MAINTENANCE_INTERVAL)
+
+    def record(self, outcome, message_id=None, group_id=None, sender=None, message_type=None,
+               content=None, content_hash=None, matched_count=None, received_at=None, detail=None):
+        """
+        Queue one ingest record; never blocks or raises
+
+        Args:
+            outcome (str): What the pipeline did with the message
+            received_at: Whapi epoch timestamp; defaults to now
+            detail (dict): Extra outcome fields (stored as JSONB)
+        """
+        return self.writer.add({
+            'received_at': _as_datetime(received_at),
+            'message_id': message_id,
+            'group_id': group_id,
+            'sender': sender,
+            'message_type': message_type,
+            'content_hash': content_hash,
+            'content': content,
+            'outcome': outcome,
+            'matched_count': matched_count,
+            'detail': detail
+        })
+
+    def stats(self):
+        return self.writer.stats()
+
+_ingest_log = None
+_ingest_log_pid = None
+_ingest_log_lock = threading.Lock()
+
+def get_ingest_log():
+    """Get this worker's ingest log writer, starting it on first use"""
+    global _ingest_log, _ingest_log_pid
+
+    pid = os.getpid()
+    if _ingest_log is None or _ingest_log_pid != pid:
+        with _ingest_log_lock:
+            if _ingest_log is None or _ingest_log_pid != pid:
+                ingest_log = IngestLog()
+                ingest_log.start()
+                _ingest_log = ingest_log
+                _ingest_log_pid = pid
+    return _ingest_log
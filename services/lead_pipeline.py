@@ -0,0 +1,501 @@
+import os
+import time
+import heapq
+import queue
+import logging
+import threading
+
+from utils.message_utils import (
+    ALLOWED_GROUP_IDS, extract_message_content, is_duplicate_message, message_hash, start_message_cache_cleanup
+)
+from managers.outbox_manager import OutboxManager, notification_key
+from services.openai_service import DEFERRED, OpenAIDeferred, generate_response_for_user, extract_job_locations
+from services.geo_matcher import GeoIndex, location_key, scan_locations
+from services.whatsapp_service import send_bulk_messages
+from services.outbox_service import get_outbox_drainer
+from services.ingest_log import get_ingest_log
+from services.openai_usage import get_usage_tracker
+from utils.near_duplicate import NearDuplicateIndex
+
+# Maximum items waiting in front of each stage
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 200))
+# Worker threads per stage; match and deliver do slow OpenAI / Whapi calls
+PIPELINE_MATCH_WORKERS = int(os.getenv('PIPELINE_MATCH_WORKERS', 2))
+PIPELINE_DELIVER_WORKERS = int(os.getenv('PIPELINE_DELIVER_WORKERS', 2))
+# Seconds a stage waits for room downstream before dropping an item
+PIPELINE_PUT_TIMEOUT = float(os.getenv('PIPELINE_PUT_TIMEOUT', 30))
+# Seconds the active subscriber list is reused between leads
+PIPELINE_USERS_TTL = float(os.getenv('PIPELINE_USERS_TTL', 60))
+# How OpenAI is used when a lead has no location we can read locally:
+# 'extract' asks once per message for its places, 'per_user' asks once per subscriber
+LLM_MATCH_MODE = os.getenv('LLM_MATCH_MODE', 'extract').lower()
+# Leads OpenAI could not answer are retried after this delay (doubling each time)
+PIPELINE_RETRY_DELAY = float(os.getenv('PIPELINE_RETRY_DELAY', 30))
+# Attempts at matching a lead before it is given up on
+PIPELINE_MAX_ATTEMPTS = int(os.getenv('PIPELINE_MAX_ATTEMPTS', 4))
+
+class JobLead:
+    """A group message moving through the pipeline"""
+
+    __slots__ = ('message_id', 'group_id', 'sender', 'content', 'received_at', 'message_type',
+                 'matched_users', 'attempts', 'pending_users', 'llm_calls', 'llm_usage', 'scan',
+                 'extracted', 'locations')
+
+    def __init__(self, message_id, group_id, sender, content, received_at=None, message_type=None):
+        self.message_id = message_id
+        self.group_id = group_id
+        self.sender = sender
+        self.content = content
+        self.received_at = received_at or time.time()
+        self.message_type = message_type
+        self.matched_users = []
+        # Retries only: how many match attempts so far, and the users still to check
+        self.attempts = 1
+        self.pending_users = None
+        # OpenAI requests made matching this lead, credited as saved when a near-duplicate is skipped
+        self.llm_calls = 0
+        # OpenAI tokens and cost spent on this lead, across all its attempts
+        self.llm_usage = {}
+        # scan_locations(content), once dedup has looked
+        self.scan = None
+        # What OpenAI extracted, if it was asked, and every location the lead was matched on
+        self.extracted = None
+        self.locations = None
+
+    def retry(self, pending_users=None):
+        """Copy of this lead for another match attempt"""
+        lead = JobLead(self.message_id, self.group_id, self.sender, self.content, self.received_at, self.message_type)
+        lead.attempts = self.attempts + 1
+        lead.pending_users = pending_users
+        lead.llm_usage = self.llm_usage
+        lead.scan = self.scan
+        lead.extracted = self.extracted
+        lead.locations = self.locations
+        return lead
+
+    def __repr__(self):
+        return f"JobLead({self.message_id}, {self.group_id})"
+
+class Stage:
+    """
+    One pipeline stage: a bounded queue drained by a fixed number of threads
+
+    The handler takes one item and returns an iterable of items for the
+    next stage. A full downstream queue blocks the worker (backpressure)
+    for up to PIPELINE_PUT_TIMEOUT seconds, then the item is dropped.
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=PIPELINE_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next_stage = None
+        self._threads = []
+
+        self.processed = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"pipeline-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item, block=True, timeout=None):
+        """Queue an item for this stage; returns False if the queue stayed full"""
+        try:
+            self.queue.put(item, block=block, timeout=timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logging.warning(f"Pipeline stage '{self.name}' is full, dropping {item!r}")
+            return False
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                for output in self.handler(item) or ():
+                    if self.next_stage is not None:
+                        self.next_stage.put(output, timeout=PIPELINE_PUT_TIMEOUT)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Pipeline stage '{self.name}' failed on {item!r}: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'capacity': self.queue.maxsize,
+            'workers': self.workers,
+            'processed': self.processed,
+            'errors': self.errors,
+            'dropped': self.dropped
+        }
+
+class RetryScheduler:
+    """One thread that puts items back on a stage once their delay has passed"""
+
+    def __init__(self, name='pipeline-retry'):
+        self.name = name
+        self._heap = []  # (due_at, sequence, stage, item)
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+        self.scheduled = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, stage, item, delay):
+        with self._condition:
+            self._sequence += 1
+            self.scheduled += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._sequence, stage, item))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                _, _, stage, item = heapq.heappop(self._heap)
+            stage.put(item, timeout=PIPELINE_PUT_TIMEOUT)
+
+    def stats(self):
+        with self._condition:
+            return {'waiting': len(self._heap), 'scheduled': self.scheduled}
+
+class LeadPipeline:
+    """
+    Job-lead fan-out: ingest -> group filter -> dedup -> match -> deliver
+
+    The webhook only calls submit(), which never blocks; everything slow
+    runs on the stage threads inside the worker process.
+    """
+
+    def __init__(self, user_manager):
+        self.user_manager = user_manager
+        self._users = []
+        self._geo_index = GeoIndex([])
+        self._users_loaded_at = 0.0
+        self._users_lock = threading.Lock()
+
+        self.stages = [
+            Stage('ingest', self._ingest),
+            Stage('filter', self._filter_group),
+            Stage('dedup', self._dedup),
+            Stage('match', self._match, workers=PIPELINE_MATCH_WORKERS),
+            Stage('deliver', self._deliver, workers=PIPELINE_DELIVER_WORKERS)
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+        self.match_stage = self.stages[3]
+        self.retries = RetryScheduler()
+        self.abandoned = 0
+        self.near_duplicates = NearDuplicateIndex()
+        self.outbox = OutboxManager()
+        self.drainer = None
+        self.ingest_log = None
+        self.llm_calls_saved = 0
+        self.notifications_saved = 0
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        self.retries.start()
+        self.drainer = get_outbox_drainer()
+        self.ingest_log = get_ingest_log()
+        start_message_cache_cleanup()
+        logging.info(f"Lead pipeline started in pid {os.getpid()}")
+
+    def submit(self, payload):
+        """Hand a webhook payload to the pipeline without blocking"""
+        return self.stages[0].put(payload, block=False)
+
+    def stats(self):
+        stats = {stage.name: stage.stats() for stage in self.stages}
+        stats['retry'] = dict(self.retries.stats(), abandoned=self.abandoned)
+        stats['near_duplicates'] = dict(
+            self.near_duplicates.stats(),
+            llm_calls_saved=self.llm_calls_saved,
+            notifications_saved=self.notifications_saved
+        )
+        if self.ingest_log is not None:
+            stats['ingest_log'] = self.ingest_log.stats()
+        return stats
+
+    def _record(self, lead, outcome, matched_count=None, detail=None):
+        """
+        Write what happened to a lead to the ingest log
+
+        detail also carries what the match decision was based on: the
+        gazetteer's trusted and ambiguous hits, OpenAI's extraction and the
+        locations finally matched, each once the lead has got that far.
+        """
+        if self.ingest_log is None:
+            return
+        detail = dict(detail or {})
+        if lead.scan is not None:
+            locations, ambiguous = lead.scan
+            detail['gazetteer'] = {'locations': _location_labels(locations), 'ambiguous': list(ambiguous)}
+        if lead.extracted is not None:
+            detail['extracted'] = lead.extracted
+        if lead.locations is not None:
+            detail['locations'] = _location_labels(lead.locations)
+        if lead.llm_usage:
+            detail['llm_tokens'] = lead.llm_usage['tokens']
+            detail['llm_cost_usd'] = round(lead.llm_usage['cost_usd'], 6)
+        self.ingest_log.record(
+            outcome,
+            message_id=lead.message_id,
+            group_id=lead.group_id,
+            sender=lead.sender,
+            message_type=lead.message_type,
+            content=lead.content,
+            content_hash=message_hash(lead.content),
+            matched_count=matched_count,
+            received_at=lead.received_at,
+            detail=detail or None
+        )
+
+    def _subscribers(self):
+        """
+        Active subscribers and their geo index, rebuilt at most every
+        PIPELINE_USERS_TTL seconds
+        """
+        with self._users_lock:
+            if time.time() - self._users_loaded_at > PIPELINE_USERS_TTL:
+                self._users = self.user_manager.get_users(active_only=True)
+                self._geo_index = GeoIndex(self._users)
+                self._users_loaded_at = time.time()
+            return self._users, self._geo_index
+
+    def _ingest(self, payload):
+        """Split a Whapi webhook payload into individual messages"""
+        messages = payload.get('messages') or []
+        for message in messages:
+            if not message.get('from_me'):
+                yield message
+
+    def _filter_group(self, message):
+        """Keep messages from allowed groups that carry text"""
+        group_id = message.get('chat_id')
+        if group_id not in ALLOWED_GROUP_IDS:
+            # Other groups' text is not kept, only that something arrived
+            outcome, content = 'ignored_group', None
+        else:
+            content = extract_message_content(message)
+            outcome = None if content else 'no_content'
+
+        if outcome:
+            if self.ingest_log is not None:
+                self.ingest_log.record(
+                    outcome,
+                    message_id=message.get('id'),
+                    group_id=group_id,
+                    sender=message.get('from'),
+                    message_type=message.get('type'),
+                    received_at=message.get('timestamp')
+                )
+            return
+
+        yield JobLead(
+            message_id=message.get('id'),
+            group_id=group_id,
+            sender=message.get('from'),
+            content=content,
+            received_at=message.get('timestamp'),
+            message_type=message.get('type')
+        )
+
+    def _dedup(self, lead):
+        """
+        Drop exact repeats (shared across workers), then lightly edited reposts
+
+        A repost must name the same places as the original: the same
+        template sent for another town is a different job.
+        """
+        if is_duplicate_message(lead.content):
+            logging.info(f"Skipping duplicate lead {lead.message_id} from {lead.group_id}")
+            self._record(lead, 'duplicate')
+            return
+
+        lead.scan = scan_locations(lead.content)
+        is_near_duplicate, original = self.near_duplicates.check(
+            lead.content, value=lead, key=location_key(*lead.scan)
+        )
+        if is_near_duplicate:
+            # The original has usually finished matching by now; its cost is what this skip saved
+            self.llm_calls_saved += original.llm_calls
+            self.notifications_saved += len(original.matched_users)
+            logging.info(f"Skipping lead {lead.message_id} from {lead.group_id}: near-duplicate of {original.message_id}")
+            self._record(lead, 'near_duplicate', detail={'original_message_id': original.message_id})
+            return
+        yield lead
+
+    def _match(self, lead):
+        """
+        Match the lead against subscribers by distance
+
+        Locations found in the message are compared with every subscriber in
+        one vectorized pass. When the message has no location we can read
+        locally, or has tokens that may or may not be places (a plate like
+        BD51 SMR, a model code like S3, a postcode only known to area level),
+        OpenAI extracts its places once and
+        those are matched the same way. Per-user OpenAI calls are only made for subscribers whose
+        own location the gazetteer does not know, or in 'per_user' mode.
+
+        If OpenAI defers (rate limited or down), the lead is scheduled for
+        another attempt covering only the users still unanswered, rather
+        than being dropped as a non-match.
+
+        Once the daily OpenAI budget is spent with OPENAI_BUDGET_FALLBACK
+        'geo', no OpenAI calls are made and only locations the gazetteer
+        can read are matched.
+        """
+        use_llm = get_usage_tracker().budget_mode() != 'geo'
+
+        if lead.pending_users is not None:
+            llm_users = lead.pending_users if use_llm else []
+        else:
+            users, geo_index = self._subscribers()
+            if lead.scan is None:
+                lead.scan = scan_locations(lead.content)
+            locations, ambiguous = lead.scan
+
+            if (ambiguous or not locations) and LLM_MATCH_MODE == 'extract' and use_llm:
+                if ambiguous:
+                    logging.info(f"Ambiguous locations {ambiguous} in lead {lead.message_id}, extracting with OpenAI")
+                else:
+                    logging.info(f"No known location in lead {lead.message_id}, extracting with OpenAI")
+                lead.llm_calls += 1
+                try:
+                    lead.extracted = extract_job_locations(lead.content, group_id=lead.group_id, usage=lead.llm_usage)
+                except OpenAIDeferred as e:
+                    self._retry(lead.retry(), str(e))
+                    return
+                locations = locations + _extracted_locations(lead.extracted)
+
+            lead.locations = locations
+
+            if not use_llm:
+                logging.info(f"OpenAI budget spent, matching lead {lead.message_id} by gazetteer only")
+                lead.matched_users.extend(geo_index.match(locations) if locations else [])
+                llm_users = []
+            elif locations:
+                lead.matched_users.extend(geo_index.match(locations))
+                llm_users = geo_index.unresolved
+            elif LLM_MATCH_MODE == 'per_user':
+                logging.info(f"No known location in lead {lead.message_id}, falling back to OpenAI")
+                llm_users = users
+            else:
+                logging.info(f"No resolvable location in lead {lead.message_id}")
+                llm_users = []
+
+        lead.llm_calls += len(llm_users)
+        deferred_users = []
+        for user in llm_users:
+            response = generate_response_for_user(lead.content, user, group_id=lead.group_id, usage=lead.llm_usage)
+            if response == DEFERRED:
+                deferred_users.append(user)
+            elif response and 'JOB FOUND' in response.upper():
+                lead.matched_users.append(user)
+
+        if deferred_users:
+            self._retry(lead.retry(deferred_users), f"{len(deferred_users)} verdicts deferred")
+
+        logging.info(f"Lead {lead.message_id} matched {len(lead.matched_users)} users")
+        if lead.matched_users:
+            yield lead
+        elif not deferred_users:
+            self._record(lead, 'no_match', matched_count=0, detail={'attempt': lead.attempts})
+
+    def _retry(self, lead, reason):
+        """Schedule another match attempt with exponential delay"""
+        if lead.attempts > PIPELINE_MAX_ATTEMPTS:
+            self.abandoned += 1
+            logging.error(f"Giving up on lead {lead.message_id} after {PIPELINE_MAX_ATTEMPTS} attempts: {reason}")
+            self._record(lead, 'abandoned', detail={'reason': reason})
+            return
+
+        delay = PIPELINE_RETRY_DELAY * 2 ** (lead.attempts - 2)
+        logging.warning(f"Retrying lead {lead.message_id} in {delay:.0f}s (attempt {lead.attempts}): {reason}")
+        self.retries.schedule(self.match_stage, lead, delay)
+
+    def _deliver(self, lead):
+        """
+        Record a notification per matched subscriber in the outbox
+
+        The outbox drainer sends them, retrying failures, and the
+        idempotency key (lead content + user) means a lead that is matched
+        again (retries, other workers) never notifies the same user twice.
+        If the outbox cannot be written, the notifications are sent directly.
+        """
+        lead_key = message_hash(lead.content)
+        notifications = [
+            (notification_key(lead_key, user.user_id), user.number, format_lead_notification(lead, user))
+            for user in lead.matched_users
+        ]
+
+        try:
+            created = self.outbox.enqueue(notifications)
+        except Exception as e:
+            logging.error(f"Could not queue notifications for lead {lead.message_id}, sending directly: {e}")
+            results = send_bulk_messages([(to_number, body) for _, to_number, body in notifications])
+            for result in results:
+                if not result['ok']:
+                    logging.error(f"Failed to notify {result['to']} of lead {lead.message_id}: {result['response']}")
+            self._record(lead, 'matched', matched_count=len(notifications),
+                         detail={'attempt': lead.attempts, 'sent_directly': sum(1 for r in results if r['ok'])})
+            return
+
+        logging.info(f"Queued {created} of {len(notifications)} notifications for lead {lead.message_id}")
+        self._record(lead, 'matched', matched_count=len(notifications), detail={'attempt': lead.attempts, 'queued': created})
+        if created and self.drainer is not None:
+            self.drainer.wake()
+
+def _location_labels(locations):
+    """(label, lat, lon) tuples as JSON-friendly [label, lat, lon] lists"""
+    return [[label, lat, lon] for label, lat, lon in locations]
+
+def _extracted_locations(extracted):
+    """Geocode the places returned by extract_job_locations"""
+    if not extracted:
+        return []
+
+    locations = []
+    for place in [extracted.get('pickup'), extracted.get('dropoff')] + extracted.get('postcodes', []):
+        if place:
+            # OpenAI has already decided these are places
+            locations.extend(scan_locations(place, strict=False)[0])
+    return locations
+
+def format_lead_notification(lead, user):
+    """WhatsApp text sent to a subscriber for a matched lead"""
+    return f"🚨 JOB FOUND within {user.range_miles} miles of {user.location}:\n\n{lead.content}"
+
+_pipeline = None
+_pipeline_pid = None
+_pipeline_lock = threading.Lock()
+
+def get_pipeline(user_manager):
+    """Get this worker's pipeline, starting its threads on first use"""
+    global _pipeline, _pipeline_pid
+
+    pid = os.getpid()
+    if _pipeline is None or _pipeline_pid != pid:
+        with _pipeline_lock:
+            if _pipeline is None or _pipeline_pid != pid:
+                pipeline = LeadPipeline(user_manager)
+                pipeline.start()
+                _pipeline = pipeline
+                _pipeline_pid = pid
+    return _pipeline
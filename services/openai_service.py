@@ -1,51 +1,323 @@
 import os
+import json
+import time
+import random
 import logging
+import threading
+from email.utils import parsedate_to_datetime
+import httpx
 from openai import OpenAI
-from openai import APIError, APIConnectionError, RateLimitError
+from openai import APIError, APIConnectionError, RateLimitError, InternalServerError
+from managers.verdict_cache import get_verdict_cache
+from services.openai_usage import OPENAI_FALLBACK_MODEL, get_usage_tracker
+from utils.rate_limit import TokenBucket
+from utils.metrics import OPENAI_REQUEST_SECONDS, OPENAI_RESULTS, timed
+
+try:
+    # Each gunicorn worker has its own limiter, so the account quota is split between them
+    from gunicorn_config import workers as GUNICORN_WORKERS
+except ImportError:
+    GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', 1))
+
+# Model answering the per-user "is this job in range" prompt
+OPENAI_MATCH_MODEL = os.getenv('OPENAI_MATCH_MODEL', 'gpt-4')
+# Cheap model used for the one-call-per-message location extraction
+OPENAI_EXTRACTION_MODEL = os.getenv('OPENAI_EXTRACTION_MODEL', 'gpt-4o-mini')
+
+# Seconds to open a connection / wait for a response from the API
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+OPENAI_READ_TIMEOUT = float(os.getenv('OPENAI_READ_TIMEOUT', 30))
+# Requests in flight at once per worker (also the keep-alive pool size)
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 4))
+# Account quota for the whole instance (requests and tokens per minute); 0 disables the limiter.
+# Each worker enforces an equal share: with 4 workers the defaults allow 125 RPM / 7500 TPM per worker
+OPENAI_RPM = float(os.getenv('OPENAI_RPM', 500))
+OPENAI_TPM = float(os.getenv('OPENAI_TPM', 30000))
+OPENAI_WORKER_RPM = OPENAI_RPM / max(GUNICORN_WORKERS, 1)
+OPENAI_WORKER_TPM = OPENAI_TPM / max(GUNICORN_WORKERS, 1)
+# Retries on 429 / 5xx / connection errors, with jittered exponential backoff (seconds)
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 4))
+OPENAI_BACKOFF_BASE = float(os.getenv('OPENAI_BACKOFF_BASE', 1.0))
+OPENAI_BACKOFF_MAX = float(os.getenv('OPENAI_BACKOFF_MAX', 30.0))
+# Seconds a call may spend queueing and retrying before it is deferred
+OPENAI_DEFER_AFTER = float(os.getenv('OPENAI_DEFER_AFTER', 60))
+
+# Verdict returned when OpenAI could not answer in time; the caller should retry later
+DEFERRED = "DEFERRED"
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+# Kept byte-for-byte identical across calls so the provider can cache the prompt prefix
+EXTRACTION_SYSTEM_PROMPT = (
+    "You extract structured data from UK vehicle recovery and transport job leads. "
+    "Reply with a single JSON object and nothing else, using exactly these keys:\n"
+    "  \"pickup\": the collection town, city or address as written, or null\n"
+    "  \"dropoff\": the delivery town, city or address as written, or null\n"
+    "  \"postcodes\": a list of every UK postcode or outward code (e.g. \"B12 0AB\", \"LS6\") in the message\n"
+    "  \"vehicle_type\": the vehicle to be moved (e.g. \"car\", \"van\", \"caravan\"), or null\n"
+    "If the message is not a job lead, return null for every field and an empty postcodes list."
+)
+
+class OpenAIDeferred(Exception):
+    """OpenAI was rate limited or unavailable for longer than OPENAI_DEFER_AFTER"""
+
+class OpenAIGate:
+    """
+    Per-process admission control in front of the OpenAI API
+
+    A semaphore caps requests in flight, token buckets keep us under this
+    worker's share of the RPM/TPM quota, and retryable failures back off with full jitter. A 429
+    carrying Retry-After pauses every thread in the worker, not just the
+    one that saw it.
+    """
+
+    def __init__(self, max_concurrency=OPENAI_MAX_CONCURRENCY, rpm=OPENAI_WORKER_RPM, tpm=OPENAI_WORKER_TPM):
+        self.semaphore = threading.BoundedSemaphore(max(max_concurrency, 1))
+        self.requests = TokenBucket.per_minute(rpm)
+        self.tokens = TokenBucket.per_minute(tpm)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.retries = 0
+        self.deferred = 0
+        self.rate_limited = 0
+
+    def pause(self, seconds):
+        """Hold back every request from this worker for `seconds`"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_for_pause(self, deadline):
+        while True:
+            with self._lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return True
+            if time.monotonic() + remaining > deadline:
+                return False
+            time.sleep(remaining)
+
+    def _backoff(self, attempt, error):
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, OPENAI_BACKOFF_BASE)
+        return random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt))
+
+    def _defer(self, reason):
+        with self._lock:
+            self.deferred += 1
+        raise OpenAIDeferred(reason)
+
+    def create_completion(self, client, estimated_tokens, **kwargs):
+        """
+        Run client.chat.completions.create under the limits, retrying as needed
+
+        Args:
+            client (OpenAI): Shared client
+            estimated_tokens (int): Prompt plus expected completion tokens
+            **kwargs: Passed to chat.completions.create
+
+        Returns:
+            ChatCompletion: The API response
+
+        Raises:
+            OpenAIDeferred: If no answer arrived within OPENAI_DEFER_AFTER seconds
+            APIError: For non-retryable API errors
+        """
+        deadline = time.monotonic() + OPENAI_DEFER_AFTER
+
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            if not self._wait_for_pause(deadline):
+                self._defer("OpenAI is rate limiting this worker")
+            if not self.requests.acquire(1, timeout=max(deadline - time.monotonic(), 0)):
+                self._defer("Request quota exhausted")
+            if not self.tokens.acquire(estimated_tokens, timeout=max(deadline - time.monotonic(), 0)):
+                self._defer("Token quota exhausted")
+            if not self.semaphore.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                self._defer("Too many OpenAI requests in flight")
+
+            error = None
+            try:
+                with self._lock:
+                    self.calls += 1
+                response = client.chat.completions.create(**kwargs)
+            except RETRYABLE_ERRORS as e:
+                error = e
+            finally:
+                self.semaphore.release()
+
+            if error is None:
+                usage = getattr(response, 'usage', None)
+                if usage is not None and usage.total_tokens > estimated_tokens:
+                    self.tokens.consume(usage.total_tokens - estimated_tokens)
+                return response
+
+            delay = self._backoff(attempt, error)
+            if isinstance(error, RateLimitError):
+                with self._lock:
+                    self.rate_limited += 1
+                self.pause(delay)
+            if attempt == OPENAI_MAX_RETRIES or time.monotonic() + delay > deadline:
+                self._defer(f"Giving up after {attempt + 1} attempts: {error}")
+
+            with self._lock:
+                self.retries += 1
+            logging.warning(f"OpenAI request failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            counters = {
+                'calls': self.calls,
+                'retries': self.retries,
+                'rate_limited': self.rate_limited,
+                'deferred': self.deferred,
+                'paused_seconds_remaining': round(max(self._paused_until - time.monotonic(), 0), 3)
+            }
+        counters['requests_bucket'] = self.requests.stats()
+        counters['tokens_bucket'] = self.tokens.stats()
+        return counters
+
+def _retry_after_seconds(error):
+    """Seconds the API asked us to wait (Retry-After / retry-after-ms), if any"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _estimate_tokens(messages, completion_tokens):
+    """Rough token count (~4 characters per token) used to reserve TPM quota"""
+    prompt_chars = sum(len(message['content'] or '') for message in messages)
+    return prompt_chars // 4 + 4 * len(messages) + completion_tokens
+
+_client = None
+_gate = None
+_client_pid = None
+_client_lock = threading.Lock()
 
 # Initialize OpenAI client with API key from environment variables
 def get_openai_client():
     """
-    Get OpenAI client with API key from environment variables
+    Get this worker's shared OpenAI client
+    
+    The client keeps its HTTP connections alive between calls. Retries are
+    left to OpenAIGate, so the SDK's own retry loop is disabled.
     
     Returns:
-        OpenAI: OpenAI client
+        OpenAI: OpenAI client, or None if no API key is configured
     """
+    global _client, _gate, _client_pid
+    
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         logging.error("OpenAI API key not configured")
         return None
     
-    return OpenAI(api_key=api_key)
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = OpenAI(
+                    api_key=api_key,
+                    timeout=httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+                    max_retries=0,
+                    http_client=httpx.Client(limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONCURRENCY,
+                        max_keepalive_connections=OPENAI_MAX_CONCURRENCY
+                    ))
+                )
+                _gate = OpenAIGate()
+                _client_pid = pid
+    return _client
+
+def get_openai_gate():
+    """Get this worker's OpenAIGate (created alongside the client)"""
+    if get_openai_client() is None:
+        return None
+    return _gate
+
+def openai_stats():
+    """Limiter and retry counters for this worker"""
+    gate = get_openai_gate()
+    return gate.stats() if gate is not None else {}
+
+def _record_usage(tracker, model, operation, usage, **kwargs):
+    """Account for a completion; a failure here must not discard the paid-for answer"""
+    try:
+        tracker.record(model, operation, usage, **kwargs)
+    except Exception as e:
+        logging.error(f"Could not record OpenAI {operation} usage: {e}")
 
-def generate_response_for_user(message_body, user):
+@timed(OPENAI_REQUEST_SECONDS, operation='verdict')
+def generate_response_for_user(message_body, user, use_cache=True, group_id=None, usage=None):
     """
     Use OpenAI to determine if a job is within a user's range
     
+    Verdicts are memoized by message fingerprint, location and range, so a
+    lead cross-posted to several groups is only sent once per subscriber.
+    Once the daily OpenAI budget is spent, new verdicts come from
+    OPENAI_FALLBACK_MODEL instead of OPENAI_MATCH_MODEL.
+    
     Args:
         message_body (str): Job message content
         user (User): User object with location and range
+        use_cache (bool): Reuse/store the verdict in the shared cache
+        group_id (str): Group the message came from, for usage accounting
+        usage (dict): Optional running totals to add this call's tokens and cost to
         
     Returns:
-        str: AI response ("JOB FOUND" or "NIL")
+        str: AI response ("JOB FOUND" or "NIL"), or DEFERRED if OpenAI was
+             rate limited or unavailable and the lead should be retried
     """
+    # Create prompt with user's specific location and range
+    prompt = f"You will receive potential vehicle recovery job leads as your user input. If any of the locations or postcodes in the user message is within {user.range_miles} miles of {user.location} please reply with: JOB FOUND, Else reply with: NIL."
+    tracker = get_usage_tracker()
+    model = OPENAI_FALLBACK_MODEL if tracker.budget_mode() else OPENAI_MATCH_MODEL
+    cache_params = (model, prompt)
+    
+    if use_cache:
+        # A verdict the main model already gave is still free once over budget
+        for cached_model in dict.fromkeys([OPENAI_MATCH_MODEL, model]):
+            cached = get_verdict_cache().get('verdict', message_body, (cached_model, prompt))
+            if cached is not None:
+                logging.info(f"Cached AI response for {user.name}: {cached['response']}")
+                OPENAI_RESULTS.labels(operation='verdict', result='cached').inc()
+                return cached['response']
+    
     client = get_openai_client()
     if not client:
         logging.error("Failed to initialize OpenAI client")
+        OPENAI_RESULTS.labels(operation='verdict', result='error').inc()
         return "NIL"  # Default to no match if API is not available
     
+    messages = [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": message_body}
+    ]
+    
     try:
-        # Create prompt with user's specific location and range
-        prompt = f"You will receive potential vehicle recovery job leads as your user input. If any of the locations or postcodes in the user message is within {user.range_miles} miles of {user.location} please reply with: JOB FOUND, Else reply with: NIL."
-        
         # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4",
-            temperature=1.0,
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": message_body}
-            ]
+        response = get_openai_gate().create_completion(
+            client,
+            _estimate_tokens(messages, completion_tokens=10),
+            model=model,
+            # Deterministic, since the verdict is cached and reused for every repeat
+            temperature=0,
+            messages=messages
         )
 
         # Extract response text
@@ -54,13 +326,116 @@ def generate_response_for_user(message_body, user):
         # Log response for debugging
         logging.info(f"AI response for {user.name}: {ai_response}")
         logging.info(f"Total tokens used for {user.name}: {response.usage.total_tokens}")
+        _record_usage(tracker, model, 'verdict', response.usage, user_id=user.user_id, group_id=group_id, totals=usage)
+        
+        # Only real answers are cached; the error paths below return "NIL" uncached
+        if use_cache and ai_response:
+            get_verdict_cache().put('verdict', message_body, cache_params, {'response': ai_response})
         
+        OPENAI_RESULTS.labels(operation='verdict', result='completed').inc()
         return ai_response
     
-    except (APIError, APIConnectionError, RateLimitError) as e:
+    except OpenAIDeferred as e:
+        logging.warning(f"OpenAI verdict for {user.name} deferred: {e}")
+        OPENAI_RESULTS.labels(operation='verdict', result='deferred').inc()
+        return DEFERRED
+    
+    except APIError as e:
         logging.error(f"OpenAI API error: {e}")
+        OPENAI_RESULTS.labels(operation='verdict', result='error').inc()
         return "NIL"  # Default to no match if API fails
     
     except Exception as e:
         logging.error(f"Unexpected error in OpenAI service: {e}")
+        OPENAI_RESULTS.labels(operation='verdict', result='error').inc()
         return "NIL"  # Default to no match if something goes wrong
+
+@timed(OPENAI_REQUEST_SECONDS, operation='extract')
+def extract_job_locations(message_body, use_cache=True, group_id=None, usage=None):
+    """
+    Extract the places in a job lead with a single OpenAI call
+
+    The prompt does not depend on any subscriber, so a message is sent once
+    no matter how many users are then matched against it locally.
+
+    Args:
+        message_body (str): Job message content
+        use_cache (bool): Reuse/store the extraction in the shared cache
+        group_id (str): Group the message came from, for usage accounting
+        usage (dict): Optional running totals to add this call's tokens and cost to
+
+    Returns:
+        dict: pickup, dropoff, postcodes (list) and vehicle_type, or None if the call failed
+
+    Raises:
+        OpenAIDeferred: If OpenAI was rate limited or unavailable; retry later
+    """
+    cache_params = (OPENAI_EXTRACTION_MODEL, EXTRACTION_SYSTEM_PROMPT)
+    if use_cache:
+        cached = get_verdict_cache().get('extract', message_body, cache_params)
+        if cached is not None:
+            logging.info(f"Cached job locations: {cached}")
+            OPENAI_RESULTS.labels(operation='extract', result='cached').inc()
+            return cached
+
+    client = get_openai_client()
+    if not client:
+        logging.error("Failed to initialize OpenAI client")
+        OPENAI_RESULTS.labels(operation='extract', result='error').inc()
+        return None
+
+    messages = [
+        {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
+        {"role": "user", "content": message_body}
+    ]
+
+    try:
+        response = get_openai_gate().create_completion(
+            client,
+            _estimate_tokens(messages, completion_tokens=100),
+            model=OPENAI_EXTRACTION_MODEL,
+            temperature=0,
+            response_format={"type": "json_object"},
+            messages=messages
+        )
+
+        data = json.loads(response.choices[0].message.content or '{}')
+        postcodes = data.get('postcodes') or []
+        if isinstance(postcodes, str):
+            postcodes = [postcodes]
+
+        extracted = {
+            'pickup': data.get('pickup') or None,
+            'dropoff': data.get('dropoff') or None,
+            'postcodes': [str(code) for code in postcodes if code],
+            'vehicle_type': data.get('vehicle_type') or None
+        }
+
+        logging.info(f"Extracted job locations: {extracted}")
+        logging.info(f"Total tokens used for extraction: {response.usage.total_tokens}")
+        _record_usage(get_usage_tracker(), OPENAI_EXTRACTION_MODEL, 'extract', response.usage, group_id=group_id, totals=usage)
+
+        if use_cache:
+            get_verdict_cache().put('extract', message_body, cache_params, extracted)
+
+        OPENAI_RESULTS.labels(operation='extract', result='completed').inc()
+        return extracted
+
+    except OpenAIDeferred:
+        OPENAI_RESULTS.labels(operation='extract', result='deferred').inc()
+        raise
+
+    except APIError as e:
+        logging.error(f"OpenAI API error: {e}")
+        OPENAI_RESULTS.labels(operation='extract', result='error').inc()
+        return None
+
+    except (ValueError, AttributeError) as e:
+        logging.error(f"Could not parse OpenAI extraction response: {e}")
+        OPENAI_RESULTS.labels(operation='extract', result='error').inc()
+        return None
+
+    except Exception as e:
+        logging.error(f"Unexpected error in OpenAI service: {e}")
+        OPENAI_RESULTS.labels(operation='extract', result='error').inc()
+        return None
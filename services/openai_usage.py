@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+from managers.openai_usage_manager import OpenAIUsageManager
+from utils.batch_writer import BatchWriter
+
+# USD per million (prompt, completion) tokens; the longest matching model prefix wins,
+# so dated snapshots (gpt-4o-mini-2024-07-18) use their family's price
+OPENAI_PRICES = {
+    'gpt-4': (30.0, 60.0),
+    'gpt-4-32k': (60.0, 120.0),
+    'gpt-4-turbo': (10.0, 30.0),
+    'gpt-4o': (2.5, 10.0),
+    'gpt-4o-mini': (0.15, 0.6),
+    'gpt-4.1': (2.0, 8.0),
+    'gpt-4.1-mini': (0.4, 1.6),
+    'gpt-4.1-nano': (0.1, 0.4),
+    'gpt-3.5-turbo': (0.5, 1.5),
+}
+# Extra or corrected prices as JSON, e.g. {"gpt-4o": [2.5, 10]}
+try:
+    OPENAI_PRICES.update({
+        model: (float(prompt), float(completion))
+        for model, (prompt, completion) in json.loads(os.getenv('OPENAI_PRICES', '{}')).items()
+    })
+except (ValueError, TypeError, AttributeError) as e:
+    logging.error(f"Ignoring invalid OPENAI_PRICES, using the built-in prices: {e}")
+
+# Daily OpenAI spend (USD, UTC day) across all workers; 0 disables the budget
+OPENAI_DAILY_BUDGET_USD = float(os.getenv('OPENAI_DAILY_BUDGET_USD', 0))
+# What happens once the budget is spent: 'cheap' answers verdicts with
+# OPENAI_FALLBACK_MODEL, 'geo' stops calling OpenAI and matches by gazetteer only
+OPENAI_BUDGET_FALLBACK = os.getenv('OPENAI_BUDGET_FALLBACK', 'cheap').lower()
+OPENAI_FALLBACK_MODEL = os.getenv('OPENAI_FALLBACK_MODEL', 'gpt-4o-mini')
+# Seconds between re-reads of today's spend from Postgres
+OPENAI_BUDGET_REFRESH = float(os.getenv('OPENAI_BUDGET_REFRESH', 30))
+# Usage records per upsert, and the longest one waits to be written (seconds)
+OPENAI_USAGE_BATCH_SIZE = int(os.getenv('OPENAI_USAGE_BATCH_SIZE', 200))
+OPENAI_USAGE_FLUSH_INTERVAL = float(os.getenv('OPENAI_USAGE_FLUSH_INTERVAL', 5))
+
+_unpriced_models = set()
+
+def model_price(model):
+    """(prompt, completion) USD per million tokens for a model"""
+    matches = [name for name in OPENAI_PRICES if model == name or model.startswith(f"{name}-")]
+    if matches:
+        return OPENAI_PRICES[max(matches, key=len)]
+    if model not in _unpriced_models:
+        _unpriced_models.add(model)
+        logging.warning(f"No price for OpenAI model {model}, costing it as gpt-4")
+    return OPENAI_PRICES['gpt-4']
+
+def cost_usd(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = model_price(model)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+class UsageTracker:
+    """
+    Per-worker OpenAI usage recorder and daily budget check
+
+    record() is non-blocking: usage is queued and summed into
+    openai_usage_daily by a BatchWriter. Today's spend is the total
+    from Postgres (shared by every worker, re-read every
+    OPENAI_BUDGET_REFRESH seconds) plus what this worker has queued but
+    not yet written, so a worker notices the budget running out between
+    refreshes.
+    """
+
+    def __init__(self, manager=None, budget_usd=OPENAI_DAILY_BUDGET_USD):
+        self.manager = manager or OpenAIUsageManager()
+        self.budget_usd = budget_usd
+        self.writer = BatchWriter(
+            'openai-usage',
+            self._flush,
+            max_batch=OPENAI_USAGE_BATCH_SIZE,
+            flush_interval=OPENAI_USAGE_FLUSH_INTERVAL
+        )
+        self._lock = threading.Lock()
+        self._day = None
+        self._spent_stored = 0.0
+        self._spent_pending = 0.0
+        self._refreshed_at = 0.0
+
+        self.requests = 0
+        self.tokens = 0
+        self.cost_usd = 0.0
+
+    def start(self):
+        self.writer.start()
+
+    def record(self, model, operation, usage, user_id=None, group_id=None, totals=None):
+        """
+        Account for one completion
+
+        Args:
+            model (str): Model that answered
+            operation (str): 'verdict' or 'extract'
+            usage: The response's usage object (prompt_tokens, completion_tokens)
+            user_id (str): Subscriber the call was made for
+            group_id (str): Group the message came from
+            totals (dict): Optional running totals ('tokens', 'cost_usd') to add to,
+                           e.g. one lead's
+
+        Returns:
+            float: Cost of the call in USD
+        """
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        cost = cost_usd(model, prompt_tokens, completion_tokens)
+        day = datetime.now(timezone.utc).date()
+
+        with self._lock:
+            self._roll_day(day)
+            self._spent_pending += cost
+            self.requests += 1
+            self.tokens += prompt_tokens + completion_tokens
+            self.cost_usd += cost
+            if totals is not None:
+                totals['tokens'] = totals.get('tokens', 0) + prompt_tokens + completion_tokens
+                totals['cost_usd'] = totals.get('cost_usd', 0.0) + cost
+
+        self.writer.add({
+            'day': day,
+            'model': model,
+            'operation': operation,
+            'user_id': user_id,
+            'group_id': group_id,
+            'requests': 1,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cost_usd': cost
+        })
+        return cost
+
+    def _flush(self, records):
+        """
+        BatchWriter callback: write the batch, then stop counting it as pending
+
+        A batch that fails to write is queued again (the writer backs off
+        before retrying it) and stays pending, so the budget check keeps
+        counting spend that is not in Postgres yet. Records that no longer
+        fit in the queue are lost from the table but remain pending until
+        the day rolls over.
+        """
+        try:
+            self.manager.upsert_batch(records)
+        except Exception:
+            requeued = self.writer.requeue(records)
+            if requeued < len(records):
+                logging.error(f"Dropped {len(records) - requeued} OpenAI usage records, the queue is full")
+            raise
+
+        with self._lock:
+            flushed = sum(record['cost_usd'] for record in records if record['day'] == self._day)
+            self._spent_pending = max(self._spent_pending - flushed, 0.0)
+
+    def _roll_day(self, day):
+        """Start counting afresh at UTC midnight (call with the lock held)"""
+        if day != self._day:
+            self._day = day
+            self._spent_stored = 0.0
+            self._spent_pending = 0.0
+            self._refreshed_at = 0.0
+
+    def spent_today(self):
+        """Today's spend in USD across all workers (approximate between refreshes)"""
+        day = datetime.now(timezone.utc).date()
+        with self._lock:
+            self._roll_day(day)
+            stale = time.monotonic() - self._refreshed_at > OPENAI_BUDGET_REFRESH
+            if stale:
+                # Claim the refresh so other threads keep using the current figure
+                self._refreshed_at = time.monotonic()
+            spent = self._spent_stored + self._spent_pending
+
+        if stale:
+            try:
+                stored = self.manager.spent_on(day)
+            except Exception as e:
+                logging.error(f"Could not read today's OpenAI spend: {e}")
+                return spent
+            with self._lock:
+                if self._day == day:
+                    self._spent_stored = stored
+                spent = self._spent_stored + self._spent_pending
+        return spent
+
+    def budget_mode(self):
+        """
+        None while within budget, else OPENAI_BUDGET_FALLBACK ('cheap' or 'geo')
+        """
+        if self.budget_usd <= 0:
+            return None
+        return OPENAI_BUDGET_FALLBACK if self.spent_today() >= self.budget_usd else None
+
+    def stats(self):
+        return {
+            'budget_usd': self.budget_usd or None,
+            'spent_today_usd': round(self.spent_today(), 6),
+            'budget_mode': self.budget_mode(),
+            'worker_requests': self.requests,
+            'worker_tokens': self.tokens,
+            'worker_cost_usd': round(self.cost_usd, 6),
+            'writer': self.writer.stats()
+        }
+
+_usage_tracker = None
+_usage_tracker_pid = None
+_usage_tracker_lock = threading.Lock()
+
+def get_usage_tracker():
+    """Get this worker's usage tracker, starting its writer on first use"""
+    global _usage_tracker, _usage_tracker_pid
+
+    pid = os.getpid()
+    if _usage_tracker is None or _usage_tracker_pid != pid:
+        with _usage_tracker_lock:
+            if _usage_tracker is None or _usage_tracker_pid != pid:
+                tracker = UsageTracker()
+                tracker.start()
+                _usage_tracker = tracker
+                _usage_tracker_pid = pid
+    return _usage_tracker
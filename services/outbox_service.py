@@ -0,0 +1,176 @@
+import os
+import time
+import random
+import logging
+import threading
+
+from managers.outbox_manager import OutboxManager, OUTBOX_LEASE_SECONDS
+from services.whatsapp_service import send_bulk_messages, WHAPI_WORKER_SEND_RATE, WHAPI_WORKER_SEND_BURST
+
+# Most notifications leased and sent per round
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+# Seconds between polls when the outbox is empty (new local work wakes the drainer early)
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 2))
+# Retry backoff for failed sends: base * 2^(attempt - 1), capped, with jitter (seconds)
+OUTBOX_BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', 10))
+OUTBOX_BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', 900))
+# Days sent/failed rows are kept, and how often they are purged (seconds)
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', 7))
+OUTBOX_PURGE_INTERVAL = float(os.getenv('OUTBOX_PURGE_INTERVAL', 3600))
+
+def claim_limit(batch_size=OUTBOX_BATCH_SIZE, rate=WHAPI_WORKER_SEND_RATE,
+                burst=WHAPI_WORKER_SEND_BURST, lease=OUTBOX_LEASE_SECONDS):
+    """
+    Rows to lease per round: batch_size, capped at what this worker's share
+    of the Whapi send rate gets through in a quarter of the lease, so a
+    batch normally finishes long before its lease needs renewing
+    """
+    if rate <= 0:
+        return max(batch_size, 1)
+    return max(1, min(batch_size, int(burst + rate * lease / 4)))
+
+# With the defaults and 4 workers: min(50, 2.5 + 1.25/s * 30s) = 40 rows
+OUTBOX_CLAIM_LIMIT = claim_limit()
+
+def retry_delay(attempts):
+    """Seconds before the next attempt after `attempts` failed sends"""
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+class OutboxDrainer:
+    """
+    Background thread that sends due outbox rows for this worker
+
+    Every worker runs one, started with the app; SKIP LOCKED leases keep
+    them from sending the same row, so adding workers or instances adds
+    throughput. Leases on a batch are renewed every third of
+    OUTBOX_LEASE_SECONDS until its sends finish, however slow Whapi is.
+    """
+
+    def __init__(self, manager=None):
+        self.manager = manager or OutboxManager()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_purge = time.monotonic()
+
+        self.rounds = 0
+        self.sent = 0
+        self.failed = 0
+        self.errors = 0
+        self.lease_renewals = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='outbox-drainer', daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Start the next round now instead of after the poll interval"""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                sent = self.drain_once()
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Outbox drain failed: {e}")
+                sent = 0
+
+            if time.monotonic() - self._last_purge > OUTBOX_PURGE_INTERVAL:
+                self._last_purge = time.monotonic()
+                try:
+                    purged = self.manager.purge(OUTBOX_RETENTION_DAYS)
+                    if purged:
+                        logging.info(f"Purged {purged} old outbox rows")
+                except Exception as e:
+                    logging.error(f"Outbox purge failed: {e}")
+
+            # A full batch means more may be due; otherwise wait for work
+            if sent < OUTBOX_CLAIM_LIMIT:
+                self._wake.wait(OUTBOX_POLL_INTERVAL)
+                self._wake.clear()
+
+    def drain_once(self):
+        """
+        Lease one batch, send it and record the outcome
+
+        Returns:
+            int: Number of rows claimed
+        """
+        batch = self.manager.claim_batch(OUTBOX_CLAIM_LIMIT)
+        if not batch:
+            return 0
+
+        self.rounds += 1
+        done = threading.Event()
+        renewer = threading.Thread(
+            target=self._renew_leases, args=([row[0] for row in batch], done),
+            name='outbox-lease', daemon=True
+        )
+        renewer.start()
+        try:
+            results = send_bulk_messages([(to_number, body) for _, to_number, body, _ in batch])
+        finally:
+            done.set()
+            renewer.join()
+
+        sent_ids = []
+        failures = []
+        for (outbox_id, to_number, _, attempts), result in zip(batch, results):
+            if result['ok']:
+                sent_ids.append(outbox_id)
+            else:
+                error = str(result['response'].get('error') or result['response'])
+                if result.get('status') is not None:
+                    error = f"HTTP {result['status']}: {error}"
+                error = error[:500]
+                failures.append((outbox_id, retry_delay(attempts), error))
+                logging.warning(f"Notification {outbox_id} to {to_number} failed (attempt {attempts}): {error}")
+
+        self.manager.mark_sent(sent_ids)
+        self.manager.mark_failed(failures)
+        self.sent += len(sent_ids)
+        self.failed += len(failures)
+        return len(batch)
+
+    def _renew_leases(self, ids, done):
+        """Keep extending the lease on `ids` until `done` is set"""
+        while not done.wait(OUTBOX_LEASE_SECONDS / 3):
+            try:
+                self.manager.extend_lease(ids)
+                self.lease_renewals += 1
+            except Exception as e:
+                logging.error(f"Could not extend the lease on {len(ids)} outbox rows: {e}")
+
+    def stats(self):
+        stats = {
+            'claim_limit': OUTBOX_CLAIM_LIMIT,
+            'rounds': self.rounds,
+            'sent': self.sent,
+            'failed_attempts': self.failed,
+            'errors': self.errors,
+            'lease_renewals': self.lease_renewals
+        }
+        try:
+            stats['rows'] = self.manager.get_counts()
+        except Exception as e:
+            logging.error(f"Error counting outbox rows: {e}")
+        return stats
+
+_drainer = None
+_drainer_pid = None
+_drainer_lock = threading.Lock()
+
+def get_outbox_drainer():
+    """Get this worker's outbox drainer, starting it on first use (normally at app start)"""
+    global _drainer, _drainer_pid
+
+    pid = os.getpid()
+    if _drainer is None or _drainer_pid != pid:
+        with _drainer_lock:
+            if _drainer is None or _drainer_pid != pid:
+                drainer = OutboxDrainer()
+                drainer.start()
+                _drainer = drainer
+                _drainer_pid = pid
+    return _drainer
@@ -0,0 +1,47 @@
+import os
+import time
+import logging
+import threading
+
+# Seconds a stats snapshot is reused before Postgres is queried again
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', 15))
+
+_stats_cache = {'value': None, 'expires_at': 0.0}
+_stats_lock = threading.Lock()
+
+def get_database_stats(user_manager, force_refresh=False):
+    """
+    Get dashboard statistics, cached for STATS_CACHE_TTL seconds
+    
+    Args:
+        user_manager (UserManager): User manager used to run the stats query
+        force_refresh (bool): Ignore any cached snapshot
+        
+    Returns:
+        dict: Stats from UserManager.get_user_stats plus 'cached_at'
+    """
+    now = time.time()
+    cached = _stats_cache['value']
+    if not force_refresh and cached is not None and now < _stats_cache['expires_at']:
+        return cached
+    
+    # Only one thread refreshes; others keep serving the previous snapshot
+    if not _stats_lock.acquire(blocking=cached is None or force_refresh):
+        return cached
+    
+    try:
+        if not force_refresh and _stats_cache['value'] is not None and time.time() < _stats_cache['expires_at']:
+            return _stats_cache['value']
+        
+        stats = user_manager.get_user_stats()
+        stats['cached_at'] = time.time()
+        _stats_cache['value'] = stats
+        _stats_cache['expires_at'] = stats['cached_at'] + STATS_CACHE_TTL
+        logging.debug("Refreshed database stats cache")
+        return stats
+    finally:
+        _stats_lock.release()
+
+def invalidate_stats_cache():
+    """Drop the cached stats snapshot"""
+    _stats_cache['expires_at'] = 0.0
@@ -1,7 +1,188 @@
 import os
-import requests
+import time
+import random
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 from requests_toolbelt.multipart.encoder import MultipartEncoder
+from utils.rate_limit import TokenBucket
+from utils.metrics import WHAPI_SEND_SECONDS, WHAPI_SENDS
+
+try:
+    # Each gunicorn worker has its own limiter, so the channel quota is split between them
+    from gunicorn_config import workers as GUNICORN_WORKERS
+except ImportError:
+    GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', 1))
+
+# Keep-alive connections held open to Whapi per worker
+WHAPI_POOL_SIZE = int(os.getenv('WHAPI_POOL_SIZE', 10))
+# Seconds to connect / to wait for Whapi's response
+WHAPI_CONNECT_TIMEOUT = float(os.getenv('WHAPI_CONNECT_TIMEOUT', 3.05))
+WHAPI_READ_TIMEOUT = float(os.getenv('WHAPI_READ_TIMEOUT', 15))
+# Retries on 429/5xx and connection failures, with jittered exponential backoff (seconds)
+WHAPI_MAX_RETRIES = int(os.getenv('WHAPI_MAX_RETRIES', 3))
+WHAPI_BACKOFF_BASE = float(os.getenv('WHAPI_BACKOFF_BASE', 0.5))
+WHAPI_BACKOFF_MAX = float(os.getenv('WHAPI_BACKOFF_MAX', 8))
+# Messages sent at once by send_bulk_messages per worker
+WHAPI_BULK_CONCURRENCY = int(os.getenv('WHAPI_BULK_CONCURRENCY', 8))
+# Channel send quota for the whole instance (messages/second and burst); 0 disables the limiter.
+# Each worker enforces an equal share: with 4 workers the defaults allow 1.25/s, burst 2.5, per worker
+WHAPI_SEND_RATE = float(os.getenv('WHAPI_SEND_RATE', 5))
+WHAPI_SEND_BURST = float(os.getenv('WHAPI_SEND_BURST', 10))
+WHAPI_WORKER_SEND_RATE = WHAPI_SEND_RATE / max(GUNICORN_WORKERS, 1)
+WHAPI_WORKER_SEND_BURST = WHAPI_SEND_BURST / max(GUNICORN_WORKERS, 1)
+# Latency samples kept per endpoint for percentiles
+WHAPI_LATENCY_SAMPLES = int(os.getenv('WHAPI_LATENCY_SAMPLES', 1000))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Methods safe to repeat after the server may already have acted on them
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+class WhapiStats:
+    """Per-endpoint call counts, status codes and recent latencies"""
+
+    def __init__(self, samples=WHAPI_LATENCY_SAMPLES):
+        self.samples = samples
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, endpoint):
+        entry = self._endpoints.get(endpoint)
+        if entry is None:
+            entry = self._endpoints[endpoint] = {
+                'calls': 0, 'errors': 0, 'retries': 0, 'statuses': {},
+                'latencies': deque(maxlen=self.samples)
+            }
+        return entry
+
+    def record(self, endpoint, seconds, status=None):
+        """Record one HTTP attempt; status None means no response was received"""
+        with self._lock:
+            entry = self._endpoint(endpoint)
+            entry['calls'] += 1
+            entry['latencies'].append(seconds)
+            if status is None:
+                entry['errors'] += 1
+            else:
+                entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self._endpoint(endpoint)['retries'] += 1
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for endpoint, entry in self._endpoints.items():
+                latencies = sorted(entry['latencies'])
+                result[endpoint] = {
+                    'calls': entry['calls'],
+                    'errors': entry['errors'],
+                    'retries': entry['retries'],
+                    'statuses': dict(entry['statuses']),
+                    'latency_ms': _percentiles(latencies)
+                }
+            return result
+
+def _percentiles(latencies):
+    if not latencies:
+        return {}
+
+    def at(fraction):
+        return round(latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] * 1000, 1)
+
+    return {'p50': at(0.50), 'p95': at(0.95), 'p99': at(0.99), 'max': round(latencies[-1] * 1000, 1)}
+
+whapi_stats = WhapiStats()
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_bulk_executor = None
+_send_bucket = None
+_bulk_pid = None
+_bulk_lock = threading.Lock()
+
+def get_whapi_session():
+    """
+    Get this worker's pooled requests session for Whapi
+
+    Connections are kept alive between sends so each message does not pay
+    for a new TLS handshake. Retries are handled in send_whapi_request.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WHAPI_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+                _session_pid = pid
+    return _session
+
+def _retry_delay(attempt, response=None):
+    """Full-jitter backoff, or Retry-After when Whapi sends one"""
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return min(float(retry_after), WHAPI_BACKOFF_MAX)
+            except ValueError:
+                pass
+    return random.uniform(0, min(WHAPI_BACKOFF_MAX, WHAPI_BACKOFF_BASE * 2 ** attempt))
+
+def _never_sent(error):
+    """True if the request failed before reaching Whapi, so repeating it cannot duplicate it"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+def _request(endpoint, method, url, retries=WHAPI_MAX_RETRIES, **kwargs):
+    """
+    Send one Whapi request on the pooled session, retrying where it is safe
+
+    Idempotent methods are retried on 429, 5xx and connection errors. Other
+    methods (message sends) are only retried on 429, which Whapi returns
+    before acting, and on failures to connect at all; a 5xx or read timeout
+    may mean the message went out, so it is not repeated.
+    """
+    session = get_whapi_session()
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    timeout = (WHAPI_CONNECT_TIMEOUT, WHAPI_READ_TIMEOUT)
+
+    for attempt in range(retries + 1):
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            whapi_stats.record(endpoint, time.perf_counter() - start)
+            if attempt < retries and (idempotent or _never_sent(e)):
+                delay = _retry_delay(attempt)
+                whapi_stats.record_retry(endpoint)
+                logging.warning(f"WhatsApp API {endpoint} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            raise
+
+        whapi_stats.record(endpoint, time.perf_counter() - start, response.status_code)
+        if (attempt < retries and response.status_code in RETRY_STATUSES
+                and (idempotent or response.status_code == 429)):
+            delay = _retry_delay(attempt, response)
+            whapi_stats.record_retry(endpoint)
+            logging.warning(f"WhatsApp API {endpoint} returned {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        return response
 
 def send_whapi_request(endpoint, params=None, method='POST'):
     """
@@ -15,12 +196,21 @@ def send_whapi_request(endpoint, params=None, method='POST'):
     Returns:
         dict: JSON response from the API
     """
+    return _whapi_call(endpoint, params, method)[1]
+
+def _whapi_call(endpoint, params=None, method='POST'):
+    """
+    send_whapi_request, also returning the HTTP status
+
+    Returns:
+        tuple: (status code, or None if no response was received; response dict)
+    """
     token = os.getenv('TOKEN')
     api_url = os.getenv('API_URL')
     
     if not token or not api_url:
         logging.error("WhatsApp API credentials not configured")
-        return {"error": "WhatsApp API credentials not configured"}
+        return None, {"error": "WhatsApp API credentials not configured"}
     
     headers = {
         'Authorization': f"Bearer {token}"
@@ -31,30 +221,40 @@ def send_whapi_request(endpoint, params=None, method='POST'):
         # Handle different request types
         if params:
             if 'media' in params:
-                # Handle media uploads (images, files)
+                # Handle media uploads (images, files); the stream can only be sent once
                 details = params.pop('media').split(';')
                 with open(details[0], 'rb') as file:
                     m = MultipartEncoder(fields={**params, 'media': (details[0], file, details[1])})
                     headers['Content-Type'] = m.content_type
-                    response = requests.request(method, url, data=m, headers=headers)
+                    response = _request(endpoint, method, url, retries=0, data=m, headers=headers)
             elif method == 'GET':
                 # Handle GET requests
-                response = requests.get(url, params=params, headers=headers)
+                response = _request(endpoint, 'GET', url, params=params, headers=headers)
             else:
                 # Handle other requests with JSON body
                 headers['Content-Type'] = 'application/json'
-                response = requests.request(method, url, json=params, headers=headers)
+                response = _request(endpoint, method, url, json=params, headers=headers)
         else:
             # Handle requests without parameters
-            response = requests.request(method, url, headers=headers)
+            response = _request(endpoint, method, url, headers=headers)
         
-        response_json = response.json()
         logging.info(f"WhatsApp API response: {response.status_code}")
-        return response_json
+        try:
+            response_json = response.json()
+        except ValueError:
+            # e.g. a proxy's HTML error page
+            response_json = {"error": f"Non-JSON response with status {response.status_code}"}
+        return response.status_code, response_json
     
     except requests.exceptions.RequestException as e:
         logging.error(f"WhatsApp API request failed: {e}")
-        return {"error": str(e)}
+        return None, {"error": str(e)}
+
+def _sent_ok(status, response):
+    """True only for a 2xx reply that reports no error and does not say it was not sent"""
+    return (status is not None and 200 <= status < 300
+            and isinstance(response, dict) and 'error' not in response
+            and response.get('sent', True) is not False)
 
 def set_hook():
     """Set up webhook for receiving messages from WhatsApp API"""
@@ -89,8 +289,74 @@ def send_message(to_number, message):
     Returns:
         dict: API response
     """
+    return _send_text(to_number, message)[1]
+
+def _send_text(to_number, message):
+    """send_message, also returning the HTTP status (None if there was no response)"""
     params = {
         'to': f"{to_number}@c.us",
         'body': message
     }
-    return send_whapi_request('messages/text', params)
+    start = time.perf_counter()
+    status, response = _whapi_call('messages/text', params)
+    WHAPI_SEND_SECONDS.observe(time.perf_counter() - start)
+    WHAPI_SENDS.labels(result='ok' if _sent_ok(status, response) else 'failed').inc()
+    return status, response
+
+def _bulk_sender():
+    """This worker's send thread pool and channel rate limiter"""
+    global _bulk_executor, _send_bucket, _bulk_pid
+
+    pid = os.getpid()
+    if _bulk_executor is None or _bulk_pid != pid:
+        with _bulk_lock:
+            if _bulk_executor is None or _bulk_pid != pid:
+                _bulk_executor = ThreadPoolExecutor(
+                    max_workers=max(WHAPI_BULK_CONCURRENCY, 1),
+                    thread_name_prefix='whapi-send'
+                )
+                _send_bucket = TokenBucket(WHAPI_WORKER_SEND_RATE, WHAPI_WORKER_SEND_BURST)
+                _bulk_pid = pid
+    return _bulk_executor, _send_bucket
+
+def _send_limited(bucket, to_number, message):
+    bucket.acquire()
+    start = time.perf_counter()
+    try:
+        status, response = _send_text(to_number, message)
+    except Exception as e:
+        status, response = None, {"error": str(e)}
+    return {
+        'to': to_number,
+        'ok': _sent_ok(status, response),
+        'status': status,
+        'response': response,
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+def send_bulk_messages(messages):
+    """
+    Send text messages to many recipients concurrently
+    
+    Sends run on a shared pool of WHAPI_BULK_CONCURRENCY threads and are
+    paced by the channel rate limit, so a lead matched to dozens of users
+    takes about as long as its slowest send rather than the sum of them.
+    
+    Args:
+        messages (list): (to_number, message) tuples
+        
+    Returns:
+        list: One dict per recipient, in input order, with 'to', 'ok'
+              (a 2xx reply that reports the message sent), 'status' (HTTP
+              status or None), 'response' (API response or error) and 'seconds'
+    """
+    if not messages:
+        return []
+    
+    executor, bucket = _bulk_sender()
+    futures = [executor.submit(_send_limited, bucket, to_number, message) for to_number, message in messages]
+    results = [future.result() for future in futures]
+    
+    failed = sum(1 for result in results if not result['ok'])
+    logging.info(f"Bulk send: {len(results) - failed} of {len(results)} messages sent")
+    return results
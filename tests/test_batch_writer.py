@@ -0,0 +1,65 @@
+from utils.batch_writer import BatchWriter
+
+class FlakyStore:
+    """flush callback that fails a set number of times, handing the batch back"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.written = []
+        self.writer = None
+
+    def flush(self, batch):
+        if self.failures:
+            self.failures -= 1
+            self.writer.requeue(batch)
+            raise RuntimeError("database unavailable")
+        self.written.extend(batch)
+
+def make_writer(failures, **kwargs):
+    store = FlakyStore(failures)
+    store.writer = BatchWriter('test', store.flush, max_batch=10, flush_interval=0.01, **kwargs)
+    return store, store.writer
+
+def test_failed_batch_is_retried_until_written():
+    store, writer = make_writer(2)
+    for i in range(3):
+        writer.add(i)
+
+    assert not writer._write(writer._next_batch())
+    assert not writer._write(writer._next_batch())
+    assert writer._write(writer._next_batch())
+
+    assert store.written == [0, 1, 2]
+    assert writer.stats()['queued'] == 0
+    assert writer.added == 3
+    assert writer.requeued == 6
+    assert writer.failed == 6
+    assert writer.written == 3
+
+def test_backoff_doubles_per_failure_and_is_capped():
+    _, writer = make_writer(10, backoff_base=1.0, backoff_max=5.0)
+    writer.add('x')
+    assert writer.retry_delay() == 0.0
+
+    delays = []
+    for _ in range(5):
+        writer._write(writer._next_batch())
+        delays.append(writer.retry_delay())
+    assert delays == [1.0, 2.0, 4.0, 5.0, 5.0]
+
+def test_success_resets_backoff():
+    _, writer = make_writer(2)
+    writer.add('x')
+    writer._write(writer._next_batch())
+    writer._write(writer._next_batch())
+    assert writer.retry_delay() == 2.0
+
+    writer._write(writer._next_batch())
+    assert writer.retry_delay() == 0.0
+    assert writer.stats()['consecutive_failures'] == 0
+
+def test_requeue_drops_what_does_not_fit():
+    _, writer = make_writer(0, max_queue=2)
+    assert writer.requeue(['a', 'b', 'c']) == 2
+    assert writer.dropped == 1
+    assert writer.added == 0
@@ -0,0 +1,79 @@
+import pytest
+
+from services import geo_matcher
+from services.geo_matcher import haversine_miles, scan_locations
+
+def labels(result):
+    locations, ambiguous = result
+    return sorted(label for label, _, _ in locations), sorted(ambiguous)
+
+@pytest.fixture
+def districts(tmp_path, monkeypatch):
+    """Add a few postcode district centroids, as GEO_PLACES_FILE would"""
+    places = tmp_path / 'districts.csv'
+    places.write_text(
+        "kind,name,lat,lon\n"
+        "district,LS1,53.797,-1.547\n"
+        "district,IV2,57.470,-4.190\n"
+        "district,EX39,51.017,-4.206\n"
+    )
+    monkeypatch.setattr(geo_matcher, 'GEO_PLACES_FILE', str(places))
+    geo_matcher.load_places.cache_clear()
+    yield
+    geo_matcher.load_places.cache_clear()
+
+def test_district_postcode_is_trusted(districts):
+    assert labels(scan_locations("Car needs moving from LS1 4AP")) == (['LS1 4AP'], [])
+
+def test_outward_code_as_whole_text_is_trusted():
+    assert labels(scan_locations("LS1")) == (['LS1'], [])
+
+def test_outward_code_after_context_word_is_trusted(districts):
+    assert labels(scan_locations("Pickup in LS1 please")) == (['LS1'], [])
+
+def test_bare_outward_code_without_context_is_ambiguous():
+    assert labels(scan_locations("LS1 job going now")) == ([], ['LS1'])
+
+@pytest.mark.parametrize('text, code', [
+    ("Recovery needed near BD51 SMR", 'BD51'),  # half of a number plate
+    ("in S3 with a flat battery", 'S3'),         # model code
+    ("Broken down at M6 junction 10", 'M6'),     # motorway
+])
+def test_lookalike_outward_codes_are_ambiguous(text, code):
+    assert labels(scan_locations(text)) == ([], [code])
+
+def test_not_strict_trusts_ambiguous_codes():
+    assert labels(scan_locations("LS1 job going now", strict=False)) == (['LS1'], [])
+
+def test_area_only_postcode_is_ambiguous():
+    assert labels(scan_locations("Car needs moving from LS1 4AP")) == ([], ['LS1 4AP'])
+    assert labels(scan_locations("Tow from IV2 3AB to Inverness")) == (['inverness'], ['IV2 3AB'])
+    assert labels(scan_locations("Anyone in PA34?")) == ([], ['PA34'])
+
+def test_area_only_postcode_is_trusted_in_user_settings():
+    assert labels(scan_locations("EX39 1AA", strict=False)) == (['EX39 1AA'], [])
+
+def test_postcode_far_from_its_area_centroid(districts, monkeypatch):
+    # Bideford is ~40 miles from the EX (Exeter) area centroid
+    _, postcodes = geo_matcher.load_places()
+    (_, lat, lon), = scan_locations("Van to collect from EX39 1AA")[0]
+    assert (lat, lon) == (51.017, -4.206)
+    assert haversine_miles(lat, lon, *postcodes['EX']) > 30
+
+    monkeypatch.setattr(geo_matcher, 'GEO_PLACES_FILE', None)
+    geo_matcher.load_places.cache_clear()
+    assert labels(scan_locations("Van to collect from EX39 1AA")) == ([], ['EX39 1AA'])
+
+def test_common_word_place_needs_capital():
+    assert labels(scan_locations("stop reading this")) == ([], ['reading'])
+    assert labels(scan_locations("Job in Reading")) == (['reading'], [])
+
+@pytest.mark.parametrize('text, expected', [
+    ("Pick up from London Road, Leicester", ['leicester']),
+    ("Car parked on Manchester Street", []),
+    ("Outside 12 Manchester St. today", []),
+    ("From Stoke on Trent Road to Leeds", ['leeds']),
+    ("Leeds to Manchester, road closed", ['leeds', 'manchester']),
+])
+def test_street_named_after_a_place_is_not_the_place(text, expected):
+    assert labels(scan_locations(text))[0] == expected
@@ -0,0 +1,63 @@
+import pytest
+
+from services import lead_pipeline
+from services.geo_matcher import GeoIndex
+from services.lead_pipeline import JobLead, LeadPipeline
+
+class RecordingLog:
+    def __init__(self):
+        self.records = []
+
+    def record(self, outcome, **fields):
+        self.records.append(dict(fields, outcome=outcome))
+
+class WithinBudget:
+    def budget_mode(self):
+        return None
+
+EXTRACTED = {'pickup': 'Leeds', 'dropoff': 'York', 'postcodes': ['LS1 4AP'], 'vehicle_type': 'van'}
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    pipeline = LeadPipeline(user_manager=None)
+    pipeline.ingest_log = RecordingLog()
+    monkeypatch.setattr(pipeline, '_subscribers', lambda: ([], GeoIndex([])))
+    monkeypatch.setattr(lead_pipeline, 'get_usage_tracker', lambda: WithinBudget())
+    monkeypatch.setattr(lead_pipeline, 'LLM_MATCH_MODE', 'extract')
+    return pipeline
+
+def test_match_records_gazetteer_hits_and_extraction(pipeline, monkeypatch):
+    calls = []
+
+    def extract(content, group_id=None, usage=None):
+        calls.append(content)
+        usage.update(tokens=120, cost_usd=0.00042)
+        return EXTRACTED
+
+    monkeypatch.setattr(lead_pipeline, 'extract_job_locations', extract)
+    lead = JobLead('m1', 'g1', 'sender', "Non runner from Leeds, plate BD51 SMR, going to LS1 4AP")
+
+    assert list(pipeline._match(lead)) == []
+    assert len(calls) == 1
+
+    record, = pipeline.ingest_log.records
+    assert record['outcome'] == 'no_match'
+    detail = record['detail']
+    assert [label for label, _, _ in detail['gazetteer']['locations']] == ['leeds']
+    assert sorted(detail['gazetteer']['ambiguous']) == ['BD51', 'LS1 4AP']
+    assert detail['extracted'] == EXTRACTED
+    assert sorted({label for label, _, _ in detail['locations']}) == ['LS1 4AP', 'leeds', 'york']
+    assert detail['llm_tokens'] == 120
+    assert detail['attempt'] == 1
+
+def test_near_duplicate_records_gazetteer_hits(pipeline, monkeypatch):
+    monkeypatch.setattr(lead_pipeline, 'is_duplicate_message', lambda content: False)
+    text = ("Recovery needed from Leeds to York today, Ford Transit non runner, "
+            "keys with owner, paying cash on collection")
+    assert list(pipeline._dedup(JobLead('m1', 'g1', 'a', text))) != []
+    assert list(pipeline._dedup(JobLead('m2', 'g2', 'b', "URGENT " + text))) == []
+
+    record, = pipeline.ingest_log.records
+    assert record['outcome'] == 'near_duplicate'
+    assert record['detail']['original_message_id'] == 'm1'
+    assert sorted(label for label, _, _ in record['detail']['gazetteer']['locations']) == ['leeds', 'york']
@@ -0,0 +1,26 @@
+import pytest
+from flask import Flask
+
+from routes import metrics_routes
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.register_blueprint(metrics_routes.metrics_bp)
+    return app.test_client()
+
+def test_metrics_closed_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(metrics_routes, 'METRICS_TOKEN', None)
+    assert client.get('/metrics').status_code == 401
+
+def test_metrics_need_the_configured_token(client, monkeypatch):
+    monkeypatch.setattr(metrics_routes, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+def test_metrics_open_to_admin_session(client, monkeypatch):
+    monkeypatch.setattr(metrics_routes, 'METRICS_TOKEN', None)
+    with client.session_transaction() as session:
+        session['admin_user'] = 'admin'
+    assert client.get('/metrics').status_code == 200
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from services.geo_matcher import location_key, scan_locations
+from utils.near_duplicate import NearDuplicateIndex, hamming_distance, normalize_tokens, simhash
+
+LEAD = "Recovery needed from Leeds LS1 4AP to Manchester M1 2AB, Ford Transit non runner, paying cash"
+
+def test_bands_cover_every_bit_once():
+    index = NearDuplicateIndex(max_distance=3)
+    fingerprint = random.Random(1).getrandbits(64)
+    rebuilt = 0
+    for start, value in zip(index._band_bits, index._band_values(fingerprint)):
+        rebuilt |= value << start
+    assert rebuilt == fingerprint
+
+def test_fingerprints_within_max_distance_share_a_band():
+    index = NearDuplicateIndex(max_distance=3)
+    rng = random.Random(2)
+    for _ in range(500):
+        fingerprint = rng.getrandbits(64)
+        flipped = fingerprint
+        for bit in rng.sample(range(64), 3):
+            flipped ^= 1 << bit
+        shared = [a == b for a, b in zip(index._band_values(fingerprint), index._band_values(flipped))]
+        assert any(shared)
+
+def test_repost_with_small_edits_is_a_near_duplicate():
+    index = NearDuplicateIndex(max_distance=3, window_seconds=900)
+    assert index.check(LEAD, value='first', now=0) == (False, None)
+    repost = "URGENT!! " + LEAD + " call 07700 900123 🚗"
+    assert hamming_distance(simhash(normalize_tokens(LEAD)), simhash(normalize_tokens(repost))) <= 3
+    assert index.check(repost, now=10) == (True, 'first')
+
+def test_different_lead_is_not_a_near_duplicate():
+    index = NearDuplicateIndex(max_distance=3, window_seconds=900)
+    index.check(LEAD, now=0)
+    other = "Van stuck in Bristol BS1 5TR needs a tow to Cardiff CF10 1EP, Mercedes Sprinter flat tyre"
+    assert index.check(other, now=10) == (False, None)
+
+def test_entries_expire_after_the_window():
+    index = NearDuplicateIndex(max_distance=3, window_seconds=60)
+    index.check(LEAD, value='first', now=0)
+    assert index.check(LEAD, now=61) == (False, None)
+    assert index.stats()['expirations'] == 1
+
+def test_short_text_is_skipped():
+    index = NearDuplicateIndex(max_distance=3, min_tokens=6)
+    assert index.check("tow needed", now=0) == (False, None)
+    assert index.check("tow needed", now=1) == (False, None)
+    assert index.stats()['skipped_short'] == 2
+
+# Long enough that changing only the pickup town and postcode moves the SimHash by a few bits
+TEMPLATE = (
+    "Recovery job: Ford Transit Custom 2019 non runner needs collecting from {pickup} and taking "
+    "to our yard in Birmingham B6 7EU today. Vehicle is parked on a gravel driveway, keys are with "
+    "the owner, front wheels turn freely, handbrake released, steering unlocked, needs a winch to "
+    "load. Customer is home all day so any time after ten is fine. Paying cash on delivery at a good "
+    "rate for the right driver with a spec lift or beavertail. Insurance details and photos needed "
+    "before collection, message for the full address and price, first come first served, thanks"
+)
+
+def lead_key(text):
+    return location_key(*scan_locations(text))
+
+@pytest.mark.parametrize('first, second', [
+    ("Cardiff CF10 1EP", "Bristol BS1 5TR"),
+    ("Cardiff CF10 1EP", "Norwich NR1 3QU"),
+    ("Bristol BS1 5TR", "Norwich NR1 3QU"),
+])
+def test_same_template_for_another_place_is_not_a_near_duplicate(first, second):
+    first_text, second_text = TEMPLATE.format(pickup=first), TEMPLATE.format(pickup=second)
+    # SimHash alone would call these the same job
+    distance = hamming_distance(simhash(normalize_tokens(first_text)), simhash(normalize_tokens(second_text)))
+    assert distance <= 3
+
+    index = NearDuplicateIndex(max_distance=3, window_seconds=900)
+    assert index.check(first_text, value='first', key=lead_key(first_text), now=0) == (False, None)
+    assert index.check(second_text, key=lead_key(second_text), now=10) == (False, None)
+    assert index.stats()['key_mismatches'] == 1
+
+def test_same_template_for_the_same_place_is_a_near_duplicate():
+    text = TEMPLATE.format(pickup="Cardiff CF10 1EP")
+    repost = "URGENT " + TEMPLATE.format(pickup="Cardiff CF101EP") + " 07700 900123"
+    index = NearDuplicateIndex(max_distance=3, window_seconds=900)
+    index.check(text, value='first', key=lead_key(text), now=0)
+    assert index.check(repost, key=lead_key(repost), now=10) == (True, 'first')
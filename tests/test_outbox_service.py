@@ -0,0 +1,53 @@
+from services import whatsapp_service
+from services.outbox_service import OutboxDrainer
+
+class FakeOutbox:
+    """One outbox row that becomes due again as soon as it is marked failed"""
+
+    def __init__(self):
+        self.due = [(7, '447700900123', 'Job in Leeds', 1)]
+        self.sent = []
+        self.failures = []
+
+    def claim_batch(self, limit):
+        batch, self.due = self.due[:limit], self.due[limit:]
+        return batch
+
+    def extend_lease(self, ids):
+        return len(ids)
+
+    def mark_sent(self, ids):
+        self.sent.extend(ids)
+
+    def get_counts(self):
+        return {'due': len(self.due)}
+
+    def mark_failed(self, failures):
+        self.failures.extend(failures)
+        self.due.extend((outbox_id, '447700900123', 'Job in Leeds', 2) for outbox_id, _, _ in failures)
+
+def test_non_2xx_reply_without_error_key_is_retried(monkeypatch):
+    replies = [(502, {}), (200, {'sent': True, 'message': {'id': 'abc'}})]
+    monkeypatch.setattr(whatsapp_service, '_whapi_call', lambda endpoint, params: replies.pop(0))
+    manager = FakeOutbox()
+    drainer = OutboxDrainer(manager)
+
+    assert drainer.drain_once() == 1
+    assert manager.sent == []
+    (outbox_id, delay, error), = manager.failures
+    assert outbox_id == 7
+    assert delay > 0
+    assert error.startswith('HTTP 502')
+
+    assert drainer.drain_once() == 1
+    assert manager.sent == [7]
+    assert drainer.stats()['sent'] == 1
+
+def test_sent_ok_requires_a_2xx_status():
+    assert whatsapp_service._sent_ok(200, {'sent': True})
+    assert whatsapp_service._sent_ok(201, {})
+    assert not whatsapp_service._sent_ok(500, {})
+    assert not whatsapp_service._sent_ok(429, {'sent': True})
+    assert not whatsapp_service._sent_ok(None, {'error': 'timeout'})
+    assert not whatsapp_service._sent_ok(200, {'error': 'bad number'})
+    assert not whatsapp_service._sent_ok(200, {'sent': False})
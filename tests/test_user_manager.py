@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+
+from managers.user_cache import UserCache
+from managers.user_manager_postgres import UserManager
+from models.user import User
+
+COLUMNS = ('user_id', 'name', 'email', 'number', 'location', 'range_miles', 'stripe_customer_id', 'active')
+
+class FakeCursor:
+    description = [(name,) for name in COLUMNS]
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.db.queries.append(query)
+
+    def fetchone(self):
+        return self.db.row
+
+class FakeDatabase:
+    def __init__(self, row):
+        self.row = row
+        self.queries = []
+
+    @contextmanager
+    def get_connection(self):
+        db = self
+
+        class Connection:
+            def cursor(self):
+                return FakeCursor(db)
+
+        yield Connection()
+
+def make_manager(row):
+    manager = UserManager.__new__(UserManager)
+    manager.db_config = FakeDatabase(row)
+    manager.cache = UserCache(ttl=30)
+    manager._column_indexes = {}
+    manager.has_email = True
+    manager.has_password_hash = False
+    return manager
+
+def test_stripe_lookup_can_bypass_a_stale_cache():
+    # Another worker deactivated the user; this worker still caches them as active
+    manager = make_manager(('u1', 'Ann', 'ann@example.com', '447700900123', 'Leeds', 25, 'cus_1', False))
+    manager.cache.put(User('Ann', 'ann@example.com', '447700900123', 'Leeds', 25,
+                           stripe_customer_id='cus_1', user_id='u1', active=True))
+
+    assert manager.get_user_by_stripe_customer_id('cus_1').active is True
+    assert manager.db_config.queries == []
+
+    assert manager.get_user_by_stripe_customer_id('cus_1', use_cache=False).active is False
+    assert len(manager.db_config.queries) == 1
+    # The fresh row replaces the stale one for later cached reads
+    assert manager.get_user_by_stripe_customer_id('cus_1').active is False
@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from managers.user_manager_postgres import UserManager
+from models.user import User
+
+@pytest.fixture
+def manager():
+    # The cursor helpers need no database, so skip __init__'s table check
+    return UserManager.__new__(UserManager)
+
+def test_cursor_round_trips_keyset_position(manager):
+    user = User('Ann', None, '447700900123', 'Leeds', 25, user_id='a1b2',
+                created_at=datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc))
+    token = manager._encode_cursor(user)
+    assert manager._decode_cursor(token) == ('2026-03-01T12:30:15.123456+00:00', 'a1b2')
+
+def test_cursor_is_url_safe(manager):
+    user = User('Ann', None, '447700900123', 'Leeds', 25, user_id='?/+>' * 8)
+    token = manager._encode_cursor(user)
+    assert set(token) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=')
+
+@pytest.mark.parametrize('token', ['not base64!', 'bm90IGpzb24=', 'WzFd', 'MTIz', 'é'])
+def test_invalid_cursor_raises_value_error(manager, token):
+    with pytest.raises(ValueError):
+        manager._decode_cursor(token)
@@ -2,6 +2,7 @@
 from utils.message_utils import (
     cleanup_old_messages, 
     is_duplicate_message, 
+    start_message_cache_cleanup,
     extract_message_content, 
     ALLOWED_GROUP_IDS,
     RECENT_MESSAGES,
@@ -11,6 +12,7 @@ from utils.message_utils import (
 __all__ = [
     'cleanup_old_messages',
     'is_duplicate_message',
+    'start_message_cache_cleanup',
     'extract_message_content',
     'ALLOWED_GROUP_IDS',
     'RECENT_MESSAGES',
@@ -0,0 +1,123 @@
+import time
+import queue
+import logging
+import threading
+
+class BatchWriter:
+    """
+    Buffers items and hands them to `flush` in batches on a background thread
+
+    add() never blocks: when the buffer is full the item is dropped and
+    counted, so a slow database can never back up the request path. A
+    batch is flushed once it reaches max_batch items or flush_interval
+    seconds after its first item, whichever comes first. A failed flush
+    is logged and its items are dropped, unless `flush` hands them back
+    with requeue() before raising. Either way the writer then waits
+    (backoff_base doubling per consecutive failure, capped at
+    backoff_max seconds) before the next batch, so an unavailable
+    database is not retried in a tight loop.
+    """
+
+    def __init__(self, name, flush, max_batch=500, flush_interval=1.0, max_queue=10000,
+                 backoff_base=1.0, backoff_max=60.0):
+        self.name = name
+        self.flush = flush
+        self.max_batch = max(int(max_batch), 1)
+        self.flush_interval = flush_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._failures = 0
+
+        self.added = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.requeued = 0
+        self.batches = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"batch-writer-{self.name}", daemon=True)
+        self._thread.start()
+
+    def add(self, item):
+        """Queue an item; returns False if it was dropped"""
+        try:
+            self._queue.put_nowait(item)
+            self.added += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def requeue(self, items):
+        """
+        Put items from a failed flush back for a later batch
+
+        Returns:
+            int: How many fitted; the rest are dropped and counted
+        """
+        requeued = 0
+        for item in items:
+            try:
+                self._queue.put_nowait(item)
+                requeued += 1
+            except queue.Full:
+                self.dropped += 1
+        self.requeued += requeued
+        return requeued
+
+    def retry_delay(self):
+        """Seconds to wait after the current run of consecutive failures"""
+        if not self._failures:
+            return 0.0
+        return min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """Flush one batch, updating the counters and failure streak"""
+        try:
+            self.flush(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            self._failures += 1
+            logging.error(
+                f"Batch writer '{self.name}' failed to write {len(batch)} items "
+                f"({self._failures} in a row), backing off {self.retry_delay():.1f}s: {e}"
+            )
+            return False
+
+        self.written += len(batch)
+        self.batches += 1
+        self._failures = 0
+        return True
+
+    def _run(self):
+        while True:
+            if not self._write(self._next_batch()):
+                time.sleep(self.retry_delay())
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'added': self.added,
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'requeued': self.requeued,
+            'consecutive_failures': self._failures
+        }
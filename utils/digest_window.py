@@ -0,0 +1,104 @@
+import time
+import hashlib
+import threading
+from collections import deque
+
+# Bytes kept per message; 128 bits makes accidental collisions negligible
+DIGEST_SIZE = 16
+
+def message_digest(content):
+    """Fixed-size blake2b digest of a message"""
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+
+class DigestWindow:
+    """
+    Bounded "seen in the last N seconds" set of message digests
+
+    Entries are 16-byte digests rather than the message text, kept in a
+    dict for lookups plus a deque in insertion order. Since every entry
+    lives for the same window, the oldest entry is always at the front:
+    expiry pops from the front until it reaches a live one, so each call
+    does work proportional only to what actually expired. A hard cap
+    evicts the oldest entries first.
+    """
+
+    def __init__(self, window_seconds, max_entries):
+        self.window_seconds = window_seconds
+        self.max_entries = max(int(max_entries), 1)
+        self._entries = {}  # digest -> first seen (time.time())
+        self._order = deque()  # (first seen, digest), oldest first
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def _expire_locked(self, now):
+        cutoff = now - self.window_seconds
+        order = self._order
+        expired = 0
+        while order and order[0][0] < cutoff:
+            del self._entries[order.popleft()[1]]
+            expired += 1
+        self.expirations += expired
+        return expired
+
+    def seen(self, content, now=None):
+        """
+        Check for a message and record it if new
+
+        Args:
+            content (str): Message content
+            now (float): Current time, defaults to time.time()
+
+        Returns:
+            bool: True if the same content was recorded within the window
+        """
+        digest = message_digest(content)
+        now = time.time() if now is None else now
+
+        with self._lock:
+            self._expire_locked(now)
+            if digest in self._entries:
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            self._entries[digest] = now
+            self._order.append((now, digest))
+            if len(self._order) > self.max_entries:
+                del self._entries[self._order.popleft()[1]]
+                self.evictions += 1
+            return False
+
+    def expire(self, now=None):
+        """Drop expired entries; returns how many were removed"""
+        with self._lock:
+            return self._expire_locked(time.time() if now is None else now)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._order.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, content):
+        now = time.time()
+        with self._lock:
+            seen_at = self._entries.get(message_digest(content))
+            return seen_at is not None and seen_at >= now - self.window_seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'window_seconds': self.window_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'evictions': self.evictions
+            }
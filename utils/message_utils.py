@@ -1,11 +1,21 @@
+import os
 import time
+import hashlib
 import logging
+import threading
+from utils.digest_window import DigestWindow
+from utils.metrics import DEDUP_CHECK_SECONDS, DEDUP_CHECKS, timed
 
-# Dictionary to store recently processed message contents with timestamps
-# This is used to prevent duplicate processing of the same message
-RECENT_MESSAGES = {}
 # Time window in seconds (2 minutes) for message deduplication
 MESSAGE_DEDUPLICATION_WINDOW = 120
+# Hard cap on message digests remembered per worker
+MESSAGE_DEDUPLICATION_MAX_ENTRIES = int(os.getenv('MESSAGE_DEDUPLICATION_MAX_ENTRIES', 20000))
+
+# Digests of recently processed messages, used to prevent duplicate processing
+# This is a per-worker front cache; message_cache in Postgres is shared by all workers
+RECENT_MESSAGES = DigestWindow(MESSAGE_DEDUPLICATION_WINDOW, MESSAGE_DEDUPLICATION_MAX_ENTRIES)
+# Seconds between purges of expired message_cache rows / local entries
+MESSAGE_CACHE_CLEANUP_INTERVAL = float(os.getenv('MESSAGE_CACHE_CLEANUP_INTERVAL', 600))
 
 # Define the list of allowed WhatsApp group IDs
 # These are the groups from which the application will process messages
@@ -31,39 +41,84 @@ def cleanup_old_messages():
     Remove expired messages from the deduplication cache
     Messages older than MESSAGE_DEDUPLICATION_WINDOW seconds are removed
     """
-    current_time = time.time()
-    # Find keys (message contents) that have expired
-    expired_keys = [key for key, timestamp in RECENT_MESSAGES.items() 
-                   if current_time - timestamp > MESSAGE_DEDUPLICATION_WINDOW]
-    
-    # Delete expired keys from dictionary
-    for key in expired_keys:
-        del RECENT_MESSAGES[key]
-    
-    if expired_keys:
-        logging.info(f"Cleaned up {len(expired_keys)} expired messages")
+    expired = RECENT_MESSAGES.expire()
+    if expired:
+        logging.info(f"Cleaned up {expired} expired messages")
+
+def message_hash(message_content):
+    """Content hash used as the message_cache key for deduplication"""
+    return hashlib.sha256(f"dedup:{message_content}".encode('utf-8')).hexdigest()
 
+_message_cache = None
+
+def _get_message_cache():
+    global _message_cache
+    if _message_cache is None:
+        from managers.message_cache_manager import MessageCacheManager
+        _message_cache = MessageCacheManager()
+    return _message_cache
+
+@timed(DEDUP_CHECK_SECONDS)
 def is_duplicate_message(message_content):
     """
     Check if a message has been processed recently to avoid duplicates
     
+    Repeats within this worker are answered from RECENT_MESSAGES; anything
+    else is claimed atomically in message_cache, so the same lead reaching
+    several workers or instances is only processed once. If the database
+    is unreachable, only the local cache is used.
+    
     Args:
         message_content (str): Content of the message to check
         
     Returns:
         bool: True if message is a duplicate, False otherwise
     """
-    current_time = time.time()
+    # Seen in this worker within the window: a duplicate. Otherwise it is now
+    # remembered locally, so repeats in this worker skip the database
+    if RECENT_MESSAGES.seen(message_content):
+        DEDUP_CHECKS.labels(result='local_duplicate').inc()
+        return True
     
-    # Check if this message content exists in our recent messages
-    if message_content in RECENT_MESSAGES:
-        # If it exists and is within our time window, it's a duplicate
-        if current_time - RECENT_MESSAGES[message_content] <= MESSAGE_DEDUPLICATION_WINDOW:
-            return True
+    try:
+        duplicate = not _get_message_cache().claim(message_hash(message_content), MESSAGE_DEDUPLICATION_WINDOW)
+    except Exception as e:
+        logging.error(f"Shared dedup check failed, using local cache only: {e}")
+        DEDUP_CHECKS.labels(result='shared_unavailable').inc()
+        return False
+    
+    DEDUP_CHECKS.labels(result='shared_duplicate' if duplicate else 'new').inc()
+    return duplicate
+
+_cleanup_thread = None
+_cleanup_pid = None
+_cleanup_lock = threading.Lock()
+
+def _cleanup_loop():
+    while True:
+        time.sleep(MESSAGE_CACHE_CLEANUP_INTERVAL)
+        try:
+            cleanup_old_messages()
+            _get_message_cache().cleanup()
+        except Exception as e:
+            logging.error(f"Message cache cleanup failed: {e}")
+
+def start_message_cache_cleanup():
+    """
+    Start this worker's periodic cleanup thread (once per process)
+    
+    Every MESSAGE_CACHE_CLEANUP_INTERVAL seconds it prunes the local cache
+    and runs the cleanup_old_messages() SQL function; an advisory lock
+    keeps workers from purging at the same time.
+    """
+    global _cleanup_thread, _cleanup_pid
     
-    # If not a duplicate, add/update the message in our cache
-    RECENT_MESSAGES[message_content] = current_time
-    return False
+    pid = os.getpid()
+    with _cleanup_lock:
+        if _cleanup_thread is None or _cleanup_pid != pid:
+            _cleanup_thread = threading.Thread(target=_cleanup_loop, name='message-cache-cleanup', daemon=True)
+            _cleanup_thread.start()
+            _cleanup_pid = pid
 
 def extract_message_content(message):
     """
@@ -0,0 +1,141 @@
+import os
+import time
+import logging
+from functools import wraps
+
+# Directory shared by all gunicorn workers for multiprocess metrics (set by gunicorn_config.py);
+# without it each process only reports its own metrics
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+# Handle prometheus_client import gracefully
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+    )
+    from prometheus_client import multiprocess
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+    logging.warning("prometheus_client not available. Metrics will not be collected.")
+
+# Latency buckets (seconds): Postgres and local work, then outbound HTTP calls
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+HTTP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+class _NoopMetric:
+    """Stands in for every metric when prometheus_client is missing"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    metric_class = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}[kind]
+    return metric_class(name, documentation, labelnames, **kwargs)
+
+# Webhook
+WEBHOOK_REQUEST_SECONDS = _metric(
+    'histogram', 'webhook_request_seconds', 'Time to accept a Whapi message webhook', ['status'],
+    buckets=FAST_BUCKETS
+)
+WEBHOOK_MESSAGES = _metric('counter', 'webhook_messages_total', 'Messages received on the Whapi webhook')
+
+# Deduplication
+DEDUP_CHECK_SECONDS = _metric(
+    'histogram', 'dedup_check_seconds', 'Time to check a message against the dedup caches', buckets=FAST_BUCKETS
+)
+DEDUP_CHECKS = _metric('counter', 'dedup_checks_total', 'Dedup checks by result', ['result'])
+
+# OpenAI
+OPENAI_REQUEST_SECONDS = _metric(
+    'histogram', 'openai_request_seconds', 'Time per OpenAI-backed call, cache hits included', ['operation'],
+    buckets=HTTP_BUCKETS
+)
+OPENAI_RESULTS = _metric('counter', 'openai_results_total', 'OpenAI-backed calls by result', ['operation', 'result'])
+
+# Whapi
+WHAPI_SEND_SECONDS = _metric(
+    'histogram', 'whapi_send_seconds', 'Time to send one WhatsApp message, retries included', buckets=HTTP_BUCKETS
+)
+WHAPI_SENDS = _metric('counter', 'whapi_sends_total', 'WhatsApp sends by result', ['result'])
+
+# Postgres
+DB_QUERY_SECONDS = _metric(
+    'histogram', 'db_query_seconds', 'Time per UserManager query, cache hits included', ['query'],
+    buckets=FAST_BUCKETS
+)
+DB_QUERY_ERRORS = _metric('counter', 'db_query_errors_total', 'UserManager queries that raised', ['query'])
+DB_POOL_WAIT_SECONDS = _metric(
+    'histogram', 'db_pool_wait_seconds', 'Time spent waiting for a pooled connection', buckets=FAST_BUCKETS
+)
+DB_POOL_CHECKOUT_FAILURES = _metric(
+    'counter', 'db_pool_checkout_failures_total', 'Connection checkouts that timed out or failed to connect'
+)
+DB_POOL_CONNECTIONS = _metric(
+    'gauge', 'db_pool_connections', 'Pooled connections by state, summed over live workers', ['state'],
+    multiprocess_mode='livesum'
+)
+
+def timed(histogram, errors=None, **labels):
+    """
+    Decorator recording a function's duration in `histogram`
+
+    Args:
+        histogram: Histogram to observe (with `labels` applied, if any)
+        errors: Counter incremented (with the same labels) when the function raises
+    """
+    observed = histogram.labels(**labels) if labels else histogram
+    failed = errors.labels(**labels) if errors is not None and labels else errors
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if failed is not None:
+                    failed.inc()
+                raise
+            finally:
+                observed.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def render_metrics():
+    """
+    Prometheus text exposition of every metric
+
+    With PROMETHEUS_MULTIPROC_DIR set, the files written by all workers
+    (live and dead) are aggregated, so any worker can answer a scrape.
+
+    Returns:
+        tuple: (body bytes, content type), or (None, content type) if
+        prometheus_client is not installed
+    """
+    if not PROMETHEUS_AVAILABLE:
+        return None, CONTENT_TYPE_LATEST
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid):
+    """Drop a dead worker's live gauges (called from gunicorn's child_exit)"""
+    if PROMETHEUS_AVAILABLE and PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import deque
+
+# Seconds a lead is remembered for near-duplicate checks
+NEAR_DUPLICATE_WINDOW = float(os.getenv('NEAR_DUPLICATE_WINDOW', 900))
+# Maximum differing SimHash bits (of 64) for two leads to count as the same job;
+# 0 disables near-duplicate detection
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', 3))
+# Leads with fewer tokens than this are too short to fingerprint reliably
+NEAR_DUPLICATE_MIN_TOKENS = int(os.getenv('NEAR_DUPLICATE_MIN_TOKENS', 6))
+# Hard cap on remembered leads per worker
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv('NEAR_DUPLICATE_MAX_ENTRIES', 20000))
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 2
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Phone numbers and other long digit runs that get appended to reposts
+LONG_NUMBER_RE = re.compile(r"\+?\d[\d\s-]{8,}\d")
+# Words reposts add that say nothing about the job itself
+NOISE_WORDS = frozenset({
+    'urgent', 'asap', 'now', 'please', 'pls', 'plz', 'job', 'jobs', 'available',
+    'repost', 'reposted', 'still', 'call', 'text', 'whatsapp', 'dm', 'pm', 'me', 'on'
+})
+
+def normalize_tokens(text):
+    """Lowercased word tokens with emojis, punctuation, phone numbers and filler removed"""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    text = LONG_NUMBER_RE.sub(' ', text)
+    return [token for token in TOKEN_RE.findall(text) if token not in NOISE_WORDS]
+
+def _shingle_hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+# Maps the ASCII '0'/'1' of a formatted hash to byte values 0/1
+_BIT_BYTES = bytes.maketrans(b'01', b'\x00\x01')
+# Per-bit counts live in one byte each while summing, so sum at most 255 shingles at a time
+_MAX_BYTE_COUNT = 255
+
+def simhash(tokens):
+    """
+    64-bit SimHash over word shingles
+
+    Similar token sequences give fingerprints that differ in few bits, so
+    the Hamming distance between two fingerprints tracks how much of the
+    text changed. Bit votes are summed as one big integer per shingle
+    (a byte per bit) rather than 64 separate additions.
+    """
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = tokens
+    else:
+        shingles = [' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+    if not shingles:
+        return 0
+
+    counts = [0] * FINGERPRINT_BITS
+    for start in range(0, len(shingles), _MAX_BYTE_COUNT):
+        total = 0
+        for shingle in shingles[start:start + _MAX_BYTE_COUNT]:
+            bits = format(_shingle_hash(shingle), '064b').encode('ascii').translate(_BIT_BYTES)
+            total += int.from_bytes(bits, 'big')
+        for i, count in enumerate(total.to_bytes(FINGERPRINT_BITS, 'big')):
+            counts[i] += count
+
+    # A bit is set when more than half the shingles set it
+    half = len(shingles) / 2
+    return int(''.join('1' if count > half else '0' for count in counts), 2)
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+class NearDuplicateIndex:
+    """
+    "Have we seen a similar lead in the last N seconds?" over SimHash fingerprints
+
+    Fingerprints are split into max_distance + 1 bands. Two fingerprints
+    within max_distance bits must agree exactly on at least one band
+    (pigeonhole), so a lookup only compares against the few entries that
+    share a band value instead of every lead in the window. Expiry pops
+    from the front of an insertion-ordered deque, like DigestWindow.
+
+    SimHash barely notices a few changed words in a long lead, so the
+    same template reposted for a different town can land within
+    max_distance bits. Callers pass those details as an exact-match `key`
+    (e.g. the places a lead names); similar leads with different keys are
+    not near-duplicates.
+    """
+
+    def __init__(self, window_seconds=NEAR_DUPLICATE_WINDOW, max_distance=NEAR_DUPLICATE_MAX_DISTANCE,
+                 min_tokens=NEAR_DUPLICATE_MIN_TOKENS, max_entries=NEAR_DUPLICATE_MAX_ENTRIES):
+        self.window_seconds = window_seconds
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+        self.max_entries = max(int(max_entries), 1)
+
+        bands = max(max_distance, 0) + 1
+        self._band_bits = [FINGERPRINT_BITS * i // bands for i in range(bands + 1)]
+        self._bands = [{} for _ in range(bands)]  # band value -> set of entry ids
+        self._entries = {}  # entry id -> (fingerprint, key, value)
+        self._order = deque()  # (seen_at, entry id), oldest first
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.checks = 0
+        self.skipped_short = 0
+        self.near_duplicates = 0
+        self.key_mismatches = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_distance > 0 and self.window_seconds > 0
+
+    def _band_values(self, fingerprint):
+        bits = self._band_bits
+        return [(fingerprint >> bits[i]) & ((1 << (bits[i + 1] - bits[i])) - 1) for i in range(len(self._bands))]
+
+    def _remove_locked(self, entry_id):
+        fingerprint, _, _ = self._entries.pop(entry_id)
+        for band, value in zip(self._bands, self._band_values(fingerprint)):
+            bucket = band.get(value)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del band[value]
+
+    def _expire_locked(self, now):
+        cutoff = now - self.window_seconds
+        while self._order and self._order[0][0] < cutoff:
+            self._remove_locked(self._order.popleft()[1])
+            self.expirations += 1
+
+    def check(self, text, value=None, key=None, now=None):
+        """
+        Look for a similar lead in the window, remembering this one if there is none
+
+        Args:
+            text (str): Lead content
+            value: Stored with a new entry and handed back when a later lead matches it
+            key: Must equal the earlier lead's key as well as being similar (hashable)
+            now (float): Current time, defaults to time.time()
+
+        Returns:
+            tuple: (is_near_duplicate, value stored with the earlier lead or None)
+        """
+        if not self.enabled:
+            return False, None
+
+        tokens = normalize_tokens(text)
+        if len(tokens) < self.min_tokens:
+            with self._lock:
+                self.skipped_short += 1
+            return False, None
+
+        fingerprint = simhash(tokens)
+        band_values = self._band_values(fingerprint)
+        now = time.time() if now is None else now
+
+        with self._lock:
+            self.checks += 1
+            self._expire_locked(now)
+
+            candidates = set()
+            for band, band_value in zip(self._bands, band_values):
+                candidates.update(band.get(band_value, ()))
+            for entry_id in candidates:
+                other, other_key, other_value = self._entries[entry_id]
+                if hamming_distance(fingerprint, other) > self.max_distance:
+                    continue
+                if other_key != key:
+                    self.key_mismatches += 1
+                    continue
+                self.near_duplicates += 1
+                return True, other_value
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (fingerprint, key, value)
+            self._order.append((now, entry_id))
+            for band, band_value in zip(self._bands, band_values):
+                band.setdefault(band_value, set()).add(entry_id)
+
+            if len(self._order) > self.max_entries:
+                self._remove_locked(self._order.popleft()[1])
+                self.evictions += 1
+
+            return False, None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'window_seconds': self.window_seconds,
+                'max_distance': self.max_distance,
+                'checks': self.checks,
+                'skipped_short': self.skipped_short,
+                'near_duplicates': self.near_duplicates,
+                'key_mismatches': self.key_mismatches,
+                'expirations': self.expirations,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,100 @@
+import time
+import threading
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Tokens refill continuously at `rate` per second up to `capacity`.
+    acquire() blocks until enough tokens are available; consume() takes
+    tokens unconditionally and may drive the bucket into debt, which is
+    how callers settle up when the real cost turns out higher than the
+    estimate they acquired.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+
+    @classmethod
+    def per_minute(cls, amount):
+        """Bucket for a per-minute quota (RPM/TPM), allowing a minute's burst"""
+        return cls(rate=amount / 60.0, capacity=amount)
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1, timeout=None):
+        """
+        Wait for `amount` tokens and take them
+
+        Args:
+            amount (float): Tokens needed; capped at capacity so large requests can still run
+            timeout (float): Seconds to wait at most, None to wait indefinitely
+
+        Returns:
+            bool: True if the tokens were taken, False on timeout
+        """
+        if not self.enabled:
+            return True
+
+        amount = min(float(amount), self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        start = time.monotonic()
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    if waited:
+                        self.waits += 1
+                        self.wait_seconds_total += time.monotonic() - start
+                    return True
+                sleep_for = (amount - self._tokens) / self.rate
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                sleep_for = min(sleep_for, remaining)
+
+            waited = True
+            time.sleep(sleep_for)
+
+    def consume(self, amount):
+        """Take tokens without waiting (the balance may go negative)"""
+        if not self.enabled or amount <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def stats(self):
+        with self._lock:
+            self._refill()
+            return {
+                'rate_per_second': round(self.rate, 4),
+                'capacity': self.capacity,
+                'available': round(self._tokens, 2),
+                'waits': self.waits,
+                'wait_seconds_total': round(self.wait_seconds_total, 3)
+            }